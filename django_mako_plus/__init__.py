@@ -15,7 +15,7 @@ from .version import __version__
 
 # the router, middleware, and view function decorator
 from .middleware import RequestInitMiddleware
-from .router import view_function, app_resolver, dmp_path
+from .router import view_function, app_resolver, dmp_resolver, dmp_path
 
 
 # converter decorator
@@ -41,9 +41,10 @@ from .exceptions import ConverterException
 from .filters import django_syntax, jinja2_syntax, alternate_syntax
 from .templatetags.django_mako_plus import dmp_include
 
-# used internally in compiled templates for autoescaping
+# used internally in compiled templates for autoescaping and streaming
 # (needs to be exposed publicly so templates can see it)
 from .template import ExpressionPostProcessor
+from .template import flush_point
 
 # the http responses
 from .http import HttpResponseJavascriptRedirect
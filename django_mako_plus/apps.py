@@ -6,7 +6,10 @@ from django.template import engines
 from .defaults import DEFAULT_OPTIONS
 from .provider.runner import ProviderRun
 from .signals import dmp_signal_register_app
+from .util import log
 
+import gc
+import os, os.path
 import threading
 
 
@@ -38,6 +41,35 @@ class Config(AppConfig):
         ]
         self.template_imports.extend(self.options['DEFAULT_TEMPLATE_IMPORTS'])
 
+        # size the compiled template cache (shared by all loaders in this process)
+        from .template import TEMPLATE_CACHE
+        TEMPLATE_CACHE.configure(self.options['TEMPLATE_CACHE_SIZE'], self.options['TEMPLATE_CACHE_MAX_BYTES'])
+
+        # compiled templates can be kept in a content-addressed directory (shareable between nodes)
+        if self.options['COMPILED_TEMPLATES_DIR']:
+            if not os.path.isabs(self.options['COMPILED_TEMPLATES_DIR']):
+                raise ImproperlyConfigured('The COMPILED_TEMPLATES_DIR option must be an absolute path: {}'.format(self.options['COMPILED_TEMPLATES_DIR']))
+            from .template.store import CompiledTemplateStore
+            TEMPLATE_CACHE.store = CompiledTemplateStore(self.options['COMPILED_TEMPLATES_DIR'])
+
+        # render timings of templates, blocks, and defs
+        from .template import RENDER_TIMINGS
+        RENDER_TIMINGS.enabled = bool(self.options['RENDER_TIMING'])
+
+        # in production, compiled templates can be loaded from a single bundle file (read on first use)
+        if self.options['TEMPLATE_BUNDLE'] and not settings.DEBUG and os.path.exists(self.options['TEMPLATE_BUNDLE']):
+            from .template.bundle import TemplateBundle
+            TEMPLATE_CACHE.bundle = TemplateBundle(self.options['TEMPLATE_BUNDLE'])
+
+        # in DEBUG mode, a watcher thread can invalidate changed templates (instead of a stat on every lookup)
+        if settings.DEBUG and self.options['TEMPLATE_WATCHER'] and TEMPLATE_CACHE.watcher is None:
+            from .template.watcher import create_watcher
+            TEMPLATE_CACHE.watcher = create_watcher(TEMPLATE_CACHE, self.options['TEMPLATE_WATCHER'], self.options['TEMPLATE_WATCHER_INTERVAL'])
+
+        # remember the views that don't exist (requests for missing pages)
+        from .router.discover import MISSING_VIEW_FUNCTIONS
+        MISSING_VIEW_FUNCTIONS.configure(self.options['MISSING_VIEW_CACHE_SIZE'], self.options['MISSING_VIEW_CACHE_TIMEOUT'])
+
         # initialize the list of providers
         ProviderRun.initialize_providers()
 
@@ -45,6 +77,14 @@ class Config(AppConfig):
         from .converter.base import ParameterConverter
         ParameterConverter._sort_converters(app_ready=True)
 
+        # find the views now so the first requests skip discovery (before the templates freeze the gc)
+        if self.options['PRELOAD_ROUTES']:
+            self.preload_routes(self.get_project_apps())
+
+        # compile and load the templates now so preforked workers share them
+        if self.options['PRELOAD_TEMPLATES']:
+            self.preload_templates(self.get_project_apps())
+
 
     def register_app(self, app=None):
         '''
@@ -69,17 +109,89 @@ class Config(AppConfig):
             # first time for this app, so add to our dictionary
             self.registered_apps[app.name] = app
 
-            # set up the template, script, and style renderers
-            # these create and cache just by accessing them
-            self.engine.get_template_loader(app, 'templates', create=True)
-            self.engine.get_template_loader(app, 'scripts', create=True)
-            self.engine.get_template_loader(app, 'styles', create=True)
+            # the template, script, and style loaders are created when first used (see engine.get_template_loader),
+            # since most apps never render some of them
 
             # send the registration signal
             if self.options['SIGNALS']:
                 dmp_signal_register_app.send(sender=self, app_config=app)
 
 
+    def get_project_apps(self):
+        '''
+        Returns a list of the apps that DMP's urls.py registers: the apps within
+        the project directory plus the DEFAULT_APP.  Unlike get_registered_apps(),
+        this method works before urls.py has been loaded.
+        '''
+        project_apps = [ config for config in apps.get_app_configs() if os.path.samefile(os.path.dirname(config.path), settings.BASE_DIR) ]
+        try:
+            default_app = apps.get_app_config(self.options['DEFAULT_APP']) if self.options['DEFAULT_APP'] else None
+        except LookupError:
+            default_app = None  # the default app isn't an installed app, so skip it
+        if default_app is not None and default_app not in project_apps:
+            project_apps.append(default_app)
+        return project_apps
+
+
+    def preload_routes(self, app_configs=None):
+        '''
+        Finds the view functions, class-based views, and template views of the given
+        apps (all registered apps if None) and places them in the router's caches.
+        Views that can't be loaded are logged; they raise again when requested.
+
+        Normally, this is done in ready() by setting PRELOAD_ROUTES in settings.
+
+        Returns the list of routes (see router/index.py).
+        '''
+        from .router.index import build_route_index
+        if app_configs is None:
+            app_configs = self.get_registered_apps()
+        # template views need their apps registered, which urls.py hasn't done yet during ready()
+        for config in app_configs:
+            self.register_app(config)
+        routes, errors = build_route_index(app_configs)
+        for name, error in errors:
+            log.warning('view %s could not be preloaded: %s', name, error)
+        log.info('preloaded %s routes', len(routes))
+        return routes
+
+
+    def preload_templates(self, app_configs=None):
+        '''
+        Compiles and loads every template in the given apps (all registered apps
+        if None), then freezes the garbage collector.  When called in the master
+        process before a preforking server (gunicorn, uwsgi) forks its workers,
+        the workers share the compiled template modules copy-on-write rather than
+        each holding private copies.
+
+        Normally, this is done in ready() by setting PRELOAD_TEMPLATES in settings.
+        Call it directly (such as in wsgi.py) when you need more control over the apps.
+
+        Returns the number of templates loaded.
+        '''
+        from .template import find_template_files
+        if app_configs is None:
+            app_configs = self.get_registered_apps()
+        count = 0
+        for config in app_configs:
+            loader = self.engine.get_template_loader(config, 'templates', create=True)
+            for filepath in find_template_files(loader.template_dir):
+                template_name = os.path.relpath(filepath, loader.template_dir).replace(os.path.sep, '/')
+                try:
+                    loader.get_mako_template(template_name)
+                    count += 1
+                except Exception as e:
+                    # a bad template shouldn't keep the server from starting; it will raise again when rendered
+                    log.warning('template %s could not be preloaded: %s', filepath, e)
+        # move everything loaded so far to the permanent generation so gc doesn't touch
+        # (and copy) the pages in forked workers (Python 3.7+)
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        log.info('preloaded %s templates', count)
+        return count
+
+
     def get_registered_apps(self):
         '''Returns a sequence of apps that are registered with DMP'''
         return self.registered_apps.values()
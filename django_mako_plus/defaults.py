@@ -17,9 +17,78 @@ DEFAULT_OPTIONS = {
         'django_mako_plus.context_processors.settings',         # adds "settings" dictionary
     ],
 
+    # with LAZY_CONTEXT_PROCESSORS, the context processors that run on every render; the output of the others
+    # is kept on the request and reused by later renders in the same request (partials, includes, emails)
+    'FRESH_CONTEXT_PROCESSORS': [],
+
     # identifies where the Mako template cache will be stored, relative to each template directory
     'TEMPLATES_CACHE_DIR': '__dmpcache__',
 
+    # an absolute directory for compiled templates, named by a hash of their content and compile options
+    # (rather than by path and mtime in TEMPLATES_CACHE_DIR).  It can be shared between the nodes that run
+    # the same code.  None uses TEMPLATES_CACHE_DIR.
+    'COMPILED_TEMPLATES_DIR': None,
+
+    # an absolute path to a single-file bundle of compiled templates (built with `dmp_precompile --bundle`).
+    # When the file exists, templates are loaded from it before their compiled modules.  Not used in DEBUG mode.
+    'TEMPLATE_BUNDLE': None,
+
+    # whether to collapse indentation and remove comments from the html of templates when they compile:
+    # True, False, or a list of app names (a template can override with <%page minify="True|False"/>)
+    'MINIFY_HTML': False,
+
+    # whether to time the renders of templates and of their blocks and defs (see RENDER_TIMINGS.get_stats()).
+    # Templates must be recompiled (dmp_cleanup) after changing this.
+    'RENDER_TIMING': False,
+
+    # the maximum number of compiled templates kept in memory (shared by all apps); the least recently
+    # used templates are evicted beyond this.  None is unlimited.
+    'TEMPLATE_CACHE_SIZE': 2000,
+
+    # the maximum approximate size, in bytes, of the compiled templates kept in memory (measured as
+    # the length of each template's generated Python source).  None is unlimited.
+    'TEMPLATE_CACHE_MAX_BYTES': None,
+
+    # in DEBUG mode, how changed templates are detected: None stats the template file on every lookup,
+    # 'inotify' or 'poll' watch the loaded templates in a background thread (the polling thread checks every
+    # TEMPLATE_WATCHER_INTERVAL seconds), and 'auto' uses inotify when available and polling otherwise
+    'TEMPLATE_WATCHER': None,
+    'TEMPLATE_WATCHER_INTERVAL': 1.0,
+
+    # the Django cache (an alias in settings.CACHES) that stores the output of <%block cached="True"> and
+    # <%def cached="True">, and the default number of seconds to keep it.  None (the default) leaves Mako's cache (Beaker).
+    'FRAGMENT_CACHE': None,
+    'FRAGMENT_CACHE_TIMEOUT': 300,
+
+    # whether context processors run only when a template first reads one of their names, with their output reused
+    # within the request (see FRESH_CONTEXT_PROCESSORS).  False runs every processor on every render, as Django does.
+    'LAZY_CONTEXT_PROCESSORS': False,
+
+    # the Django cache (an alias in settings.CACHES) that stores the responses of views decorated
+    # with @view_function(cache=...), unless the decorator names another one
+    'RESPONSE_CACHE': 'default',
+
+    # whether to compile and load every template of the project apps when Django starts, then
+    # call gc.freeze() so preforked workers (gunicorn --preload, uwsgi) share the compiled templates
+    'PRELOAD_TEMPLATES': False,
+
+    # the number of views that couldn't be found (from requests for pages that don't exist) to remember,
+    # and the seconds to remember each one, so repeated requests don't search the apps again.  0 turns it off.
+    'MISSING_VIEW_CACHE_SIZE': 1000,
+    'MISSING_VIEW_CACHE_TIMEOUT': 60,
+
+    # whether to find the views of the project apps (importing their view modules) when Django starts,
+    # so the first request to each page doesn't pay for it.  `manage.py dmp_routes` prints the routes.
+    'PRELOAD_ROUTES': False,
+
+    # whether views that are only a template (no view function) send the page with a StreamingHttpResponse as it renders
+    # (see the caveats in the streaming docs: the template renders in another thread, outside the request's transaction)
+    'STREAM_TEMPLATE_VIEWS': False,
+
+    # whether templates are compiled with a flush point at the start of each <%block>, so streaming renders send
+    # the page at block boundaries.  Without it, streaming renders send the page in fixed-size chunks.
+    'STREAM_FLUSH_POINTS': False,
+
     # the default encoding of template files
     'DEFAULT_TEMPLATE_ENCODING': 'utf-8',
 
@@ -5,8 +5,9 @@ from django.template.backends.base import BaseEngine
 from django.utils.module_loading import import_string
 from mako.template import Template
 
-from .template import MakoTemplateLoader, MakoTemplateAdapter
+from .template import MakoTemplateLoader, MakoTemplateAdapter, TEMPLATE_CACHE
 
+from collections import OrderedDict
 import itertools
 import os
 import os.path
@@ -23,6 +24,9 @@ BUILTIN_CONTEXT_PROCESSORS = (
 # ('myapp', '/mytemplate.html', 'mytemplate.html', '#myblock', 'myblock')
 RE_TEMPLATE_NAME = re.compile('([^/?#]*)?(/([^#]*))?(#(.*))?')
 
+# the most template adapters cached by name when TEMPLATE_CACHE_SIZE is None (the names come from callers, so they are always bounded)
+DEFAULT_TEMPLATE_ADAPTERS_SIZE = 2000
+
 
 #########################################################
 ###   The main engine
@@ -43,12 +47,21 @@ class MakoTemplates(BaseEngine):
 
         # cache for our template loaders
         self.template_loaders = {}
+        # (app name, subdir) -> loader for registered apps, so get_template_loader() skips the app registry
+        self.app_template_loaders = {}
+        # "app/template.html#block" -> MakoTemplateAdapter (see get_template), and template filename -> names
+        self.template_adapters = OrderedDict()
+        self.template_adapter_names = {}
+        # adapters are dropped along with their templates
+        TEMPLATE_CACHE.listeners.append(self.forget_template_adapters)
 
         # set up the context processors
         context_processors = []
         for processor in itertools.chain(BUILTIN_CONTEXT_PROCESSORS, self.dmp.options['CONTEXT_PROCESSORS']):
             context_processors.append(import_string(processor))
         self.template_context_processors = tuple(context_processors)
+        # the processors whose output isn't reused between renders of a request
+        self.fresh_context_processors = frozenset( import_string(processor) for processor in self.dmp.options['FRESH_CONTEXT_PROCESSORS'] )
 
         # super constructor
         params.pop('OPTIONS', None)   # the super doesn't like OPTIONS in there
@@ -77,14 +90,55 @@ class MakoTemplates(BaseEngine):
 
         Template rendering can be limited to a specific def/block within the template
         by specifying `#def_name`, e.g. `myapp/mytemplate.html#myblockname`.
+
+        Adapters are cached by template_name, so repeat calls skip the parsing and
+        lookups.  An adapter is dropped when its compiled template leaves TEMPLATE_CACHE
+        (evicted, invalidated, or changed), and at most TEMPLATE_CACHE_SIZE names are kept
+        (the oldest are dropped first).  In DEBUG mode without a watcher, the template file
+        is also checked on each call.
         '''
-        dmp = apps.get_app_config('django_mako_plus')
+        # fast path: the adapter from a previous call
+        adapter = self.template_adapters.get(template_name)
+        if adapter is not None:
+            mako_template = adapter.mako_template
+            if not mako_template.lookup.filesystem_checks or TEMPLATE_CACHE.is_current(mako_template, check_file=True):
+                return adapter
+
+        # full lookup
         match = RE_TEMPLATE_NAME.match(template_name)
         if match is None or match.group(1) is None or match.group(3) is None:
             raise TemplateDoesNotExist('Invalid template_name format for a DMP template.  This method requires that the template name be in app_name/template.html format (separated by slash).')
-        if not dmp.is_registered_app(match.group(1)):
+        if not self.dmp.is_registered_app(match.group(1)):
             raise TemplateDoesNotExist('Not a DMP app, so deferring to other template engines for this template')
-        return self.get_template_loader(match.group(1)).get_template(match.group(3), def_name=match.group(5))
+        adapter = self.get_template_loader(match.group(1)).get_template(match.group(3), def_name=match.group(5))
+        mako_template = adapter.mako_template
+        # within the cache's lock, so the template can't be removed between the check and the insert
+        with TEMPLATE_CACHE.lock:
+            if TEMPLATE_CACHE.is_current(mako_template):
+                self.forget_template_adapter(template_name)
+                self.template_adapters[template_name] = adapter
+                self.template_adapter_names.setdefault(mako_template.filename, set()).add(template_name)
+                max_size = TEMPLATE_CACHE.max_size or DEFAULT_TEMPLATE_ADAPTERS_SIZE
+                while len(self.template_adapters) > max_size:
+                    self.forget_template_adapter(next(iter(self.template_adapters)))
+        return adapter
+
+
+    def forget_template_adapters(self, filename):
+        '''Drops the cached adapters of a template file (TEMPLATE_CACHE calls this, within its lock, when it removes the file)'''
+        for template_name in self.template_adapter_names.pop(filename, ()):
+            self.template_adapters.pop(template_name, None)
+
+
+    def forget_template_adapter(self, template_name):
+        '''Drops one cached adapter (must be called within TEMPLATE_CACHE.lock)'''
+        adapter = self.template_adapters.pop(template_name, None)
+        if adapter is not None:
+            names = self.template_adapter_names.get(adapter.mako_template.filename)
+            if names is not None:
+                names.discard(template_name)
+                if not names:
+                    del self.template_adapter_names[adapter.mako_template.filename]
 
 
     def get_template_loader(self, app, subdir='templates', create=False):
@@ -105,27 +159,36 @@ class MakoTemplates(BaseEngine):
         that does not conform to the app_dir/templates/* pattern.
 
         If the loader is not found in the DMP cache, one of two things occur:
-          1. If create=True, it is created automatically and returned.  This overrides
-             the need to register the app as a DMP app.
-          2. If create=False, a TemplateDoesNotExist is raised.  This is the default
-             behavior.
+          1. If the app is registered with DMP, or if create=True, it is created
+             automatically and returned.  Loaders of registered apps are created on
+             first use rather than at registration.
+          2. Otherwise, a ValueError is raised.  This is the default behavior.
         '''
+        # loaders of registered apps are remembered by name
+        try:
+            return self.app_template_loaders[app, subdir]
+        except (KeyError, TypeError):
+            pass
+
         # ensure we have an AppConfig
         if app is None:
             raise TemplateDoesNotExist("Cannot locate loader when app is None")
+        app_name = app
         if not isinstance(app, AppConfig):
             app = apps.get_app_config(app)
         # get the loader with the path of this app+subdir
         path = os.path.join(app.path, subdir)
 
         # if create=False, the loader must already exist in the cache
-        if not create:
-            dmp = apps.get_app_config('django_mako_plus')
-            if not dmp.is_registered_app(app):
-                raise ValueError("{} is not registered with DMP [hint: check urls.py for include('django_mako_plus.urls')].".format(app))
+        registered = self.dmp.is_registered_app(app)
+        if not create and not registered:
+            raise ValueError("{} is not registered with DMP [hint: check urls.py for include('django_mako_plus.urls')].".format(app))
 
         # return the template by path
-        return self.get_template_loader_for_path(path, use_cache=True)
+        loader = self.get_template_loader_for_path(path, use_cache=True)
+        if registered and isinstance(app_name, str):
+            self.app_template_loaders[app_name, subdir] = loader
+        return loader
 
 
     def get_template_loader_for_path(self, path, use_cache=True):
@@ -156,9 +219,9 @@ class MakoTemplates(BaseEngine):
         # create the loader
         loader = MakoTemplateLoader(path, None)
 
-        # cache if we are allowed
+        # cache if we are allowed (if two threads create the same loader, both use the first one cached)
         if use_cache:
-            self.template_loaders[path] = loader
+            loader = self.template_loaders.setdefault(path, loader)
 
         # return
         return loader
@@ -4,6 +4,7 @@ from django.template.exceptions import TemplateSyntaxError
 
 from django_mako_plus.convenience import get_template_for_path
 from django_mako_plus.management.mixins import DMPCommandMixIn
+from django_mako_plus.template import find_template_files
 
 import os
 import os.path
@@ -76,25 +77,12 @@ class Command(DMPCommandMixIn, MakeMessagesCommand):
                 app_name=app_config.name,
             )
 
-            def recurse_path(path):
-                self.message('searching for Mako templates in {}'.format(path), 1)
-                if os.path.exists(path):
-                    for filename in os.listdir(path):
-                        filepath = os.path.join(path, filename)
-                        _, ext = os.path.splitext(filename)
-                        if filename.startswith('__'):  # __dmpcache__, __pycache__
-                            continue
-
-                        elif os.path.isdir(filepath):
-                            recurse_path(filepath)
-
-                        elif ext.lower() in ( '.htm', '.html', '.mako' ):
-                            # create the template object, which creates the compiled .py file
-                            self.message('compiling {}'.format(filepath), 2)
-                            try:
-                                get_template_for_path(filepath)
-                            except TemplateSyntaxError:
-                                if not self.options.get('ignore_template_errors'):
-                                    raise
-
-            recurse_path(subdir)
+            self.message('searching for Mako templates in {}'.format(subdir), 1)
+            for filepath in find_template_files(subdir):
+                # create the template object, which creates the compiled .py file
+                self.message('compiling {}'.format(filepath), 2)
+                try:
+                    get_template_for_path(filepath)
+                except TemplateSyntaxError:
+                    if not self.options.get('ignore_template_errors'):
+                        raise
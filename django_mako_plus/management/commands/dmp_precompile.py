@@ -0,0 +1,172 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.exceptions import TemplateSyntaxError
+
+from django_mako_plus.convenience import get_template_for_path
+from django_mako_plus.management.commands.dmp_cleanup import pretty_relpath
+from django_mako_plus.management.mixins import DMPCommandMixIn
+from django_mako_plus.template import find_template_files, TEMPLATE_CACHE
+from django_mako_plus.template.bundle import write_bundle
+
+from concurrent.futures import ProcessPoolExecutor
+import os, os.path
+import time
+
+
+
+class Command(DMPCommandMixIn, BaseCommand):
+    help = (
+        "Compiles the Mako templates of DMP-enabled apps in parallel. Run this at build/deploy time "
+        "so workers never pay the compile cost on the first hit to a template."
+    )
+
+    SEARCH_DIRS = [
+        os.path.join('{app_path}', 'templates')
+    ]
+
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            'appname',
+            type=str,
+            nargs='*',
+            help='The name of one or more DMP apps. If omitted, all DMP apps are processed.'
+        )
+        parser.add_argument(
+            '--template-dir',
+            default=[],
+            dest='template_dir',
+            action='append',
+            help="Precompile all Mako templates in the given subdirectory of each app. Deep search is used, so children of a subdirectory are automatically included. May be specified multiple times. Ex: --template-dir=templates"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=os.cpu_count() or 1,
+            help='The number of processes to compile with (defaults to the number of CPUs). Use 1 to compile in the current process.'
+        )
+        parser.add_argument(
+            '--bundle',
+            nargs='?',
+            const=True,
+            default=None,
+            dest='bundle',
+            help='Also write the compiled templates to a single bundle file: the given path, or the TEMPLATE_BUNDLE option if no path is given'
+        )
+        parser.add_argument(
+            '--ignore-template-errors',
+            action='store_true',
+            dest='ignore_template_errors',
+            default=False,
+            help='Report template errors but do not fail the command'
+        )
+
+
+    def handle(self, *args, **options):
+        dmp = apps.get_app_config('django_mako_plus')
+        search_dirs = self.SEARCH_DIRS
+        if options.get('template_dir'):
+            search_dirs = [ os.path.join('{app_path}', subdir) for subdir in options['template_dir'] ]
+
+        # the apps to process
+        if options.get('appname'):
+            app_configs = [ apps.get_app_config(name) for name in options['appname'] ]
+            for config in app_configs:
+                if not dmp.is_registered_app(config):
+                    raise CommandError('{} is not registered with DMP'.format(config.name))
+        else:
+            app_configs = list(dmp.get_registered_apps())
+
+        # gather the template files: filepath -> ( app config, template subdir )
+        found = {}
+        for config in app_configs:
+            for subdir_name in search_dirs:
+                subdir = subdir_name.format(app_path=config.path, app_name=config.name)
+                self.message('searching for Mako templates in {}'.format(subdir), level=2)
+                for filepath in find_template_files(subdir):
+                    found.setdefault(filepath, ( config, subdir ))
+        filepaths = list(found)
+        if not filepaths:
+            self.message('No templates found.')
+            return
+
+        # compile, either here or in a pool of processes
+        workers = max(1, min(options['workers'], len(filepaths)))
+        self.message('Compiling {} templates with {} worker{}'.format(len(filepaths), workers, '' if workers == 1 else 's'))
+        start = time.perf_counter()
+        if workers == 1:
+            results = map(compile_template, filepaths)
+            errors = self.report(results)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                errors = self.report(executor.map(compile_template, filepaths))
+        self.message('Compiled {} templates in {:.1f} ms'.format(len(filepaths), (time.perf_counter() - start) * 1000))
+
+        # pack the compiled templates into one file
+        if options.get('bundle'):
+            bundle_path = dmp.options['TEMPLATE_BUNDLE'] if options['bundle'] is True else options['bundle']
+            if not bundle_path:
+                raise CommandError('--bundle needs a path because the TEMPLATE_BUNDLE option is not set')
+            failed = set( filepath for filepath, error in errors )
+            templates = []
+            for filepath, ( config, subdir ) in found.items():
+                if filepath not in failed:
+                    # reload through the app's loader so the template has the same uri it has at runtime
+                    TEMPLATE_CACHE.invalidate(filepath)
+                    loader = dmp.engine.get_template_loader(config, os.path.relpath(subdir, config.path), create=True)
+                    templates.append(loader.get_mako_template(os.path.relpath(filepath, subdir).replace(os.path.sep, '/')))
+            count = write_bundle(bundle_path, templates)
+            self.message('Wrote {} templates to {}'.format(count, bundle_path))
+
+        # fail the build if errors
+        if errors:
+            msg = '{} template{} failed to compile'.format(len(errors), '' if len(errors) == 1 else 's')
+            if not options.get('ignore_template_errors'):
+                raise CommandError(msg)
+            self.message(msg)
+
+
+    def report(self, results):
+        '''Prints the result of each compile.  Returns a list of (filepath, error) for the failed templates.'''
+        errors = []
+        for filepath, elapsed, error in results:
+            relpath = pretty_relpath(filepath, settings.BASE_DIR)
+            if error is None:
+                self.message('{:>9.1f} ms  {}'.format(elapsed * 1000, relpath), level=1, tab=1)
+            else:
+                errors.append(( filepath, error ))
+                self.message('{:>9}  {}: {}'.format('ERROR', relpath, error), level=0, tab=1)
+        return errors
+
+
+
+#####################################################
+###   Worker functions (must be module-level so the
+###   process pool can pickle them)
+
+def init_worker():
+    '''Ensures Django is set up in worker processes (already the case when the pool forks)'''
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def compile_template(filepath):
+    '''
+    Compiles a single template, which writes its compiled .py file to the template cache.
+    Returns (filepath, elapsed seconds, error message or None).
+    '''
+    start = time.perf_counter()
+    try:
+        # clearing the in-memory template so templates already loaded (such as those
+        # inherited by a forked worker) are still written to the template cache dir
+        TEMPLATE_CACHE.invalidate(filepath)
+        get_template_for_path(filepath)
+        error = None
+    except TemplateSyntaxError as e:
+        error = str(e)
+    return filepath, time.perf_counter() - start, error
@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_mako_plus.management.mixins import DMPCommandMixIn
+from django_mako_plus.router.index import build_route_index
+
+import time
+
+
+
+class Command(DMPCommandMixIn, BaseCommand):
+    help = (
+        "Finds the view functions, class-based views, and template views of DMP-enabled apps "
+        "and prints the routes. The PRELOAD_ROUTES option does the same discovery at startup."
+    )
+
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            'appname',
+            type=str,
+            nargs='*',
+            help='The name of one or more DMP apps. If omitted, all DMP apps are processed.'
+        )
+
+
+    def handle(self, *args, **options):
+        dmp = apps.get_app_config('django_mako_plus')
+
+        # the apps to process
+        if options.get('appname'):
+            app_configs = [ apps.get_app_config(name) for name in options['appname'] ]
+            for config in app_configs:
+                if not dmp.is_registered_app(config):
+                    raise CommandError('{} is not registered with DMP'.format(config.name))
+        else:
+            app_configs = list(dmp.get_registered_apps())
+
+        start = time.perf_counter()
+        routes, errors = build_route_index(app_configs)
+        elapsed = time.perf_counter() - start
+
+        # print the route table
+        width = max([ len(route.url) for route in routes ] + [ 3 ])
+        self.message('{:<{width}}  {:<8}  {}'.format('URL', 'TYPE', 'VIEW', width=width))
+        for route in routes:
+            self.message('{:<{width}}  {:<8}  {}.{}'.format(route.url, route.view_type, route.module, route.function, width=width))
+        for name, error in errors:
+            self.message('{:>9}  {}: {}'.format('ERROR', name, error), level=0)
+        self.message('Found {} routes in {:.1f} ms'.format(len(routes), elapsed * 1000))
+        if errors:
+            raise CommandError('{} view{} could not be loaded'.format(len(errors), '' if len(errors) == 1 else 's'))
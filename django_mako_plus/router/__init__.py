@@ -1,3 +1,3 @@
 from .data import RoutingData
 from .decorators import view_function, RequestViewWrapper
-from .resolver import app_resolver, dmp_path
+from .resolver import app_resolver, dmp_resolver, dmp_path
@@ -0,0 +1,193 @@
+from django.apps import apps
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import cc_delim_re, patch_vary_headers
+
+from ..util import log
+
+import hashlib
+
+
+###########################################################
+###  Full-response cache for view functions
+###
+###  A view function can cache its responses with:
+###
+###     @view_function(cache=300)
+###     def process_request(request):
+###         ...
+###
+###  Or with a dict of options:
+###
+###     @view_function(cache={ 'timeout': 300, 'vary': ( 'Accept-Language', ) })
+###
+###  Responses are keyed on the routing data (app, page,
+###  function, urlparams), the query string, the scheme and host,
+###  the active language, and the values of the headers in the
+###  response's Vary header (which includes the vary option).
+###  Like Django's cache middleware, the Vary header names are
+###  stored under the base key when a response is cached, and
+###  lookups read them to build the full key.  RequestViewWrapper
+###  checks the cache before parameter conversion, so a hit skips
+###  the converters, signals, view, and template render.
+###
+###  Responses are stored before the session and CSRF middleware
+###  add their cookies, so the request is checked instead: a
+###  response isn't stored when the view (or its template) read
+###  the CSRF token or used the session.
+###
+
+# key we use to attach the response cache to the view function (see discover.py)
+RESPONSE_CACHE_ATTRIBUTE_NAME = 'response_cache'
+
+# the request methods that can be cached
+CACHED_METHODS = ( 'GET', 'HEAD' )
+
+
+class ResponseCache(object):
+    '''
+    The response cache of a view function.
+        timeout         Seconds to keep responses (DEFAULT_TIMEOUT uses the backend's timeout).
+        vary            Names of request headers that change the response, such as 'Accept-Language'.
+        backend         The alias of the Django cache (defaults to the RESPONSE_CACHE option).
+        anonymous_only  When True, requests by logged-in users skip the cache.
+
+    Only successful (200), non-streaming responses that don't set cookies, don't
+    use the CSRF token or session, and aren't marked private, no-store, or Vary: * are cached.
+    '''
+    OPTIONS = ( 'timeout', 'vary', 'backend', 'anonymous_only' )
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, vary=(), backend=None, anonymous_only=True):
+        self.timeout = timeout
+        self.vary = tuple(vary)
+        self.backend = backend
+        self.anonymous_only = anonymous_only
+
+
+    @classmethod
+    def from_option(cls, option):
+        '''
+        Creates a response cache from the `cache` option of @view_function:
+        True, a number of seconds, or a dict of options.  Returns None if False/None.
+        '''
+        if option is None or option is False:
+            return None
+        if option is True:
+            return cls()
+        if isinstance(option, (int, float)):
+            return cls(timeout=option)
+        if isinstance(option, dict):
+            unknown = set(option).difference(cls.OPTIONS)
+            if unknown:
+                raise ImproperlyConfigured('unknown @view_function cache option(s): {}'.format(', '.join(sorted(unknown))))
+            return cls(**option)
+        raise ImproperlyConfigured('the @view_function cache option must be True, a number of seconds, or a dict (not {!r})'.format(option))
+
+
+    def get_cache(self):
+        '''Returns the Django cache that stores the responses'''
+        return caches[self.backend or apps.get_app_config('django_mako_plus').options['RESPONSE_CACHE']]
+
+
+    def get_key(self, request, routing_data):
+        '''
+        Returns the base cache key for the request, or None if the request can't use the cache.
+        The response is stored under this key plus its vary headers (see get_vary_key).
+        '''
+        if request.method not in CACHED_METHODS:
+            return None
+        if self.anonymous_only:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                return None
+        parts = [
+            request.scheme,
+            request.META.get('HTTP_HOST', ''),
+            routing_data.app,
+            routing_data.page,
+            routing_data.function,
+            '/'.join(routing_data.urlparams),
+            request.META.get('QUERY_STRING', ''),
+            translation.get_language() or '',
+        ]
+        return 'dmp-response-' + hashlib.md5('\n'.join(parts).encode('utf8')).hexdigest()
+
+
+    def get_vary_key(self, key, request, headers):
+        '''Returns the key of the response: the base key plus the request's values of the vary headers'''
+        parts = [ request.META.get(name, '') for name in headers ]
+        return key + '-' + hashlib.md5('\n'.join(parts).encode('utf8')).hexdigest()
+
+
+    def get(self, key, request):
+        '''Returns the cached response for the base key and request, or None'''
+        cache = self.get_cache()
+        headers = cache.get(key + '-headers')
+        if headers is None:
+            return None
+        return cache.get(self.get_vary_key(key, request, headers))
+
+
+    def set(self, key, response, request):
+        '''Caches the response if it can be cached'''
+        if self.vary:
+            patch_vary_headers(response, self.vary)
+        if not is_cacheable(response, request):
+            return
+        # render lazy responses (such as TemplateResponse) before pickling
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        # the request headers named in the Vary header, as META names (like django.utils.cache.learn_cache_key)
+        headers = sorted(set(
+            'HTTP_' + name.strip().upper().replace('-', '_')
+            for name in cc_delim_re.split(response.get('Vary', ''))
+            if name.strip()
+        ))
+        cache = self.get_cache()
+        cache.set(key + '-headers', headers, self.timeout)
+        cache.set(self.get_vary_key(key, request, headers), response, self.timeout)
+        log.debug('cached response %s', key)
+
+
+def is_cacheable(response, request=None):
+    '''
+    Returns True if the response can be shared between requests.  When the request is given, the
+    response also can't depend on the CSRF token or the session (see watch_session), since their
+    cookies are set by middleware after the response is stored.
+    '''
+    # streaming responses are not HttpResponses
+    if not isinstance(response, HttpResponse) or response.status_code != 200 or response.cookies:
+        return False
+    # Vary: * means the response can't be matched to later requests
+    if '*' in ( name.strip() for name in cc_delim_re.split(response.get('Vary', '')) ):
+        return False
+    if request is not None:
+        if request.META.get('CSRF_COOKIE_USED'):
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and (getattr(session, 'accessed', False) or getattr(session, 'modified', False)):
+            return False
+    cache_control = response.get('Cache-Control', '').lower()
+    return 'private' not in cache_control and 'no-store' not in cache_control
+
+
+def watch_session(request):
+    '''
+    Clears the accessed flag of the request's session, so is_cacheable() can tell whether the view
+    uses the session.  Reading the user for the cache key (anonymous_only) doesn't count.  Returns
+    the previous flag, which must be given to restore_session() when the view is done.
+    '''
+    session = getattr(request, 'session', None)
+    accessed = getattr(session, 'accessed', False)
+    if accessed:
+        session.accessed = False
+    return accessed
+
+
+def restore_session(request, accessed):
+    '''Restores the accessed flag cleared by watch_session(), so the session middleware still adds Vary: Cookie'''
+    if accessed:
+        request.session.accessed = True
@@ -1,4 +1,5 @@
 from django.apps import apps
+from django.conf import settings
 
 from ..decorators import BaseDecorator
 from .urlparams import URLParamList
@@ -29,25 +30,15 @@ class RoutingData(object):
         # the request object is set later by the middleware so the render methods work
         self.request = None
 
-        # period and dash cannot be in python names, but we allow dash in app, dash in page, and dash/period in function
-        self.app = app.replace('-', '_') if app is not None else None
-        self.page = page.replace('-', '_') if page is not None else None
-        if function and function != 'process_request':
-            self.function = function.replace('.', '_').replace('-', '_')
-            fallback_template = '{}.{}.html'.format(page, function)
-        else:
-            self.function = 'process_request'
-            fallback_template = '{}.html'.format(page)
-
-        # set the module and function
-        # the return of get_router_function might be a function, a class-based view, or a template
-        if self.app is not None and self.page is not None:
-            self.module = '.'.join([ self.app, 'views', self.page ])
-            self.callable = get_view_function(self.module, self.function, self.app, fallback_template)
-        else:
-            self.module = None
-            self.callable = None
-        self.view_type = self.callable.view_type if self.callable is not None else None
+        # the parts that are the same for every request to this view are shared (see Route below).
+        # they're copied here because an internal redirect changes module, function, and callable.
+        self.route = get_route(app, page, function)
+        self.app = self.route.app
+        self.page = self.route.page
+        self.function = self.route.function
+        self.module = self.route.module
+        self.callable = self.route.callable
+        self.view_type = self.route.view_type
 
         # parse the urlparams
         # note that I'm not using unquote_plus because the + switches to a space *after* the question mark (in the regular parameters)
@@ -84,18 +75,33 @@ class RoutingData(object):
             )))
 
 
-    def render(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None):
-        '''App-specific render function that renders templates in the *current app*, attached to the request for convenience'''
-        template_adapter = self.get_template_loader(subdir).get_template(template)
-        return getattr(template_adapter, 'render_to_response')(context=context, request=self.request, def_name=def_name, content_type=content_type, status=status, charset=charset)
+    def render(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None, stream=False):
+        '''
+        App-specific render function that renders templates in the *current app*, attached to the request for convenience.
+        If stream is True, the response is a StreamingHttpResponse that sends the page as it renders.
+        '''
+        template_adapter = self.get_template(template, subdir)
+        return getattr(template_adapter, 'render_to_response')(context=context, request=self.request, def_name=def_name, content_type=content_type, status=status, charset=charset, stream=stream)
 
 
     def render_to_string(self, template, context=None, def_name=None, subdir='templates'):
         '''App-specific render function that renders templates in the *current app*, attached to the request for convenience'''
-        template_adapter = self.get_template_loader(subdir).get_template(template)
+        template_adapter = self.get_template(template, subdir)
         return getattr(template_adapter, 'render')(context=context, request=self.request, def_name=def_name)
 
 
+    async def arender(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None, stream=False):
+        '''Awaitable version of render() for async views (the template is found and rendered in Django's thread for sync code)'''
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.render, thread_sensitive=True)(template, context=context, def_name=def_name, subdir=subdir, content_type=content_type, status=status, charset=charset, stream=stream)
+
+
+    async def arender_to_string(self, template, context=None, def_name=None, subdir='templates'):
+        '''Awaitable version of render_to_string() for async views'''
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.render_to_string, thread_sensitive=True)(template, context=context, def_name=def_name, subdir=subdir)
+
+
     def get_template(self, template, subdir='templates'):
         '''App-specific function to get a template from the current app'''
         return self.get_template_loader(subdir).get_template(template)
@@ -107,3 +113,65 @@ class RoutingData(object):
             raise ValueError("this method can only be called after the view middleware is run. Check that `django_mako_plus.middleware` is in MIDDLEWARE.")
         dmp = apps.get_app_config('django_mako_plus')
         return dmp.engine.get_template_loader(self.app, subdir)
+
+
+
+########################################################
+###   Routes: the per-view part of the routing data
+
+# ( app, page, function ) from the url -> Route
+CACHED_ROUTES = {}
+
+
+def get_route(app, page, function):
+    '''
+    Returns the Route for the given url parts, creating it the first time.
+    Raises ViewDoesNotExist if the view can't be found.
+    '''
+    key = ( app, page, function )
+    try:
+        return CACHED_ROUTES[key]
+    except KeyError:
+        route = Route(app, page, function)
+        # cache in production mode (like the view functions, since DEBUG mode reloads them)
+        if not settings.DEBUG:
+            CACHED_ROUTES[key] = route
+        return route
+
+
+
+class Route(object):
+    '''
+    The parts of the routing data that depend only on the url's app, page, and function,
+    computed once and shared by every request to the view.  RoutingData copies the values
+    it might change, so routes stay as created, except for wrapper_attributes: the first
+    RequestViewWrapper of the route fills it in once (see RequestViewWrapper.__init__).
+    Concurrent first requests may each fill it, but with the same values.
+    '''
+    def __init__(self, app, page, function):
+        # period and dash cannot be in python names, but we allow dash in app, dash in page, and dash/period in function
+        self.app = app.replace('-', '_') if app is not None else None
+        self.page = page.replace('-', '_') if page is not None else None
+        if function and function != 'process_request':
+            self.function = function.replace('.', '_').replace('-', '_')
+            fallback_template = '{}.{}.html'.format(page, function)
+        else:
+            self.function = 'process_request'
+            fallback_template = '{}.html'.format(page)
+
+        # set the module and function
+        # the return of get_router_function might be a function, a class-based view, or a template
+        if self.app is not None and self.page is not None:
+            self.module = '.'.join([ self.app, 'views', self.page ])
+            self.callable = get_view_function(self.module, self.function, self.app, fallback_template)
+        else:
+            self.module = None
+            self.callable = None
+        self.view_type = self.callable.view_type if self.callable is not None else None
+
+        # the name, docs, etc. that RequestViewWrapper takes from the callable, set once by the first wrapper
+        self.wrapper_attributes = None
+
+
+    def __repr__(self):
+        return '<Route module={}, function={}, view_type={}>'.format(self.module, self.function, self.view_type)
@@ -1,10 +1,12 @@
+from django import VERSION
 from django.apps import apps
 from django.core.exceptions import ImproperlyConfigured, ViewDoesNotExist
 from django.http import HttpResponse, StreamingHttpResponse, Http404, HttpResponseServerError
 
 from ..decorators import BaseDecorator
+from .cache import ResponseCache, RESPONSE_CACHE_ATTRIBUTE_NAME, watch_session, restore_session
 from ..signals import dmp_signal_post_process_request, dmp_signal_pre_process_request, dmp_signal_internal_redirect_exception, dmp_signal_redirect_exception
-from ..util import import_qualified, log
+from ..util import import_qualified, log, is_async_callable, markcoroutinefunction
 from ..exceptions import InternalRedirectException, RedirectException
 
 import inspect
@@ -34,9 +36,19 @@ class view_function(BaseDecorator):
         @view_function(...)
         function process_request(request):
             ...
+
+    View functions (and the methods of class-based views) can also be `async def`.
+
+    Responses can be cached with the `cache` argument (see router/cache.py):
+
+        @view_function(cache=300)
+        function process_request(request):
+            ...
     '''
     # singleton set of decorated functions
     DECORATED_FUNCTIONS = set()
+    # real function -> ResponseCache, for the decorated functions with the cache option
+    RESPONSE_CACHES = {}
 
 
     def __init__(self, decorator_function, *args, **kwargs):
@@ -51,6 +63,24 @@ class view_function(BaseDecorator):
         # but even that is fine *as long as @view_function is listed first*.
         self.DECORATED_FUNCTIONS.add(real_func)
 
+        # the response cache is attached to the view function in discover.py
+        response_cache = ResponseCache.from_option(self.decorator_kwargs.get('cache'))
+        if response_cache is not None:
+            self.RESPONSE_CACHES[real_func] = response_cache
+
+        # let Django (and asyncio) see that an async function is still async when decorated
+        self.is_async = is_async_callable(decorator_function)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+    def __get__(self, instance, type=None):
+        bound = super().__get__(instance, type)
+        # async methods on class-based views (Django checks the methods to decide whether the view is async)
+        if self.is_async:
+            markcoroutinefunction(bound)
+        return bound
+
 
     @classmethod
     def is_decorated(cls, f):
@@ -59,6 +89,12 @@ class view_function(BaseDecorator):
         return real_func in cls.DECORATED_FUNCTIONS
 
 
+    @classmethod
+    def get_response_cache(cls, f):
+        '''Returns the ResponseCache of the given function, or None if it doesn't cache its responses'''
+        return cls.RESPONSE_CACHES.get(inspect.unwrap(f))
+
+
 
 #############################################
 ###  Per-request wrapper for view functions
@@ -84,8 +120,22 @@ class RequestViewWrapper(object):
 
     def __init__(self, routing_data):
         self.routing_data = routing_data
-        # take name and attributes of the view function
-        functools.update_wrapper(self, self.routing_data.callable)
+        # take name and attributes of the view function. the first wrapper of a route
+        # saves them on the route, so later requests copy them in one step.
+        route = getattr(routing_data, 'route', None)
+        if route is not None and route.callable is routing_data.callable and route.wrapper_attributes is not None:
+            self.__dict__.update(route.wrapper_attributes)
+        else:
+            functools.update_wrapper(self, routing_data.callable)
+            if route is not None and route.callable is routing_data.callable:
+                route.wrapper_attributes = { k: v for k, v in self.__dict__.items() if k != 'routing_data' }
+
+
+    def __new__(cls, routing_data):
+        # async view functions get the async wrapper (on Django versions that run async views)
+        if cls is RequestViewWrapper and ASYNC_VIEWS and is_async_view(routing_data.callable):
+            cls = AsyncRequestViewWrapper
+        return super().__new__(cls)
 
 
     def __call__(self, request, *args, **kwargs):
@@ -97,56 +147,246 @@ class RequestViewWrapper(object):
         # using the middleware
         request.dmp = self.routing_data
 
+        # return the cached response, if any
+        cache_key, response = self.get_cached_response(request)
+        if response is not None:
+            return response
+        if cache_key is not None:
+            session_accessed = watch_session(request)
+
         # an outer try that catches the redirect exceptions
         try:
 
             # convert the parameters (the converter is placed on the func in discover.py)
-            converter = getattr(self.routing_data.callable, CONVERTER_ATTRIBUTE_NAME, None)
-            if converter is not None:
-                args, kwargs = converter.convert_parameters(request, *args, **kwargs)
+            args, kwargs = self.convert_parameters(request, args, kwargs)
 
             # send the pre-signal
             if dmp.options['SIGNALS']:
-                for receiver, ret_response in dmp_signal_pre_process_request.send(sender=sys.modules[__name__], request=request, view_args=args, view_kwargs=kwargs):
-                    if isinstance(ret_response, (HttpResponse, StreamingHttpResponse)):
-                        return ret_response
-
-            # call the view function
-            response = self.routing_data.callable(request, *args, **kwargs)
+                response = self.send_pre_signal(request, args, kwargs)
+                if response is not None:
+                    return response
+
+            # call the view function (this Django version runs async views here, in their own event loop)
+            if is_async_view(self.routing_data.callable):
+                response = async_to_sync(self.await_view)(request, *args, **kwargs)
+            else:
+                response = self.routing_data.callable(request, *args, **kwargs)
             if not isinstance(response, (HttpResponse, StreamingHttpResponse)):
                 log.info('%s failed to return an HttpResponse (or the post-signal overwrote it).  Returning 500 error.', self.routing_data.callable)
                 return HttpResponseServerError('Invalid response received from server.')
 
             # send the post-signal
             if dmp.options['SIGNALS']:
-                for receiver, ret_response in dmp_signal_post_process_request.send(sender=sys.modules[__name__], request=request, response=response, view_args=args, view_kwargs=kwargs):
-                    if ret_response is not None:
-                        response = ret_response # sets it to the last non-None in the signal receiver chain
+                response = self.send_post_signal(request, response, args, kwargs)
 
+            if cache_key is not None:
+                self.cache_response(cache_key, request, response)
             return response
 
         except InternalRedirectException as ivr:
-            # send the signal
-            if dmp.options['SIGNALS']:
-                dmp_signal_internal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=ivr)
-            # update the RoutingData object
-            request.dmp.module = ivr.redirect_module
-            request.dmp.function = ivr.redirect_function
-            try:
-                request.dmp.callable = getattr(import_qualified(request.dmp.module), request.dmp.function)
-            except (ImportError, AttributeError):
-                log.info('could not fulfill InternalViewRedirect because %s.%s does not exist.', request.dmp.module, request.dmp.function)
-                raise Http404()
-            # recurse with this routing data
-            log.info('received an InternalViewRedirect to %s.%s', request.dmp.module, request.dmp.function)
-            return RequestViewWrapper(self.routing_data)(request, *args, **kwargs)
+            # recurse with the updated routing data (in a sync wrapper, even if the new view is async)
+            return self.internal_redirect(request, ivr, sync=True)(request, *args, **kwargs)
 
         except RedirectException as e: # redirect to another page
-            log.info('view %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
-            # send the signal
-            if dmp.options['SIGNALS']:
-                dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
-            # send the browser the redirect command
-            return e.get_response(request)
+            return self.redirect(request, e)
+
+        finally:
+            if cache_key is not None:
+                restore_session(request, session_accessed)
+
+
+    async def await_view(self, request, *args, **kwargs):
+        '''Calls the view function and awaits its response'''
+        response = self.routing_data.callable(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+    def get_cached_response(self, request):
+        '''
+        Returns ( cache key, cached response ) for views with a response cache (attached in discover.py).
+        The key is None when the request can't use the cache, and the response is None on a miss.
+        '''
+        response_cache = getattr(self.routing_data.callable, RESPONSE_CACHE_ATTRIBUTE_NAME, None)
+        if response_cache is None:
+            return None, None
+        cache_key = response_cache.get_key(request, self.routing_data)
+        if cache_key is None:
+            return None, None
+        response = response_cache.get(cache_key, request)
+        if response is not None:
+            log.info('returning cached response for %s.%s', self.routing_data.module, self.routing_data.function)
+        return cache_key, response
+
+
+    def cache_response(self, cache_key, request, response):
+        '''Places the response in the view's response cache (if it can be cached)'''
+        getattr(self.routing_data.callable, RESPONSE_CACHE_ATTRIBUTE_NAME).set(cache_key, response, request)
+
+
+    def convert_parameters(self, request, args, kwargs):
+        '''Converts the view parameters with the converter attached to the view function in discover.py'''
+        converter = getattr(self.routing_data.callable, CONVERTER_ATTRIBUTE_NAME, None)
+        if converter is not None:
+            args, kwargs = converter.convert_parameters(request, *args, **kwargs)
+        return args, kwargs
+
+
+    def send_pre_signal(self, request, args, kwargs):
+        '''Sends dmp_signal_pre_process_request. Returns the response of a receiver that short-circuits the view, or None'''
+        for receiver, ret_response in dmp_signal_pre_process_request.send(sender=sys.modules[__name__], request=request, view_args=args, view_kwargs=kwargs):
+            if isinstance(ret_response, (HttpResponse, StreamingHttpResponse)):
+                return ret_response
+        return None
+
+
+    def send_post_signal(self, request, response, args, kwargs):
+        '''Sends dmp_signal_post_process_request. Returns the response to send'''
+        for receiver, ret_response in dmp_signal_post_process_request.send(sender=sys.modules[__name__], request=request, response=response, view_args=args, view_kwargs=kwargs):
+            if ret_response is not None:
+                response = ret_response # sets it to the last non-None in the signal receiver chain
+        return response
+
+
+    def internal_redirect(self, request, ivr, sync=False):
+        '''
+        Updates the routing data for an InternalRedirectException and returns a wrapper for the new view.
+        With sync=True, the wrapper is always a (sync) RequestViewWrapper, which runs async views with
+        async_to_sync.  Otherwise async views get an AsyncRequestViewWrapper, which must be awaited.
+        '''
+        dmp = apps.get_app_config('django_mako_plus')
+        # send the signal
+        if dmp.options['SIGNALS']:
+            dmp_signal_internal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=ivr)
+        # update the RoutingData object
+        request.dmp.module = ivr.redirect_module
+        request.dmp.function = ivr.redirect_function
+        try:
+            request.dmp.callable = getattr(import_qualified(request.dmp.module), request.dmp.function)
+        except (ImportError, AttributeError):
+            log.info('could not fulfill InternalViewRedirect because %s.%s does not exist.', request.dmp.module, request.dmp.function)
+            raise Http404()
+        log.info('received an InternalViewRedirect to %s.%s', request.dmp.module, request.dmp.function)
+        if sync:
+            # skip __new__, which would choose the async wrapper for an async view
+            wrapper = object.__new__(RequestViewWrapper)
+            wrapper.__init__(self.routing_data)
+            return wrapper
+        return RequestViewWrapper(self.routing_data)
+
+
+    def redirect(self, request, e):
+        '''Returns the response for a RedirectException'''
+        dmp = apps.get_app_config('django_mako_plus')
+        log.info('view %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
+        # send the signal
+        if dmp.options['SIGNALS']:
+            dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
+        # send the browser the redirect command
+        return e.get_response(request)
+
+
+
+class AsyncRequestViewWrapper(RequestViewWrapper):
+    '''
+    The RequestViewWrapper for async view functions and async class-based views.
+    Django sees it as a coroutine function, so under ASGI the view runs on the
+    event loop instead of in a thread.  The parameter converters and signals
+    (which may use the database) run in Django's thread with sync_to_async.
+    '''
+    def __init__(self, routing_data):
+        super().__init__(routing_data)
+        markcoroutinefunction(self)
+
+
+    async def __call__(self, request, *args, **kwargs):
+        log.info('%s', self.routing_data)
+        dmp = apps.get_app_config('django_mako_plus')
+        request.dmp = self.routing_data
+
+        # return the cached response, if any
+        cache_key = None
+        if hasattr(self.routing_data.callable, RESPONSE_CACHE_ATTRIBUTE_NAME):
+            cache_key, response = await sync_to_async(self.get_cached_response)(request)
+            if response is not None:
+                return response
+        if cache_key is not None:
+            session_accessed = watch_session(request)
+
+        # an outer try that catches the redirect exceptions
+        try:
+
+            # convert the parameters
+            if hasattr(self.routing_data.callable, CONVERTER_ATTRIBUTE_NAME):
+                args, kwargs = await sync_to_async(self.convert_parameters)(request, args, kwargs)
+
+            # send the pre-signal
+            if dmp.options['SIGNALS'] and dmp_signal_pre_process_request.has_listeners():
+                response = await sync_to_async(self.send_pre_signal)(request, args, kwargs)
+                if response is not None:
+                    return response
+
+            # call the view function (internal redirects can lead to a regular view)
+            if is_async_view(self.routing_data.callable):
+                response = await self.await_view(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(self.routing_data.callable)(request, *args, **kwargs)
+            if not isinstance(response, (HttpResponse, StreamingHttpResponse)):
+                log.info('%s failed to return an HttpResponse (or the post-signal overwrote it).  Returning 500 error.', self.routing_data.callable)
+                return HttpResponseServerError('Invalid response received from server.')
+
+            # send the post-signal
+            if dmp.options['SIGNALS'] and dmp_signal_post_process_request.has_listeners():
+                response = await sync_to_async(self.send_post_signal)(request, response, args, kwargs)
+
+            if cache_key is not None:
+                await sync_to_async(self.cache_response)(cache_key, request, response)
+            return response
+
+        except InternalRedirectException as ivr:
+            wrapper = await sync_to_async(self.internal_redirect)(request, ivr)
+            if isinstance(wrapper, AsyncRequestViewWrapper):
+                return await wrapper(request, *args, **kwargs)
+            return await sync_to_async(wrapper)(request, *args, **kwargs)
+
+        except RedirectException as e: # redirect to another page
+            return await sync_to_async(self.redirect)(request, e)
+
+        finally:
+            if cache_key is not None:
+                restore_session(request, session_accessed)
+
+
+
+#############################################
+###  Async helpers
+
+# whether this Django version calls async views (3.1+); older versions run them with async_to_sync
+ASYNC_VIEWS = VERSION >= (3, 1)
+
+
+def is_async_view(func):
+    '''Returns True if the view function is async (discover.py sets view_is_async on the functions it finds)'''
+    if func is None:
+        return False
+    try:
+        return func.view_is_async
+    except AttributeError:
+        return is_async_callable(func)
+
+
+def sync_to_async(func):
+    '''Runs a sync function from async code, in the thread Django uses for sync code'''
+    from asgiref.sync import sync_to_async
+    return sync_to_async(func, thread_sensitive=True)
+
+
+def async_to_sync(func):
+    '''Runs an async function from sync code'''
+    try:
+        from asgiref.sync import async_to_sync
+    except ImportError:
+        raise ImproperlyConfigured('async views require the asgiref package (included with Django 3.0+)')
+    return async_to_sync(func)
 
-        # the code should never get here
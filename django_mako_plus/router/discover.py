@@ -4,12 +4,17 @@ from django.core.exceptions import ImproperlyConfigured, ViewDoesNotExist
 from django.template import TemplateDoesNotExist
 from django.views.generic import View
 
+from .cache import RESPONSE_CACHE_ATTRIBUTE_NAME
 from .decorators import view_function, CONVERTER_ATTRIBUTE_NAME
-from ..util import import_qualified, log
+from ..util import import_qualified, log, is_async_callable
 
+from collections import OrderedDict
 import inspect
+import os.path
+import sys
 import threading
-from importlib import import_module
+import time
+from importlib import import_module, invalidate_caches
 from importlib.util import find_spec
 
 
@@ -20,6 +25,11 @@ from importlib.util import find_spec
 CACHED_VIEW_FUNCTIONS = {}
 rlock = threading.RLock()
 
+# in DEBUG mode: ( module_name, function_name ) -> ( stamp of the view module file, view function )
+DEBUG_VIEW_FUNCTIONS = {}
+# in DEBUG mode: module_name -> stamp of the file when the module was loaded
+DEBUG_MODULE_STAMPS = {}
+
 
 def get_view_function(module_name, function_name, fallback_app=None, fallback_template=None, verify_decorator=True):
     '''
@@ -31,13 +41,16 @@ def get_view_function(module_name, function_name, fallback_app=None, fallback_te
     try:
         return CACHED_VIEW_FUNCTIONS[key]
     except KeyError:
+        # in DEBUG mode, the cache is checked against the view module file
+        if settings.DEBUG:
+            return get_debug_view_function(key, fallback_app, fallback_template, verify_decorator)
         with rlock:
             # try again now that we're locked
             try:
                 return CACHED_VIEW_FUNCTIONS[key]
             except KeyError:
                 # if we get here, we need to load the view function
-                func = find_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator)
+                func = find_or_remember_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator)
                 # cache in production mode
                 if not settings.DEBUG:
                     CACHED_VIEW_FUNCTIONS[key] = func
@@ -47,6 +60,80 @@ def get_view_function(module_name, function_name, fallback_app=None, fallback_te
     raise Exception("Django-Mako-Plus error: get_view_function() should not have been able to get to this point.  Please notify the owner of the DMP project.  Thanks.")
 
 
+def get_debug_view_function(key, fallback_app=None, fallback_template=None, verify_decorator=True):
+    '''
+    Retrieves a view function in DEBUG mode.  The function is cached with the modification
+    time of its view module file, so it is found again when the file is edited, created, or
+    removed.  Template views (no view module) aren't cached, so a removed template is a 404.
+
+    When the file changed after the module was imported, the module is removed from
+    sys.modules and imported again as a new module object.  This isn't importlib.reload(),
+    which would change the module in place while other requests may be running it: those
+    requests finish with the old module.  Other modules that imported names from the view
+    module keep the old versions until the process restarts (the development server's
+    autoreloader restarts it when a loaded module changes).
+    '''
+    module_name, function_name = key
+    stamp = get_module_stamp(module_name)
+    entry = DEBUG_VIEW_FUNCTIONS.get(key)
+    if entry is not None and stamp is not None and entry[0] == stamp:
+        return entry[1]
+    with rlock:
+        # a module loaded from an older version of the file is imported again (or forgotten if the file is gone)
+        loaded_stamp = DEBUG_MODULE_STAMPS.get(module_name)
+        if loaded_stamp is not None and loaded_stamp != stamp:
+            invalidate_caches()
+            if sys.modules.pop(module_name, None) is not None:
+                log.info('importing view module %s again because its file changed', module_name)
+        func = find_or_remember_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator, stamp)
+        # the stamp is None until the module's package is imported (by the find above)
+        if stamp is not None:
+            DEBUG_MODULE_STAMPS[module_name] = stamp
+            if func.view_type != 'template':
+                DEBUG_VIEW_FUNCTIONS[key] = ( stamp, func )
+        return func
+
+
+def find_or_remember_view_function(module_name, function_name, fallback_app=None, fallback_template=None, verify_decorator=True, stamp=None):
+    '''
+    Finds a view function (see find_view_function), remembering the views that don't exist
+    in MISSING_VIEW_FUNCTIONS so requests for them don't search again.  Views that exist
+    but can't be loaded (import errors, missing decorators) aren't remembered, since those
+    are errors in the code.  Raises ViewDoesNotExist if not found.
+    '''
+    key = ( module_name, function_name, fallback_template )
+    message = MISSING_VIEW_FUNCTIONS.get(key, stamp)
+    if message is not None:
+        raise MissingViewError(message)
+    try:
+        return find_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator)
+    except MissingViewError as e:
+        # in DEBUG mode, the stamp doesn't cover the template, so a missing template isn't remembered
+        if not (e.template and settings.DEBUG):
+            MISSING_VIEW_FUNCTIONS.set(key, stamp, str(e))
+        raise
+
+
+def get_module_stamp(module_name):
+    '''
+    Returns the modification times of the files a module can be loaded from (a tuple, with
+    None for each file that doesn't exist), or None if the module's package isn't imported yet.
+    The files are found without importing so a missing view module is cheap to check.
+    '''
+    package_name, _, name = module_name.rpartition('.')
+    package = sys.modules.get(package_name)
+    if package is None or not hasattr(package, '__path__'):
+        return None
+    stamp = []
+    for directory in package.__path__:
+        for filename in ( os.path.join(directory, name + '.py'), os.path.join(directory, name, '__init__.py') ):
+            try:
+                stamp.append(os.stat(filename).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+    return tuple(stamp)
+
+
 def find_view_function(module_name, function_name, fallback_app=None, fallback_template=None, verify_decorator=True):
     '''
     Finds a view function, class-based view, or template view.
@@ -66,26 +153,43 @@ def find_view_function(module_name, function_name, fallback_app=None, fallback_t
         try:
             return create_view_for_template(fallback_app, fallback_template)
         except TemplateDoesNotExist as e:
-            raise ViewDoesNotExist('view module {} not found, and fallback template {} could not be loaded ({})'.format(module_name, fallback_template, e))
+            raise MissingViewError('view module {} not found, and fallback template {} could not be loaded ({})'.format(module_name, fallback_template, e), template=True)
 
     # load the module and function
     try:
         module = import_module(module_name)
-        func = getattr(module, function_name)
-        func.view_type = 'function'
     except ImportError as e:
         raise ViewDoesNotExist('module "{}" could not be imported: {}'.format(module_name, e))
+    try:
+        func = getattr(module, function_name)
     except AttributeError as e:
-        raise ViewDoesNotExist('module "{}" found successfully, but "{}" was not found: {}'.format(module_name, function_name, e))
+        raise MissingViewError('module "{}" found successfully, but "{}" was not found: {}'.format(module_name, function_name, e))
+    try:
+        func.view_type = 'function'
+    except AttributeError:
+        raise ViewDoesNotExist('"{}.{}" was found successfully, but it is not a view function or class-based view.'.format(module_name, function_name))
 
     # if class-based view, call as_view() to get a view function to it
     if inspect.isclass(func) and issubclass(func, View):
+        view_class = func
         func = func.as_view()
         func.view_type = 'class'
+        # Django 4.1+ marks the view function of async classes, but we check the handlers for earlier versions
+        func.view_is_async = is_async_callable(func) or is_async_class_view(view_class)
+        # attach the response cache of @view_function(cache=...) on the get() method
+        response_cache = get_class_response_cache(view_class)
+        if response_cache is not None:
+            setattr(func, RESPONSE_CACHE_ATTRIBUTE_NAME, response_cache)
 
     # if regular view function, check the decorator
-    elif verify_decorator and not view_function.is_decorated(func):
-        raise ViewDoesNotExist("view {}.{} was found successfully, but it must be decorated with @view_function or be a subclass of django.views.generic.View.".format(module_name, function_name))
+    else:
+        if verify_decorator and not view_function.is_decorated(func):
+            raise ViewDoesNotExist("view {}.{} was found successfully, but it must be decorated with @view_function or be a subclass of django.views.generic.View.".format(module_name, function_name))
+        func.view_is_async = is_async_callable(func)
+        # attach the response cache of @view_function(cache=...)
+        response_cache = view_function.get_response_cache(func)
+        if response_cache is not None:
+            setattr(func, RESPONSE_CACHE_ATTRIBUTE_NAME, response_cache)
 
     # attach a converter to the view function
     if dmp.options['PARAMETER_CONVERTER'] is not None:
@@ -99,6 +203,27 @@ def find_view_function(module_name, function_name, fallback_app=None, fallback_t
     return func
 
 
+def get_class_response_cache(view_class):
+    '''
+    Returns the response cache of a class-based view, from @view_function(cache=...) on its get()
+    (or head()) method, or None.  Only GET and HEAD responses are cached, so the option on the
+    other methods is an error.
+    '''
+    response_caches = {}
+    for name in view_class.http_method_names:
+        # the decorator itself, since getattr() on the class returns a partial
+        method = inspect.getattr_static(view_class, name, None)
+        if method is not None:
+            response_cache = view_function.get_response_cache(method)
+            if response_cache is not None:
+                response_caches[name] = response_cache
+    others = set(response_caches).difference(( 'get', 'head' ))
+    if others:
+        raise ImproperlyConfigured('{}.{}: only the get() and head() methods of class-based views can cache responses (the cache option is on {})'.format(
+            view_class.__module__, view_class.__qualname__, ', '.join(sorted(others))))
+    return response_caches.get('get') or response_caches.get('head')
+
+
 def create_view_for_template(app_name, template_name):
     '''
     Creates a view function for templates (used whe a view.py file doesn't exist but the .html does)
@@ -111,6 +236,120 @@ def create_view_for_template(app_name, template_name):
         # not caching the template object (getting it each time) because Mako has its own cache
         dmp = apps.get_app_config('django_mako_plus')
         template = dmp.engine.get_template_loader(app_name).get_template(template_name)
-        return template.render_to_response(request=request, context=kwargs)
+        return template.render_to_response(request=request, context=kwargs, stream=dmp.options['STREAM_TEMPLATE_VIEWS'])
     template_view.view_type = 'template'
+    template_view.view_is_async = False
     return template_view
+
+
+def is_async_class_view(view_class):
+    '''Returns True if the HTTP method handlers of a class-based view are async (ignoring the built-in options())'''
+    handlers = [ getattr(view_class, method) for method in view_class.http_method_names if method != 'options' and hasattr(view_class, method) ]
+    return len(handlers) > 0 and all(is_async_callable(handler) for handler in handlers)
+
+
+
+########################################################
+###   Cache of views that don't exist
+
+class MissingViewError(ViewDoesNotExist):
+    '''
+    Raised by find_view_function when the view doesn't exist (no view module and no template,
+    or no function in the module), as opposed to a view that exists but can't be loaded.
+    Only these are remembered in MISSING_VIEW_FUNCTIONS.  `template` is True when the view
+    module doesn't exist and neither does the template for it.
+    '''
+    def __init__(self, message, template=False):
+        super().__init__(message)
+        self.template = template
+
+
+
+class MissingViewCache(object):
+    '''
+    A least-recently-used cache of the views that could not be found, keyed by
+    ( module name, function name, fallback template ).  Bots and scanners request
+    thousands of pages that don't exist, and without this cache each one searches
+    for a view module and then for a template in every template directory.
+
+    Entries expire after timeout seconds, so views and templates added while the
+    server runs are found.  In DEBUG mode, entries are also dropped when the view
+    module's file appears or changes (the stamp from get_module_stamp).  The cache
+    holds at most max_size entries; 0 or None for either turns the cache off.
+    '''
+    def __init__(self, max_size=1000, timeout=60):
+        # key -> ( expiration time, stamp, ViewDoesNotExist message )
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.timeout = timeout
+        self.reset_stats()
+
+
+    def configure(self, max_size, timeout):
+        '''Sets the size and timeout of the cache (called from the DMP app's ready())'''
+        with self.lock:
+            self.max_size = max_size
+            self.timeout = timeout
+            self.entries.clear()
+
+
+    def get(self, key, stamp=None):
+        '''Returns the ViewDoesNotExist message for the given key, or None if it isn't known to be missing'''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, entry_stamp, message = entry
+        with self.lock:
+            if expires < time.monotonic() or entry_stamp != stamp:
+                self.entries.pop(key, None)
+                return None
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        self.hits += 1
+        return message
+
+
+    def set(self, key, stamp, message):
+        '''Remembers that the view for the given key doesn't exist'''
+        if not self.max_size or not self.timeout:
+            return
+        with self.lock:
+            self.entries[key] = ( time.monotonic() + self.timeout, stamp, message )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def invalidate(self, module_name=None):
+        '''Forgets the missing views of the given module, or all of them if module_name is None'''
+        with self.lock:
+            if module_name is None:
+                self.entries.clear()
+            else:
+                for key in [ key for key in self.entries if key[0] == module_name ]:
+                    del self.entries[key]
+
+
+    def get_stats(self):
+        '''
+        Returns a dict of statistics for sizing the cache:
+            size        Missing views currently in the cache.
+            max_size    The count budget.
+            hits        Requests for a view that was known to be missing.
+        '''
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+        }
+
+
+    def reset_stats(self):
+        '''Zeros the hit counter'''
+        self.hits = 0
+
+
+
+# the missing views for this process (sized from the MISSING_VIEW_CACHE_SIZE and MISSING_VIEW_CACHE_TIMEOUT options)
+MISSING_VIEW_FUNCTIONS = MissingViewCache()
@@ -0,0 +1,113 @@
+from django.views.generic import View
+
+from .data import get_route
+from .decorators import view_function
+
+from collections import namedtuple
+from importlib import import_module
+from importlib.util import find_spec
+import inspect
+import os
+import os.path
+import pkgutil
+
+
+
+###########################################################
+###  Index of the routes of DMP apps
+###
+###  DMP finds views the first time their urls are requested,
+###  so the first hit to each page pays for importing its view
+###  module, checking the decorator, and creating its parameter
+###  converter.  build_route_index() does that up front for
+###  every view in an app's views/ package, plus the templates
+###  in its templates/ directory that have no view module.  The
+###  views are placed in the same caches the router uses, so
+###  requests skip discovery.
+###
+###  Build it at startup with the PRELOAD_ROUTES option, and
+###  print it with:
+###
+###     python3 manage.py dmp_routes
+###
+
+# a route in the index
+IndexedRoute = namedtuple('IndexedRoute', [ 'url', 'app', 'page', 'function', 'module', 'view_type' ])
+
+
+def build_route_index(app_configs):
+    '''
+    Finds the views of the given apps and places them in the router's caches.
+    Returns ( list of IndexedRoute, list of ( name, error message ) for the views
+    that couldn't be loaded ).
+    '''
+    routes = []
+    errors = []
+    for config in app_configs:
+        modules = set()
+        for page, module_name in find_view_modules(config):
+            modules.add(page)
+            try:
+                module = import_module(module_name)
+            except Exception as e:
+                errors.append(( module_name, str(e) ))
+                continue
+            for function in find_view_names(module):
+                add_route(routes, errors, config, page, function)
+        # templates without view modules are rendered directly
+        for page, function in find_template_pages(config):
+            if page not in modules:
+                add_route(routes, errors, config, page, function)
+    return routes, errors
+
+
+def add_route(routes, errors, config, page, function):
+    '''Finds one view (which caches it) and adds it to the list of routes, or its error to the list of errors'''
+    module_name = '.'.join([ config.name, 'views', page.replace('-', '_') ])
+    try:
+        # the shared part of the routing data for the url, which finds (and caches) the view function
+        route = get_route(config.name, page, function)
+    except Exception as e:
+        errors.append(( '{}.{}'.format(module_name, function), str(e) ))
+        return
+    url = '/{}/{}/'.format(config.name, page if function == 'process_request' else '{}.{}'.format(page, function))
+    routes.append(IndexedRoute(url, config.name, page, route.function, route.module, route.view_type))
+
+
+def find_view_modules(config):
+    '''Yields ( page, module name ) for the modules in the views package of the given app'''
+    try:
+        spec = find_spec(config.name + '.views')
+    except ImportError:
+        spec = None
+    if spec is None or not spec.submodule_search_locations:
+        return
+    for info in sorted(pkgutil.iter_modules(spec.submodule_search_locations), key=lambda info: info.name):
+        yield info.name, '{}.views.{}'.format(config.name, info.name)
+
+
+def find_view_names(module):
+    '''Returns the names of the view functions and class-based views defined in the given module'''
+    names = []
+    for name, value in sorted(vars(module).items()):
+        if name.startswith('_'):
+            continue
+        if inspect.isclass(value):
+            # class-based views defined in this module (not the View classes it imports)
+            if issubclass(value, View) and value.__module__ == module.__name__:
+                names.append(name)
+        elif callable(value) and view_function.is_decorated(value):
+            names.append(name)
+    return names
+
+
+def find_template_pages(config):
+    '''Yields ( page, function ) for the .html files in the templates directory of the given app'''
+    template_dir = os.path.join(config.path, 'templates')
+    if not os.path.isdir(template_dir):
+        return
+    for filename in sorted(os.listdir(template_dir)):
+        if filename.endswith('.html') and os.path.isfile(os.path.join(template_dir, filename)):
+            page, _, function = filename[:-len('.html')].partition('.')
+            yield page, function or 'process_request'
+
@@ -1,5 +1,6 @@
 from django import VERSION
 from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ViewDoesNotExist
 from django.http import Http404
 from django.urls import ResolverMatch
@@ -7,11 +8,13 @@ from django.urls.exceptions import Resolver404
 try:
     from django.urls import re_path              # Django 2.x
     from django.urls import URLPattern
+    from django.urls import URLResolver
     from django.urls import include
     from django.urls.resolvers import RegexPattern
 except ImportError:
     from django.conf.urls import url as re_path  # Django 1.x
     from django.urls import RegexURLPattern as URLPattern
+    from django.urls import RegexURLResolver as URLResolver
     from django.conf.urls import include
     RegexPattern = None
 
@@ -46,6 +49,125 @@ def app_resolver(app_name=None, pattern_kwargs=None, name=None):
     return resolver
 
 
+def dmp_resolver(app_names=(), default_app=True):
+    '''
+    Creates a single resolver for the given apps (plus the DEFAULT_APP when default_app
+    is True).  It matches the same urls as a list of app_resolver() patterns, but it
+    resolves a request in one pass rather than trying each app's patterns in turn.
+
+    This function is meant to be called in a project's urls.py (DMP's urls.py uses it).
+    '''
+    resolvers = [ app_resolver(app_name) for app_name in app_names ]
+    if default_app:
+        resolvers.append(app_resolver())
+    return DMPResolver(resolvers)
+
+
+class DMPResolver(URLResolver):
+    '''
+    Resolves the urls of several app_resolver() patterns in one pass.
+
+    The regular resolvers try up to five PagePatterns for each app.  This resolver
+    looks up the app by the first segment of the path (in a dict), picks the one
+    PagePattern that fits the shape of the rest (page, page.function, with or without
+    urlparams), and resolves with it.  The ResolverMatch is the same as from the
+    regular resolvers.  If that fails, it tries the DEFAULT_APP the same way, and if
+    that fails too, it raises Resolver404.  In DEBUG mode, it resolves through the
+    regular patterns instead, so the 404 page shows the patterns that were tried.
+
+    Reversing, and Django's url checks, see the regular app resolvers.
+    '''
+    def __init__(self, app_resolvers):
+        if RegexPattern is not None:
+            super().__init__(RegexPattern(r''), app_resolvers)
+        else:
+            super().__init__(r'', app_resolvers)
+        self.app_resolvers = app_resolvers
+        # app name -> its resolver, and the resolver for the default app (or None)
+        self.app_resolvers_by_name = {}
+        self.default_app_resolver = None
+        for resolver in app_resolvers:
+            app_name = resolver.urlconf_name._app_name
+            if app_name is None:
+                self.default_app_resolver = resolver
+            else:
+                self.app_resolvers_by_name.setdefault(app_name, resolver)
+
+
+    def resolve(self, path):
+        path = str(path)
+        app_name = path.split('/', 1)[0]
+        for resolver in ( self.app_resolvers_by_name.get(app_name), self.default_app_resolver ):
+            if resolver is not None:
+                match = self.resolve_app(resolver, path)
+                if match is not None:
+                    return match
+        # in DEBUG mode, the slow way gives the full list of tried patterns for the 404 page
+        if settings.DEBUG:
+            return super().resolve(path)
+        raise Resolver404({ 'path': path })
+
+
+    def resolve_app(self, resolver, path):
+        '''Resolves the path with the one pattern of the app resolver that fits it, or returns None'''
+        match = resolver.pattern.match(path)
+        if not match:
+            return None
+        new_path, args, kwargs = match
+        pattern = resolver.url_patterns[page_pattern_index(new_path)]
+        try:
+            sub_match = pattern.resolve(new_path)
+        except Resolver404:
+            return None
+        # the same ResolverMatch that Django's resolvers create, through both levels (the app resolver, then this resolver)
+        for parent, child in ( ( resolver, pattern ), ( self, resolver ) ):
+            sub_match_dict = merge_dicts(kwargs, parent.default_kwargs, sub_match.kwargs)
+            route = '' if isinstance(child, URLPattern) else str(child.pattern)
+            if VERSION < (2, 2):
+                sub_match = ResolverMatch(
+                    sub_match.func,
+                    sub_match.args if sub_match_dict else args + sub_match.args,
+                    sub_match_dict,
+                    sub_match.url_name,
+                    [ parent.app_name ] + sub_match.app_names,
+                    [ parent.namespace ] + sub_match.namespaces,
+                )
+            else:
+                sub_match = ResolverMatch(
+                    sub_match.func,
+                    sub_match.args if sub_match_dict else args + sub_match.args,
+                    sub_match_dict,
+                    sub_match.url_name,
+                    [ parent.app_name ] + sub_match.app_names,
+                    [ parent.namespace ] + sub_match.namespaces,
+                    parent._join_route(route, sub_match.route),
+                )
+            # this resolver's pattern is empty, so it adds no args or kwargs
+            args, kwargs = (), {}
+        return sub_match
+
+
+# the order of the patterns in dmp_paths_for_app
+PATTERN_PAGE_FUNCTION_URLPARAMS = 0
+PATTERN_PAGE_FUNCTION = 1
+PATTERN_PAGE_URLPARAMS = 2
+PATTERN_PAGE = 3
+PATTERN_EMPTY = 4
+
+def page_pattern_index(path):
+    '''
+    Returns the index of the pattern in dmp_paths_for_app() that can match the path
+    (the patterns are exclusive, so at most one matches).  Invalid characters aren't
+    checked here; the pattern itself does that.
+    '''
+    if not path:
+        return PATTERN_EMPTY
+    segment, _, urlparams = path.partition('/')
+    if '.' in segment:
+        return PATTERN_PAGE_FUNCTION_URLPARAMS if urlparams else PATTERN_PAGE_FUNCTION
+    return PATTERN_PAGE_URLPARAMS if urlparams else PATTERN_PAGE
+
+
 class URLConf(object):
     '''
     Mimics a urls.py module for an app by holding a list of url patterns.
@@ -178,6 +300,8 @@ class PagePattern(URLPattern):
         def no_op_view(request):
             raise Http404()
         super().__init__(regex, no_op_view, default_args, name=name)
+        # the route string of the ResolverMatch (computed once rather than per request)
+        self.route_str = str(self.pattern) if VERSION >= (2, 2) else None
 
 
     def resolve(self, path):
@@ -210,7 +334,7 @@ class PagePattern(URLPattern):
                         match.kwargs,
                         url_name=match.url_name,
                         app_names=routing_data.app,
-                        route=str(self.pattern),
+                        route=self.route_str,
                     )
             except ViewDoesNotExist as vdne:
                 # we had a pattern match, but we couldn't get a callable using kwargs from the pattern
@@ -1,5 +1,8 @@
+from django.apps import apps
 from django.template import engines
 from django.template import TemplateDoesNotExist
+from django.utils.encoding import force_text
+from django.utils.html import conditional_escape
 from mako.runtime import supports_caller
 
 ###
@@ -40,11 +43,30 @@ def django_include(context, template_name, **kwargs):
 # attaching to `caller_stack` because it's the same object
 # throughout rendering of a template inheritance
 AUTOESCAPE_KEY = '__dmp_autoescape'
+# the expression filter for the current autoescape state (see DMPLexer)
+AUTOESCAPE_FILTER_KEY = '__dmp_autoescape_filter'
 
 def is_autoescape(context):
     return bool(getattr(context.caller_stack, AUTOESCAPE_KEY, True))
 
 
+def escape_text(value):
+    '''Expression filter that html escapes the value (honoring mark_safe)'''
+    return conditional_escape(force_text(value))
+
+
+def plain_text(value):
+    '''Expression filter for expressions that are not escaped'''
+    return force_text(value)
+
+
+def autoescape_filter(escape_on=True):
+    '''Returns the expression filter for the given autoescape state, taking the AUTOESCAPE option into account'''
+    if escape_on and apps.get_app_config('django_mako_plus').options['AUTOESCAPE']:
+        return escape_text
+    return plain_text
+
+
 def _toggle_autoescape(context, escape_on=True):
     '''
     Internal method to toggle autoescaping on or off. This function
@@ -52,11 +74,17 @@ def _toggle_autoescape(context, escape_on=True):
     decorated with @supports_caller.
     '''
     previous = is_autoescape(context)
+    previous_filter = getattr(context.caller_stack, AUTOESCAPE_FILTER_KEY, None)
     setattr(context.caller_stack, AUTOESCAPE_KEY, escape_on)
+    setattr(context.caller_stack, AUTOESCAPE_FILTER_KEY, autoescape_filter(escape_on))
     try:
         context['caller'].body()
     finally:
         setattr(context.caller_stack, AUTOESCAPE_KEY, previous)
+        if previous_filter is None:
+            delattr(context.caller_stack, AUTOESCAPE_FILTER_KEY)
+        else:
+            setattr(context.caller_stack, AUTOESCAPE_FILTER_KEY, previous_filter)
 
 
 @supports_caller
@@ -1,4 +1,7 @@
 from .adapter import MakoTemplateAdapter
 from .loader import MakoTemplateLoader
 from .lexer import ExpressionPostProcessor
-from .util import template_inheritance, create_mako_context
+from .util import template_inheritance, create_mako_context, find_template_files
+from .cache import TEMPLATE_CACHE
+from .stream import flush_point
+from .timing import RENDER_TIMINGS
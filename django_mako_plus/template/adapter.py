@@ -1,6 +1,6 @@
 from django.apps import apps
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.html import mark_safe
 from django.template import Context, RequestContext
 
@@ -8,12 +8,16 @@ from ..exceptions import RedirectException
 from ..signals import dmp_signal_pre_render_template, dmp_signal_post_render_template, dmp_signal_redirect_exception
 from ..util import log
 from .util import get_template_debug
+from .context import LazyProcessors, LazyContextData, render_template
+from .stream import StreamingRender
+from .timing import RENDER_TIMINGS, timing_name
 
 import logging
 import mimetypes
 import os
 import os.path
 import sys
+import time
 
 
 
@@ -28,6 +32,8 @@ class MakoTemplateAdapter(object):
         '''
         self.mako_template = mako_template
         self.def_name = def_name
+        # ( charset, Content-Type header ) for responses with the default content type (see get_content_type)
+        self.default_content_type = ( None, None )
 
     @property
     def engine(self):
@@ -77,6 +83,57 @@ class MakoTemplateAdapter(object):
                template object render.
         '''
         dmp = apps.get_app_config('django_mako_plus')
+        mako_template, render_obj, context, context_dict, def_name = self._prepare_render(dmp, context, request, def_name)
+
+        # PRIMARY FUNCTION: render the template
+        content = self._render_template(render_obj, context_dict, def_name)
+
+        # send the post-render signal
+        if dmp.options['SIGNALS'] and request is not None:
+            for receiver, ret_content in dmp_signal_post_render_template.send(sender=self, request=request, context=context, template=mako_template, content=content):
+                if ret_content is not None:
+                    content = ret_content  # sets it to the last non-None return in the signal receiver chain
+
+        # return
+        return mark_safe(content)
+
+
+    def _render_template(self, render_obj, context_dict, def_name, charset=None):
+        '''Renders a prepared template (see _prepare_render) to a string, or to bytes when charset is given'''
+        if log.isEnabledFor(logging.INFO):
+            log.info('rendering template %s%s%s', self.name, ('::' if def_name else ''), def_name or '')
+        started = time.perf_counter() if RENDER_TIMINGS.enabled else None
+        if settings.DEBUG:
+            try:
+                content = render_template(render_obj, context_dict, charset)
+            except Exception as e:
+                log.exception('exception raised during template rendering: %s', e)  # to the console
+                e.template_debug = get_template_debug('%s%s%s' % (self.name, ('::' if def_name else ''), def_name or ''), e)
+                raise
+        else:
+            # this is outside the above "try" loop because in non-DEBUG mode, we want to let the exception throw out of here (without having to re-raise it)
+            content = render_template(render_obj, context_dict, charset)
+        if started is not None:
+            RENDER_TIMINGS.record(timing_name(self.mako_template.filename, def_name), time.perf_counter() - started, len(content))
+        return content
+
+
+    async def arender(self, context=None, request=None, def_name=None):
+        '''
+        Awaitable version of render() for async views.  Mako renders synchronously (and templates
+        may use the database), so the render runs in Django's thread for sync code.
+        '''
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.render, thread_sensitive=True)(context=context, request=request, def_name=def_name)
+
+
+    def _prepare_render(self, dmp, context, request, def_name):
+        '''
+        Sets up a render: runs the context processors and the pre-render signal.
+        Returns ( mako_template, render_obj, context, context_dict, def_name ).
+        With LAZY_CONTEXT_PROCESSORS, context_dict is a LazyContextData that runs
+        the processors when the template reads their names.
+        '''
         # set up the context dictionary, which is the variables available throughout the template
         context_dict = {}
         # if request is None, add some default items because the context processors won't happen
@@ -86,52 +143,41 @@ class MakoTemplateAdapter(object):
         # let the context_processors add variables to the context.
         if not isinstance(context, Context):
             context = Context(context) if request is None else RequestContext(request, context)
-        with context.bind_template(self):
+        if isinstance(context, RequestContext) and dmp.options['LAZY_CONTEXT_PROCESSORS']:
+            # this is RequestContext.bind_template(), but the processors run when their names are read
+            processors = LazyProcessors(context.request, self.engine.template_context_processors + context._processors, self.engine.fresh_context_processors)
             for d in context:
                 context_dict.update(d)
+            context_dict = LazyContextData(context_dict, processors)
+        else:
+            with context.bind_template(self):
+                for d in context:
+                    context_dict.update(d)
         context_dict.pop('self', None)  # some contexts have self in them, and it messes up render_unicode below because we get two selfs
 
         # send the pre-render signal
+        # (a replacement template is only used for this render because the engine shares adapters between calls)
+        mako_template = self.mako_template
         if dmp.options['SIGNALS'] and request is not None:
-            for receiver, ret_template_obj in dmp_signal_pre_render_template.send(sender=self, request=request, context=context, template=self.mako_template):
+            for receiver, ret_template_obj in dmp_signal_pre_render_template.send(sender=self, request=request, context=context, template=mako_template):
                 if ret_template_obj is not None:
                     if isinstance(ret_template_obj, MakoTemplateAdapter):
-                        self.mako_template = ret_template_obj.mako_template   # if the signal function sends a MakoTemplateAdapter back, use the real mako template inside of it
+                        mako_template = ret_template_obj.mako_template   # if the signal function sends a MakoTemplateAdapter back, use the real mako template inside of it
                     else:
-                        self.mako_template = ret_template_obj                 # if something else, we assume it is a mako.template.Template, so use it as the template
+                        mako_template = ret_template_obj                 # if something else, we assume it is a mako.template.Template, so use it as the template
 
         # do we need to limit down to a specific def?
         # this only finds within the exact template (won't go up the inheritance tree)
-        render_obj = self.mako_template
+        render_obj = mako_template
         if def_name is None:
             def_name = self.def_name
         if def_name:  # do we need to limit to just a def?
-            render_obj = self.mako_template.get_def(def_name)
-
-        # PRIMARY FUNCTION: render the template
-        if log.isEnabledFor(logging.INFO):
-            log.info('rendering template %s%s%s', self.name, ('::' if def_name else ''), def_name or '')
-        if settings.DEBUG:
-            try:
-                content = render_obj.render_unicode(**context_dict)
-            except Exception as e:
-                log.exception('exception raised during template rendering: %s', e)  # to the console
-                e.template_debug = get_template_debug('%s%s%s' % (self.name, ('::' if def_name else ''), def_name or ''), e)
-                raise
-        else:  # this is outside the above "try" loop because in non-DEBUG mode, we want to let the exception throw out of here (without having to re-raise it)
-            content = render_obj.render_unicode(**context_dict)
+            render_obj = mako_template.get_def(def_name)
 
-        # send the post-render signal
-        if dmp.options['SIGNALS'] and request is not None:
-            for receiver, ret_content in dmp_signal_post_render_template.send(sender=self, request=request, context=context, template=self.mako_template, content=content):
-                if ret_content is not None:
-                    content = ret_content  # sets it to the last non-None return in the signal receiver chain
+        return mako_template, render_obj, context, context_dict, def_name
 
-        # return
-        return mark_safe(content)
 
-
-    def render_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None):
+    def render_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None, stream=False):
         '''
         Renders the template and returns an HttpRequest object containing its content.
 
@@ -153,6 +199,9 @@ class MakoTemplateAdapter(object):
             @content_type The MIME type of the response.  Defaults to settings.DEFAULT_CONTENT_TYPE (usually 'text/html').
             @status       The HTTP response status code.  Defaults to 200 (OK).
             @charset      The charset to encode the processed template string (the output) with.  Defaults to settings.DEFAULT_CHARSET (usually 'utf-8').
+            @stream       If True, returns a StreamingHttpResponse that sends the page in encoded chunks while the template renders
+                          (see stream.py).  Exceptions raised before the first chunk (such as redirects at the top of the template)
+                          are handled normally; later exceptions end the response early.
 
         The method triggers two signals:
             1. dmp_signal_pre_render_template: you can (optionally) return a new Mako Template object from a receiver to replace
@@ -161,14 +210,21 @@ class MakoTemplateAdapter(object):
                template object render.
         '''
         try:
-            if content_type is None:
-                content_type = mimetypes.types_map.get(os.path.splitext(self.mako_template.filename)[1].lower(), settings.DEFAULT_CONTENT_TYPE)
             if charset is None:
                 charset = settings.DEFAULT_CHARSET
+            content_type = self.get_content_type(content_type, charset)
             if status is None:
                 status = 200
+            dmp = apps.get_app_config('django_mako_plus')
+            # the post-render signal needs the content as a string, so its receivers get the regular render
+            if not (dmp.options['SIGNALS'] and request is not None and dmp_signal_post_render_template.has_listeners()):
+                if stream:
+                    return self.stream_response(dmp, context, request, def_name, content_type, status, charset)
+                # render to the encoded response body (Mako encodes its buffer, so there is no SafeString copy)
+                mako_template, render_obj, context, context_dict, def_name = self._prepare_render(dmp, context, request, def_name)
+                return HttpResponse(self._render_template(render_obj, context_dict, def_name, charset), content_type=content_type, status=status)
             content = self.render(context=context, request=request, def_name=def_name)
-            return HttpResponse(content.encode(charset), content_type='%s; charset=%s' % (content_type, charset), status=status)
+            return HttpResponse(content.encode(charset), content_type=content_type, status=status)
 
         except RedirectException: # redirect to another page
             e = sys.exc_info()[1]
@@ -182,3 +238,41 @@ class MakoTemplateAdapter(object):
                 dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
             # send the browser the redirect command
             return e.get_response(request)
+
+
+    async def arender_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None, stream=False):
+        '''Awaitable version of render_to_response() for async views (see arender)'''
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.render_to_response, thread_sensitive=True)(context=context, request=request, def_name=def_name, content_type=content_type, status=status, charset=charset, stream=stream)
+
+
+    def get_content_type(self, content_type=None, charset=None):
+        '''
+        Returns the Content-Type header for responses, such as "text/html; charset=utf-8".  When content_type
+        is None, it is guessed from the template file extension.  The default header is computed once per template.
+        '''
+        if content_type is None and charset == self.default_content_type[0]:
+            return self.default_content_type[1]
+        if content_type is None:
+            content_type = settings.DEFAULT_CONTENT_TYPE
+            if self.mako_template.filename:
+                content_type = mimetypes.types_map.get(os.path.splitext(self.mako_template.filename)[1].lower(), content_type)
+            if charset == settings.DEFAULT_CHARSET:
+                self.default_content_type = ( charset, '%s; charset=%s' % (content_type, charset) )
+        return '%s; charset=%s' % (content_type, charset)
+
+
+    def stream_response(self, dmp, context, request, def_name, content_type, status, charset):
+        '''Starts a streaming render of the template and returns it in a StreamingHttpResponse (see render_to_response)'''
+        mako_template, render_obj, context, context_dict, def_name = self._prepare_render(dmp, context, request, def_name)
+        if log.isEnabledFor(logging.INFO):
+            log.info('streaming template %s%s%s', self.name, ('::' if def_name else ''), def_name or '')
+        chunks = StreamingRender(render_obj, context_dict, charset)
+        try:
+            chunks.start()
+        except Exception as e:
+            if settings.DEBUG:
+                log.exception('exception raised during template rendering: %s', e)  # to the console
+                e.template_debug = get_template_debug('%s%s%s' % (self.name, ('::' if def_name else ''), def_name or ''), e)
+            raise
+        return StreamingHttpResponse(chunks, content_type=content_type, status=status)
@@ -0,0 +1,156 @@
+from django.conf import settings
+
+from mako.template import ModuleTemplate
+
+from ..util import log
+from .store import get_fingerprint, MODULE_TEMPLATE_ARGUMENTS
+
+import hashlib
+import marshal
+import os
+import os.path
+import re
+import sys
+import tempfile
+import types
+
+
+
+###########################################################
+###  Single-file bundle of compiled templates
+###
+###  Loading compiled templates one module at a time means
+###  several stat() and open() calls per template, spread
+###  over every app's __dmpcache__ directories.  A bundle
+###  packs the compiled code of all the templates into one
+###  marshalled file, which is read with a single open() the
+###  first time a template is needed.  Build it at deploy
+###  time with:
+###
+###     python3 manage.py dmp_precompile --bundle
+###
+###  Entries are keyed by the template's path (relative to
+###  BASE_DIR), its uri, and the options that change compiled
+###  code.  The template sources aren't hashed, but a template
+###  file that is newer than the bundle file skips the bundle,
+###  so an edited template isn't hidden by a stale bundle
+###  (the bundle isn't used in DEBUG mode).  Templates that
+###  aren't in the bundle are compiled normally.
+###
+
+# the first line of a bundle file
+BUNDLE_HEADER = b'DMP-TEMPLATE-BUNDLE\n'
+
+
+class TemplateBundle(object):
+    '''
+    A bundle file of compiled templates.  The file is read the first time a template
+    is requested.  A missing file, or one written by a different version of Python,
+    is ignored (with a warning) so templates compile as usual.
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        # key -> ( code object, module source ), or None until read
+        self.entries = None
+        # modification time of the bundle file (templates modified after it skip the bundle)
+        self.mtime = None
+
+
+    def load(self):
+        '''Reads the bundle file'''
+        self.entries = {}
+        try:
+            with open(self.path, 'rb') as fin:
+                self.mtime = os.fstat(fin.fileno()).st_mtime
+                data = fin.read()
+        except OSError as e:
+            log.warning('template bundle %s could not be read: %s', self.path, e)
+            return
+        if not data.startswith(BUNDLE_HEADER):
+            log.warning('%s is not a template bundle', self.path)
+            return
+        try:
+            bundle = marshal.loads(data[len(BUNDLE_HEADER):])
+        except (EOFError, ValueError, TypeError) as e:
+            log.warning('template bundle %s is corrupt: %s', self.path, e)
+            return
+        if bundle.get('cache_tag') != sys.implementation.cache_tag:
+            log.warning('template bundle %s was built by a different version of Python (%s)', self.path, bundle.get('cache_tag'))
+            return
+        self.entries = bundle['templates']
+        log.debug('loaded %s templates from bundle %s', len(self.entries), self.path)
+
+
+    def get_template(self, filename, lookup, uri, mtime=None):
+        '''
+        Returns the Mako template for the given file from the bundle, or None if the file isn't in the bundle.
+        When the template's modification time is given, a template newer than the bundle isn't used.
+        '''
+        if self.entries is None:
+            self.load()
+        entry = self.entries.get(get_key(filename, lookup, uri))
+        if entry is None:
+            return None
+        if mtime is not None and self.mtime is not None and mtime > self.mtime:
+            log.info('%s is newer than template bundle %s, so compiling it instead', filename, self.path)
+            return None
+        code, source = entry
+        # the same module name Mako gives a template with this uri
+        module = types.ModuleType(re.sub(r'\W', '_', uri))
+        module.__file__ = code.co_filename
+        exec(code, module.__dict__)
+        return ModuleTemplate(
+            module,
+            template_filename=filename,
+            module_source=source,
+            lookup=lookup,
+            **{ name: lookup.template_args[name] for name in MODULE_TEMPLATE_ARGUMENTS if name in lookup.template_args }
+        )
+
+
+    def __contains__(self, key):
+        if self.entries is None:
+            self.load()
+        return key in self.entries
+
+
+    def __len__(self):
+        if self.entries is None:
+            self.load()
+        return len(self.entries)
+
+
+
+def get_key(filename, lookup, uri):
+    '''Returns the bundle key of a template'''
+    digest = hashlib.sha256()
+    for part in [ os.path.relpath(filename, settings.BASE_DIR) ] + get_fingerprint(filename, lookup, uri):
+        digest.update(part.encode('utf8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def write_bundle(path, templates):
+    '''
+    Writes a bundle file containing the compiled code of the given Mako templates.
+    The file is replaced atomically, so running servers never read a partial bundle.
+    Returns the number of templates written.
+    '''
+    entries = {}
+    for template in templates:
+        source = template.code
+        relpath = os.path.relpath(template.filename, settings.BASE_DIR)
+        code = compile(source, '{}:{}.py'.format(os.path.basename(path), relpath), 'exec')
+        entries[get_key(template.filename, template.lookup, template.uri)] = ( code, source )
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(BUNDLE_HEADER)
+            marshal.dump({ 'cache_tag': sys.implementation.cache_tag, 'templates': entries }, fout)
+        os.replace(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+    return len(entries)
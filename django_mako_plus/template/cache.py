@@ -0,0 +1,428 @@
+from mako.exceptions import TemplateLookupException
+from mako.template import Template, ModuleTemplate
+try:
+    from mako.template import _get_module_info_from_callable   # private to Mako, so it might not exist
+except ImportError:
+    _get_module_info_from_callable = None
+
+from .lexer import DEPENDENCIES_NAME
+from .store import MODULE_TEMPLATE_ARGUMENTS
+
+from collections import OrderedDict
+import os
+import os.path
+import threading
+import time
+
+
+
+###########################################################
+###  Process-wide cache of compiled templates
+###
+###  Each app has several MakoTemplateLoaders (templates,
+###  scripts, styles), and every loader searches TEMPLATES_DIRS
+###  and BASE_DIR.  Left to Mako, each loader's TemplateLookup
+###  compiles and keeps its own copy of a shared template like
+###  base.htm.  DMPTemplateLookup sends all loads through this
+###  cache instead, so each template file is compiled and held
+###  in memory once per process.
+###
+###  Relative <%inherit>, <%include>, and <%namespace> paths are
+###  resolved through the template's lookup and uri, so a lookup
+###  with other directories (another app's loader) gets its own
+###  Template object.  It shares the compiled module when the uri
+###  is the same, so it costs no compile.
+###
+###  The cache also keeps the dependency graph of the templates
+###  (<%inherit>, <%include>, and <%namespace> tags, recorded
+###  by DMPLexer).  Invalidating a template also invalidates
+###  the templates that depend on it, so anything derived from
+###  a whole chain (such as provider caches kept on template
+###  objects) is rebuilt.
+###
+
+class CompiledTemplateCache(object):
+    '''
+    A least-recently-used cache of compiled Mako templates, keyed by the absolute path
+    of the template file.
+
+    Each entry holds a template per variant: the directories of the requesting lookup
+    and the uri it was requested by.  Relative <%inherit>, <%include>, and <%namespace>
+    paths resolve through the template's lookup and uri, so they resolve the same way
+    they would in a lookup of its own.  Variants with the same uri share one compiled
+    module; the first variant of a file compiles it (or loads it from the module directory).
+
+    The cache is bounded by max_size (number of templates) and max_bytes (approximate
+    size, measured as the length of each template's generated Python source).  Either
+    can be None for no limit.  When over budget, the least recently used templates are
+    evicted.  The hit/miss counters are not locked, so they are approximate when many
+    threads render at once.
+    '''
+    def __init__(self, max_size=None, max_bytes=None):
+        # filename -> [ { variant: template }, source mtime when loaded, approximate bytes ]
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # filename -> ( ( kind, dependency filename ), ... ) and the reverse: filename -> set of dependent filenames
+        self.dependencies = {}
+        self.dependents = {}
+        # when set (see watcher.py), it is told about each loaded file so it can invalidate it on changes
+        self.watcher = None
+        # when set (see store.py), templates are compiled into and loaded from this content-addressed store
+        self.store = None
+        # when set (see bundle.py), templates are loaded from this single-file bundle when it has them
+        self.bundle = None
+        # functions called with the filename when a file leaves the cache (within the lock), such as the engine's adapter cache
+        self.listeners = []
+        self.reset_stats()
+
+
+    def configure(self, max_size=None, max_bytes=None):
+        '''Sets the budget of the cache (called from the DMP app's ready())'''
+        with self.lock:
+            self.max_size = max_size
+            self.max_bytes = max_bytes
+            self._evict()
+
+
+    def get_template(self, filename, lookup, uri):
+        '''
+        Returns the compiled template for the given filename, compiling it if needed.
+        The lookup and uri are used when the template needs to be (re)compiled.
+
+        When lookup.filesystem_checks is True (DEBUG mode without a TEMPLATE_WATCHER),
+        the file is checked for changes and is reloaded when it has been modified.
+        '''
+        try:
+            variants, mtime, size = self.entries[filename]
+            template = variants[( lookup_directories(lookup), uri )]
+        except KeyError:
+            self.misses += 1
+            return self.load(filename, lookup, uri)
+        self.hits += 1
+        with self.lock:
+            try:
+                self.entries.move_to_end(filename)
+            except KeyError:
+                pass  # evicted by another thread since we got it
+        if lookup.filesystem_checks:
+            try:
+                if os.stat(filename).st_mtime != mtime:
+                    return self.load(filename, lookup, uri, reload=True)
+            except OSError as e:
+                self.invalidate(filename)
+                raise TemplateLookupException("Can't locate template for uri {!r}".format(uri)) from e
+        return template
+
+
+    def load(self, filename, lookup, uri, reload=False):
+        '''Compiles (or loads from the module directory) the template and places it in the cache.'''
+        variant = ( lookup_directories(lookup), uri )
+        with self.lock:
+            # another thread may have loaded it while we waited on the lock
+            entry = self.entries.get(filename)
+            try:
+                mtime = os.stat(filename).st_mtime
+            except OSError as e:
+                self._remove(filename)
+                raise TemplateLookupException("Can't locate template for uri {!r}".format(uri)) from e
+            if entry is not None and (not reload or entry[1] == mtime):
+                template = entry[0].get(variant)
+                if template is None:
+                    # another lookup (or uri) has the file, so add a variant for this one
+                    template = self.add_variant(entry, filename, lookup, uri, mtime)
+                    entry[0][variant] = template
+                    self._add_dependencies(filename, self.resolve_dependencies(template), merge=True)
+                    self._evict()
+                return template
+            # a changed file also invalidates its dependents
+            self._remove(filename, dependents=entry is not None)
+            template = self.compile(filename, lookup, uri, mtime)
+            size = template_size(template)
+            self.entries[filename] = [ { variant: template }, mtime, size ]
+            self.total_bytes += size
+            self._add_dependencies(filename, self.resolve_dependencies(template))
+            self._evict()
+            if self.watcher is not None:
+                self.watcher.watch(filename)
+            return template
+
+
+    def compile(self, filename, lookup, uri, mtime=None):
+        '''
+        Compiles (or loads from the bundle, store, or module directory) a template (must be called within the lock).
+        A template file modified after the bundle (per mtime, the file's modification time) skips the bundle.
+        '''
+        started = time.time()
+        try:
+            template = None
+            if self.bundle is not None:
+                template = self.bundle.get_template(filename, lookup, uri, mtime)
+            if template is None and self.store is not None:
+                template = self.store.get_template(filename, lookup, uri)
+            if template is None:
+                template = Template(
+                    uri=uri,
+                    filename=filename,
+                    lookup=lookup,
+                    module_filename=lookup.modulename_callable(filename, uri) if lookup.modulename_callable is not None else None,
+                    **lookup.template_args
+                )
+        except:
+            # ensure a failed template isn't left in the cache
+            self._remove(filename)
+            raise
+        # Mako stamps the module when it generates it, so an older stamp means it came from the module directory
+        if getattr(template.module, '_modified_time', started) >= started:
+            self.compiles += 1
+        return template
+
+
+    def add_variant(self, entry, filename, lookup, uri, mtime=None):
+        '''
+        Creates the template of a file for another lookup or uri (must be called within the lock).
+        A variant with the same uri shares the compiled module; another uri is compiled on its own.
+        '''
+        for ( directories, variant_uri ), template in entry[0].items():
+            if variant_uri == uri:
+                info = getattr(template, '_mmarker', None)   # Mako's ModuleInfo of the template, if available
+                return ModuleTemplate(
+                    template.module,
+                    module_filename=getattr(info, 'module_filename', None),
+                    module_source=getattr(info, 'module_source', None),
+                    template_filename=filename,
+                    lookup=lookup,
+                    **{ name: lookup.template_args[name] for name in MODULE_TEMPLATE_ARGUMENTS if name in lookup.template_args }
+                )
+        template = self.compile(filename, lookup, uri, mtime)
+        size = template_size(template)
+        entry[2] += size
+        self.total_bytes += size
+        return template
+
+
+    def is_current(self, template, check_file=False):
+        '''
+        Returns whether the given template is still the one the cache holds for its file and lookup,
+        without counting a hit.  If check_file is True, the file is also checked for changes.
+        '''
+        entry = self.entries.get(template.filename)
+        if entry is None or entry[0].get(( lookup_directories(template.lookup), template.uri )) is not template:
+            return False
+        if check_file:
+            try:
+                return os.stat(template.filename).st_mtime == entry[1]
+            except OSError:
+                return False
+        return True
+
+
+    def invalidate(self, filename=None):
+        '''
+        Removes the given template file, along with the templates that depend on it,
+        from the cache.  They are reloaded the next time they are requested.  If filename
+        is None, the entire cache is cleared.
+        '''
+        with self.lock:
+            if filename is None:
+                for filename in list(self.entries):
+                    self._removed(filename)
+                self.entries.clear()
+                self.dependencies.clear()
+                self.dependents.clear()
+                self.total_bytes = 0
+            else:
+                self._remove(os.path.abspath(filename), dependents=True)
+
+
+    def resolve_dependencies(self, template):
+        '''
+        Returns the dependencies recorded in the compiled template, with each uri resolved
+        to an absolute filename through the template's lookup: ( ( kind, filename ), ... ).
+        The filename is None when the uri is an expression or can't be found.  Returns None
+        when the template has no recorded dependencies (such as a template compiled before
+        DMP recorded them; run dmp_cleanup to recompile).
+        '''
+        recorded = getattr(template.module, DEPENDENCIES_NAME, None)
+        if recorded is None:
+            return None
+        dependencies = []
+        for kind, uri in recorded:
+            dep_filename = None
+            if uri is not None and hasattr(template.lookup, 'find_template_file'):
+                try:
+                    dep_filename = template.lookup.find_template_file(template.lookup.adjust_uri(uri, template.uri))
+                except TemplateLookupException:
+                    pass
+            dependencies.append(( kind, dep_filename ))
+        return tuple(dependencies)
+
+
+    def get_dependencies(self, filename):
+        '''Returns the resolved dependencies of the given (cached) template file, or None if not known'''
+        return self.dependencies.get(os.path.abspath(filename))
+
+
+    def get_dependents(self, filename):
+        '''Returns the set of cached template files that depend on the given file, directly or indirectly'''
+        filename = os.path.abspath(filename)
+        found = set()
+        with self.lock:
+            pending = [ filename ]
+            while pending:
+                for dependent in self.dependents.get(pending.pop(), ()):
+                    if dependent not in found and dependent != filename:
+                        found.add(dependent)
+                        pending.append(dependent)
+        return found
+
+
+    def get_inheritance(self, template):
+        '''
+        Returns the inheritance chain of the template, from the template to its furthest
+        ancestor, using the <%inherit> tags recorded at compile time.  Unlike building a Mako
+        context, this is only a few lookups.  Returns None when the chain can't be known
+        statically (an inherit file is an expression, or a template has no recorded dependencies).
+        '''
+        chain = []
+        while True:
+            chain.append(template)
+            recorded = getattr(template.module, DEPENDENCIES_NAME, None)
+            if recorded is None or template.lookup is None:
+                return None
+            inherits = [ uri for kind, uri in recorded if kind == 'inherit' ]
+            if not inherits:
+                return chain
+            if inherits[-1] is None:  # like Mako, the last <%inherit> wins
+                return None
+            template = template.lookup.get_template(template.lookup.adjust_uri(inherits[-1], template.uri))
+
+
+    def get_stats(self):
+        '''
+        Returns a dict of statistics for sizing the cache:
+            hits        Requests for a template that was in the cache.
+            misses      Requests for a template that was not in the cache.
+            evictions   Templates removed to stay within the budget.
+            compiles    Templates generated from source (the rest of the misses were loaded
+                        from already-generated modules in TEMPLATES_CACHE_DIR or COMPILED_TEMPLATES_DIR).
+            size        Templates currently in the cache.
+            bytes       Approximate size of the templates currently in the cache.
+            max_size    The count budget (None is unlimited).
+            max_bytes   The byte budget (None is unlimited).
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'compiles': self.compiles,
+            'size': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_size': self.max_size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+    def reset_stats(self):
+        '''Resets the hit, miss, eviction, and compile counters to zero'''
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compiles = 0
+
+
+    def _remove(self, filename, dependents=False):
+        '''Removes an entry, and optionally the entries that depend on it (must be called within the lock)'''
+        filenames = [ filename ]
+        if dependents:
+            filenames.extend(self.get_dependents(filename))
+        for filename in filenames:
+            entry = self.entries.pop(filename, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+                self._removed(filename)
+            self._add_dependencies(filename, None)
+
+
+    def _removed(self, filename):
+        '''Tells the listeners that a file left the cache (must be called within the lock)'''
+        for listener in self.listeners:
+            listener(filename)
+
+
+    def _add_dependencies(self, filename, dependencies, merge=False):
+        '''
+        Replaces the dependencies of filename in the graph (must be called within the lock).
+        If merge is True, the dependencies are added to the existing ones (another variant of the file).
+        '''
+        if merge:
+            existing = self.dependencies.get(filename)
+            if existing is None or dependencies is None:
+                return
+            dependencies = existing + tuple( dep for dep in dependencies if dep not in existing )
+        for kind, dep_filename in self.dependencies.pop(filename, ()):
+            dependents = self.dependents.get(dep_filename)
+            if dependents is not None:
+                dependents.discard(filename)
+                if not dependents:
+                    del self.dependents[dep_filename]
+        if dependencies is not None:
+            self.dependencies[filename] = dependencies
+            for kind, dep_filename in dependencies:
+                if dep_filename is not None:
+                    self.dependents.setdefault(dep_filename, set()).add(filename)
+
+
+    def _evict(self):
+        '''Removes the least recently used templates until within budget (must be called within the lock)'''
+        # the most recent template always stays, even if it alone is over budget
+        while len(self.entries) > 1 and (
+                (self.max_size is not None and len(self.entries) > self.max_size) or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            filename, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry[2]
+            self._removed(filename)
+            self._add_dependencies(filename, None)
+            self.evictions += 1
+
+
+    def __contains__(self, filename):
+        return os.path.abspath(filename) in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+
+def lookup_directories(lookup):
+    '''Returns the search directories of a lookup as a tuple (DMPTemplateLookup keeps it, so this is usually an attribute read)'''
+    try:
+        return lookup.directory_key
+    except AttributeError:
+        return tuple(getattr(lookup, 'directories', ()))
+
+
+def template_size(template):
+    '''Returns the approximate memory size of a template: the length of its generated Python source'''
+    try:
+        if _get_module_info_from_callable is not None:
+            info = _get_module_info_from_callable(template.callable_)
+            if info.module_source is not None:
+                return len(info.module_source)
+            if info.module_filename is not None:
+                return os.path.getsize(info.module_filename)
+        # without Mako's module info, the module file (if any) is the next best measure
+        module_filename = getattr(template.module, '__file__', None)
+        if module_filename is not None:
+            return os.path.getsize(module_filename)
+    except (AttributeError, KeyError, OSError):
+        pass
+    return 0
+
+
+
+# the singleton cache for this process (sized in the DMP app's ready())
+TEMPLATE_CACHE = CompiledTemplateCache()
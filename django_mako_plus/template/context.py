@@ -0,0 +1,223 @@
+from mako import runtime, util
+
+import builtins
+
+
+###########################################################
+###  Lazy context processors
+###
+###  Django's RequestContext runs every context processor
+###  when a template is bound, even when the template never
+###  reads `user`, `messages`, or `sql_queries`.  With
+###  LAZY_CONTEXT_PROCESSORS, DMP instead gives Mako a
+###  LazyContextData: a dict of the view's context that runs
+###  a processor the first time the template reads one of its
+###  names.  Each processor runs at most once per render.
+###
+###  The names a processor provides are learned the first time
+###  it runs (each processor runs normally on its first render
+###  in the process).  If a template reads a name that isn't
+###  known, all remaining processors run before the name is
+###  reported missing, so processors that only sometimes return
+###  a name still work.  Listing context.keys() doesn't run the
+###  processors, so the jscontext provider stays lazy.  It only
+###  lists the names of processors that have already run in the
+###  request (a processor may not return the same names every
+###  time), so context[name] works for every listed name.
+###
+###  Processor output is also kept on the request, so the
+###  partials, includes, and emails rendered during one
+###  request reuse it.  Processors in FRESH_CONTEXT_PROCESSORS
+###  run again for each render.
+###
+
+# processor -> frozenset of names it has returned
+PROCESSOR_NAMES = {}
+
+# marks a missing value
+MISSING = object()
+
+# the request attribute that keeps processor output between the renders of a request
+REQUEST_ATTRIBUTE = '_dmp_context_processor_outputs'
+
+
+class LazyProcessors(object):
+    '''
+    The context processors of one render, each run at most once.  Output is reused
+    from earlier renders of the request, except for the processors in `fresh`.
+    '''
+    def __init__(self, request, processors, fresh=()):
+        self.request = request
+        self.processors = tuple(processors)
+        self.fresh = fresh
+        # processor -> its output, for the processors that have run in this render
+        self.outputs = {}
+        # processor -> its output, for the processors that have run in this request
+        self.request_outputs = getattr(request, REQUEST_ATTRIBUTE, None)
+        if self.request_outputs is None:
+            self.request_outputs = {}
+            setattr(request, REQUEST_ATTRIBUTE, self.request_outputs)
+        # name -> the processor that provides it (later processors override earlier ones, like RequestContext)
+        self.names = {}
+        for processor in self.processors:
+            names = PROCESSOR_NAMES.get(processor)
+            if names is None:
+                names = self.run(processor).keys()
+            for name in names:
+                self.names[name] = processor
+
+
+    def run(self, processor):
+        '''Runs the processor (if it hasn't run yet in this render or request) and returns its output'''
+        try:
+            return self.outputs[processor]
+        except KeyError:
+            pass
+        if processor in self.fresh:
+            output = processor(self.request)
+        else:
+            try:
+                output = self.request_outputs[processor]
+            except KeyError:
+                output = self.request_outputs[processor] = processor(self.request)
+        self.outputs[processor] = output
+        known = PROCESSOR_NAMES.get(processor)
+        if known is None or not known.issuperset(output):
+            PROCESSOR_NAMES[processor] = frozenset(output).union(known or ())
+        return output
+
+
+    def provides(self, name):
+        '''
+        Returns True if a processor that has already run (in this render, or earlier in the request)
+        returned the name.  This doesn't run processors.
+        '''
+        processor = self.names.get(name)
+        if processor is None:
+            return False
+        output = self.outputs.get(processor)
+        if output is None and processor not in self.fresh:
+            output = self.request_outputs.get(processor, ())
+        return name in (output or ())
+
+
+    def get(self, name):
+        '''Returns the value of a name provided by the processors, or MISSING'''
+        processor = self.names.get(name)
+        if processor is not None:
+            value = self.run(processor).get(name, MISSING)
+            if value is not MISSING:
+                return value
+        # an unknown name (that isn't a Python builtin) might come from a processor that hasn't run
+        if name in builtins.__dict__ or len(self.outputs) == len(self.processors):
+            return MISSING
+        return self.get_all().get(name, MISSING)
+
+
+    def get_all(self):
+        '''Runs all the processors and returns their combined output'''
+        combined = {}
+        for processor in self.processors:
+            combined.update(self.run(processor))
+        return combined
+
+
+
+class LazyContextData(dict):
+    '''
+    The dict of a Mako context (Context._data) that gets missing names from the
+    context processors.  Copies (Mako copies the dict for defs, blocks, and
+    namespaces) share the processors, so each processor runs once per render.
+    Listing the items or values runs all the processors.
+    '''
+    def __init__(self, data, processors):
+        super().__init__(data)
+        self.processors = processors
+
+    def __missing__(self, key):
+        value = self.processors.get(key)
+        if value is MISSING:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self.processors.get(key) is not MISSING
+
+    def resolve_all(self):
+        '''Adds the output of all the processors (the view's context takes precedence)'''
+        for key, value in self.processors.get_all().items():
+            self.setdefault(key, value)
+
+    def keys(self):
+        '''
+        The current names plus the names returned by the processors that have run, without running
+        the others (so scans for marked keys, like jscontext, stay lazy).  A processor's names aren't
+        listed until it runs, since it might not return them this time.
+        '''
+        keys = dict.fromkeys(dict.keys(self))
+        for name in self.processors.names:
+            if name not in keys and self.processors.provides(name):
+                keys[name] = None
+        return keys.keys()
+
+    def values(self):
+        self.resolve_all()
+        return super().values()
+
+    def items(self):
+        self.resolve_all()
+        return super().items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def copy(self):
+        return LazyContextData(self.current(), self.processors)
+
+    def current(self):
+        '''Returns a plain dict of the current items (without running the processors)'''
+        return dict(dict.items(self))
+
+
+
+def render_template(template, data, encoding=None):
+    '''
+    Renders a Mako template (or DefTemplate) with the given data, which can be a
+    LazyContextData.  This is Mako's template.render_unicode(**data), but it keeps
+    the lazy dict in the context.  When encoding is given, the output is encoded
+    bytes.  Mako's buffer still joins the chunks into one string before encoding
+    it, so this only saves the SafeString copy of a regular render.
+    '''
+    context = create_context(util.FastEncodingBuffer(encoding=encoding), template, data)
+    runtime._render_context(template, template.callable_, context, **kwargs_for_callable(template.callable_, data))
+    return context._pop_buffer().getvalue()
+
+
+def create_context(buf, template, data):
+    '''Creates the Mako context for rendering the template to buf with the given data'''
+    # the current items of a lazy dict (without running its processors)
+    context = runtime.Context(buf, **(data.current() if isinstance(data, LazyContextData) else data))
+    context._outputting_as_unicode = True
+    context._set_with_template(template)
+    if isinstance(data, LazyContextData):
+        data.update(context._data)   # capture and caller
+        context._data = data
+    return context
+
+
+def kwargs_for_callable(callable_, data):
+    '''Returns the keyword arguments for the template callable (pages take everything in **pageargs)'''
+    kwargs = runtime._kwargs_for_callable(callable_, data)
+    if isinstance(kwargs, LazyContextData):
+        return kwargs.current()
+    return kwargs
@@ -0,0 +1,140 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import translation
+
+from mako.cache import CacheImpl, register_plugin
+
+import hashlib
+import os
+
+
+###########################################################
+###  Fragment caching with Django's cache framework
+###
+###  Mako caches the output of blocks and defs marked with
+###  cached="True" through a cache plugin.  DMP registers this
+###  plugin on its template lookups, so the output is stored in
+###  one of the caches in settings.CACHES:
+###
+###     <%block name="navigation" cached="True" cache_timeout="600" cache_vary="user, language">
+###         ...
+###     </%block>
+###
+###  Attributes (all optional):
+###     cache_timeout   Seconds to keep the output (defaults to FRAGMENT_CACHE_TIMEOUT).
+###     cache_vary      Comma-separated names the output varies on: context variables,
+###                     plus "user" (the request user's id) and "language" (the active
+###                     language).
+###     cache_backend   The alias of the Django cache (defaults to FRAGMENT_CACHE).
+###     cache_key       The Mako key of the fragment (defaults to the block/def name).
+###
+###  Keys include the template's app-relative path and a hash of
+###  its source, so servers running the same code share fragments,
+###  and changing a template starts its fragments fresh.
+###
+###  This plugin is opt-in: set FRAGMENT_CACHE to a cache alias.
+###  When it is None (the default), Mako's own cache (Beaker) is used.
+###
+
+# the name of the plugin in Mako
+PLUGIN_NAME = 'django_mako_plus'
+
+# stands for the anonymous user in keys
+ANONYMOUS = 'anonymous'
+
+
+class DjangoCacheImpl(CacheImpl):
+    '''A Mako cache implementation that stores values in a Django cache'''
+    pass_context = True
+
+    def __init__(self, cache):
+        super().__init__(cache)
+        # the part of the keys that identifies the template (Mako creates an impl per template object)
+        self.template_key = template_key(cache.template, cache.id)
+
+
+    def get_or_create(self, key, creation_function, context=None, **kw):
+        backend, cache_key, timeout = self.get_cache_key(key, context, **kw)
+        value = backend.get(cache_key)
+        if value is None:
+            value = creation_function()
+            backend.set(cache_key, value, timeout)
+        return value
+
+
+    def set(self, key, value, **kw):
+        backend, cache_key, timeout = self.get_cache_key(key, kw.pop('context', None), **kw)
+        backend.set(cache_key, value, timeout)
+
+
+    def get(self, key, **kw):
+        backend, cache_key, timeout = self.get_cache_key(key, kw.pop('context', None), **kw)
+        return backend.get(cache_key)
+
+
+    def invalidate(self, key, **kw):
+        '''Invalidates a value.  Without a context, only the value with empty vary values is invalidated.'''
+        backend, cache_key, timeout = self.get_cache_key(key, kw.pop('context', None), **kw)
+        backend.delete(cache_key)
+
+
+    def get_cache_key(self, key, context=None, timeout=None, vary=None, backend=None, **kw):
+        '''Returns ( Django cache, key, timeout ) for the given Mako key and cache attributes'''
+        dmp = apps.get_app_config('django_mako_plus')
+        parts = [
+            self.template_key,
+            str(key),
+        ]
+        if isinstance(vary, str):
+            vary = vary.split(',')
+        for name in vary or ():
+            name = name.strip()
+            if name:
+                parts.append('{}={}'.format(name, vary_value(name, context)))
+        cache_key = 'dmp-fragment-' + hashlib.md5('\n'.join(parts).encode('utf8')).hexdigest()
+        if timeout is None:
+            timeout = dmp.options['FRAGMENT_CACHE_TIMEOUT']
+        return caches[backend or dmp.options['FRAGMENT_CACHE']], cache_key, timeout
+
+
+def template_key(template, default_id):
+    '''
+    Returns the path of the template relative to its app (or the project), plus a hash of its source.
+    Unlike the absolute filename, this is the same on every server running the same code.
+    '''
+    filename = template.filename
+    name = template.uri or default_id
+    if filename:
+        filename = os.path.abspath(filename)
+        roots = [ ( config.name, config.path ) for config in apps.get_app_configs() ]
+        roots.append(( '', settings.BASE_DIR ))
+        for label, path in roots:
+            if path and filename.startswith(os.path.join(path, '')):
+                name = '{}:{}'.format(label, os.path.relpath(filename, path).replace(os.sep, '/'))
+                break
+    try:
+        source = template.source
+    except Exception:
+        source = ''  # the template isn't available to hash (such as a compiled module without its file)
+    if isinstance(source, str):
+        source = source.encode('utf8')
+    return '{}#{}'.format(name, hashlib.md5(source).hexdigest())
+
+
+def vary_value(name, context):
+    '''Returns the value of a cache_vary name for the current render'''
+    if name == 'language':
+        return translation.get_language()
+    if context is None:
+        return ''
+    if name == 'user':
+        user = getattr(context.get('request'), 'user', None)
+        if user is None or not user.is_authenticated:
+            return ANONYMOUS
+        return user.pk
+    return context.get(name)
+
+
+# make the plugin available by name to Mako
+register_plugin(PLUGIN_NAME, __name__, DjangoCacheImpl.__name__)
@@ -6,7 +6,9 @@ from mako.lexer import Lexer
 from mako import parsetree, ast
 
 from ..util import log
-from ..tags import is_autoescape
+from ..tags import is_autoescape, AUTOESCAPE_FILTER_KEY
+from .minify import HtmlMinifier, is_minified
+from .timing import timing_name
 
 
 ###########################################################
@@ -18,22 +20,120 @@ from ..tags import is_autoescape
 ###  Django autoescapes by default, while Mako does not.
 ###  DMP injects autoescaping to be consistent with Django.
 ###
+###  The escaping is resolved when the template is compiled
+###  where possible, so rendering an expression is a single
+###  function call:
+###     ${ x | n }          _dmp_plain (no escaping)
+###     ${ x } within <%dmp:autoescape_off> or <%dmp:autoescape_on>
+###                         _dmp_plain or _dmp_escape
+###     ${ x }              the filter set by an enclosing autoescape tag
+###                         at runtime (possibly in another template),
+###                         or else _dmp_escape
+###  _dmp_escape and _dmp_plain are module-level names in the compiled
+###  template.  _dmp_escape is set when the module loads, using the
+###  AUTOESCAPE option.
+###
 
 MAKO_ESCAPE_REPLACEMENTS = {
     'h': 'django.utils.html.escape',  # uses Django's escape rather than Mako's, which works better with marks
 }
 
+# tags that reference other template files
+DEPENDENCY_TAGS = ( 'inherit', 'include', 'namespace' )
+
+# name of the module-level variable that holds the dependencies in compiled templates
+DEPENDENCIES_NAME = '_dmp_dependencies'
+
+# module-level code in compiled templates that sets up the expression filters
+EXPRESSION_FILTERS_CODE = '''
+_dmp_escape = django_mako_plus.tags.autoescape_filter()
+_dmp_plain = django_mako_plus.tags.plain_text
+_dmp_getattr = getattr
+'''
+
+# the expression filter when the autoescape state can only be known at render time
+# (module-level names are used because Mako looks up other names, even builtins, in the context)
+RUNTIME_AUTOESCAPE_FILTER = "_dmp_getattr(context.caller_stack, '{}', _dmp_escape)".format(AUTOESCAPE_FILTER_KEY)
+
+# the calls around the bodies of blocks and defs when timing renders (see timing.py)
+TIMER_START_CODE = '_dmp_timer = django_mako_plus.template.timing.block_start(context)\n'
+TIMER_END_CODE = 'django_mako_plus.template.timing.block_end(context, {!r}, _dmp_timer)\n'
+
+# the DMP tag module and its autoescape tags (which toggle escaping within their bodies)
+TAGS_MODULE = 'django_mako_plus.tags'
+AUTOESCAPE_TAGS = {
+    'autoescape_on': '_dmp_escape',
+    'autoescape_off': '_dmp_plain',
+}
+
 class DMPLexer(Lexer):
     '''
     Subclass of Mako's Lexer, which is used during compilation of
-    templates.  This subclass injects ExpressionPostProcessor
+    templates.  This subclass injects the autoescape filter
     as the final filter on every expression.  Overriding append_node()
     is a hack, but it's the only way I can find to hook into Mako's
     compile process without modifying Mako directly.
+
+    When STREAM_FLUSH_POINTS is on, the lexer adds a call to flush_point() at
+    the start of each <%block>, which sends the output so far during streaming
+    renders (see stream.py).
+
+    The lexer also records the files referenced by <%inherit>, <%include>,
+    and <%namespace> tags, and it writes them into the compiled module as
+    _dmp_dependencies = ( ( 'inherit', 'base.htm' ), ... ).  The uri is None
+    when the file attribute is an expression.  Since it is part of the module,
+    it is available even when the template is loaded from TEMPLATES_CACHE_DIR.
+
+    When minification is on (see minify.py), the text of the template is
+    minified before Mako generates code.  When RENDER_TIMING is on, the body of
+    each <%block> and <%def> is wrapped with timer calls (see timing.py).
     '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependencies = []
+        # whether blocks start with a flush point (decided when compiling, so other renders don't pay for it)
+        self.flush_points = apps.get_app_config('django_mako_plus').options['STREAM_FLUSH_POINTS']
+        # names of <%namespace> tags bound to DMP's tag module
+        self.tag_namespaces = set()
+        # the minify attribute of <%page>, if any
+        self.page_minify = None
+
+    def parse(self):
+        template = super().parse()
+        if is_minified(self.filename, self.page_minify):
+            minifier = HtmlMinifier()
+            minifier.minify_nodes(template.nodes)
+            log.debug('minified %s by %s characters', self.filename, minifier.saved)
+        if apps.get_app_config('django_mako_plus').options['RENDER_TIMING']:
+            self.add_timers(template.nodes)
+        template.nodes.append(parsetree.Code(
+            '{} = {!r}\n'.format(DEPENDENCIES_NAME, tuple(self.dependencies)) + EXPRESSION_FILTERS_CODE,
+            True,  # module-level
+            source=self.text,
+            lineno=self.matched_lineno,
+            pos=self.matched_charpos,
+            filename=self.filename,
+        ))
+        return template
+
     def append_node(self, nodecls, *args, **kwargs):
         # fyi, this method runs on template compilation (not on template render)
-        if nodecls == parsetree.Expression:
+        if nodecls == parsetree.Tag and args[0] == 'page' and 'minify' in args[1]:
+            # <%page minify="True"/> is ours, so take it out before Mako checks the attributes
+            attributes = dict(args[1])
+            self.page_minify = attributes.pop('minify')
+            args = args[:1] + (attributes,) + args[2:]
+
+        if nodecls == parsetree.Tag and args[0] == 'namespace' and args[1].get('module') == TAGS_MODULE and 'name' in args[1]:
+            # remember the names of DMP's tag module so the autoescape tags can be found
+            self.tag_namespaces.add(args[1]['name'])
+
+        if nodecls == parsetree.Tag and args[0] in DEPENDENCY_TAGS and 'file' in args[1]:
+            # args are the keyword and the attributes dict
+            uri = args[1]['file']
+            self.dependencies.append(( args[0], None if '${' in uri else uri ))
+
+        elif nodecls == parsetree.Expression:
             # when an Expression, args[1] is a comma-separated string of filters
             # parse the filters and make any DMP replacements for them
             try:
@@ -42,19 +142,41 @@ class DMPLexer(Lexer):
             except Exception as e:
                 log.warning('An error occurred when compiling the filters on an expression; allowing through so Mako can handle it (%s)', e)
                 filters = []
-            extra = {}  # extra info sent to the expression processor
-
-            # if we have the 'n' filter, send that to the expression processor
-            if 'n' in filters:
-                extra['n_filter_on'] = True
-
-            # add the expression processor as the last filter to be run
+            # add the autoescape filter as the last filter to be run
             # then recreate the args tuple
-            filters.append('django_mako_plus.ExpressionPostProcessor(self' + \
-                           (", extra={}".format(extra) if len(extra) > 0 else '') + \
-                           ')')
+            filters.append(self.autoescape_filter(filters))
             args = args[:1] + (','.join(filters),) + args[2:]
-        return super().append_node(nodecls, *args, **kwargs)
+        super().append_node(nodecls, *args, **kwargs)
+        if self.flush_points and nodecls == parsetree.Tag and args[0] == 'block':
+            # the new block is now the current tag, so this goes inside it
+            super().append_node(parsetree.Code, 'django_mako_plus.flush_point(context)\n', False)
+
+    def add_timers(self, nodes):
+        '''Adds timer calls to the top and bottom of the bodies of the blocks and defs in the nodes (recursively)'''
+        for node in nodes:
+            if not isinstance(node, parsetree.Tag):
+                continue
+            self.add_timers(node.nodes)
+            if isinstance(node, (parsetree.DefTag, parsetree.BlockTag)):
+                name = timing_name(self.filename, node.funcname)
+                kwargs = { 'source': self.text, 'lineno': node.lineno, 'pos': node.pos, 'filename': self.filename }
+                node.nodes.insert(0, parsetree.Code(TIMER_START_CODE, False, **kwargs))
+                node.nodes.append(parsetree.Code(TIMER_END_CODE.format(name), False, **kwargs))
+
+    def autoescape_filter(self, filters):
+        '''Returns the final filter for an expression with the given filters (see the top of this file)'''
+        # the 'n' filter turns off our normal html escaping
+        if 'n' in filters:
+            return '_dmp_plain'
+        # the innermost autoescape tag around the expression (stopping at defs and blocks, which can be called from elsewhere)
+        for tag in reversed(self.tag):
+            if isinstance(tag, (parsetree.DefTag, parsetree.BlockTag)):
+                break
+            if isinstance(tag, parsetree.CallNamespaceTag):
+                namespace, _, defname = tag.keyword.partition(':')
+                if namespace in self.tag_namespaces and defname in AUTOESCAPE_TAGS:
+                    return AUTOESCAPE_TAGS[defname]
+        return RUNTIME_AUTOESCAPE_FILTER
 
 
 # this is used read-only, so it can be in __init__ signature
@@ -62,14 +184,10 @@ EMPTY_DICT = {}
 
 class ExpressionPostProcessor(object):
     '''
-    Object that is called as the final filter on every template
-    expression ${...}.
-
-    Right now this object does autoescaping. However, it is placed
-    on *every* expression so we have a hook for future post-processing
-    of expressions.
-
-    See the creation of this object in DMPLexer above for more info.
+    Object that was called as the final filter on every template
+    expression ${...}.  DMPLexer now resolves the autoescape filter
+    at compile time, but this remains for templates that were compiled
+    by earlier versions of DMP (and are still in TEMPLATES_CACHE_DIR).
     '''
     def __init__(self, tself, extra=EMPTY_DICT):
         # check whether it's on for this block
@@ -92,7 +210,7 @@ class ExpressionPostProcessor(object):
         is toggled off.
         '''
         # we apply this across the board, even if the `n` filter is present because
-        # DMP always creates unicode (see adapter.py where render_unicode() is used)
+        # DMP always creates unicode (see context.py where the output is encoded, if ever, only at the end)
         text = force_text(text)
 
         # html encoding
@@ -9,16 +9,61 @@ from mako.template import Template
 from .util import get_template_debug
 from .lexer import DMPLexer
 from .adapter import MakoTemplateAdapter
+from .cache import TEMPLATE_CACHE
+from . import fragments
 
 import os
 import os.path
+import posixpath
+import re
 
 
 class DMPTemplateLookup(TemplateLookup):
-    '''Small extension to Mako's template lookup to provide a link back to the MakoTemplateLoader'''
+    '''
+    Extension to Mako's template lookup that provides a link back to the MakoTemplateLoader.
+
+    Rather than keeping its own collection of compiled templates, this lookup finds the
+    template file in its search directories and then gets the compiled template from the
+    process-wide TEMPLATE_CACHE.  This means a template reachable from several loaders
+    (such as a base.htm found through BASE_DIR) is only compiled and held once, though
+    each lookup gets a Template object of its own so relative paths resolve through it.
+    '''
     def __init__(self, template_loader, *args, **kwargs):
         super(DMPTemplateLookup, self).__init__(*args, **kwargs)
         self.template_loader = template_loader
+        # the search directories, as the cache keys this lookup's templates (see cache.py)
+        self.directory_key = tuple(self.directories)
+        # uri -> absolute filename
+        self.template_filenames = {}
+
+
+    def get_template(self, uri):
+        '''Returns the compiled template for the given uri (overrides Mako's method)'''
+        try:
+            filename = self.template_filenames[uri]
+        except KeyError:
+            filename = self.template_filenames[uri] = self.find_template_file(uri)
+        try:
+            return TEMPLATE_CACHE.get_template(filename, self, uri)
+        except TemplateLookupException:
+            # the file is gone, so search again next time
+            self.template_filenames.pop(uri, None)
+            raise
+
+
+    def find_template_file(self, uri):
+        '''
+        Searches the directories of this lookup for the given uri, in the same way that Mako does.
+        Returns the absolute filename, or raises TopLevelLookupException if not found.
+        '''
+        u = re.sub(r'^\/+', '', uri.replace('\\', '/'))
+        for dir_ in self.directories:
+            # make sure the path seperators are posix - os.altsep is empty on POSIX and cannot be used.
+            dir_ = dir_.replace(os.path.sep, posixpath.sep)
+            srcfile = posixpath.normpath(posixpath.join(dir_, u))
+            if os.path.isfile(srcfile):
+                return os.path.abspath(srcfile)
+        raise TopLevelLookupException("Can't locate template for uri {!r}".format(uri))
 
 
 class MakoTemplateLoader(object):
@@ -54,17 +99,22 @@ class MakoTemplateLoader(object):
         # (note the leading slash, which means BASE_DIR)
         self.template_search_dirs.append(settings.BASE_DIR)
 
+        # cached="True" blocks and defs are stored in a Django cache (see fragments.py), unless turned off
+        cache_options = {}
+        if dmp.options['FRAGMENT_CACHE'] is not None:
+            cache_options['cache_impl'] = fragments.PLUGIN_NAME
+
         # create the actual Mako TemplateLookup, which does the actual work
         self.tlookup = DMPTemplateLookup(
             template_loader=self,
             directories=self.template_search_dirs,
             imports=dmp.template_imports,
             module_directory=self.cache_root,
-            collection_size=2000,
-            filesystem_checks=settings.DEBUG,
+            filesystem_checks=settings.DEBUG and TEMPLATE_CACHE.watcher is None,   # the watcher invalidates changed files instead
             input_encoding=dmp.options['DEFAULT_TEMPLATE_ENCODING'],
             default_filters=[],  # shouldn't be None because that causes Mako to add an html filter and override DMP's html_filter
             lexer_cls=DMPLexer,
+            **cache_options
         )
 
 
@@ -0,0 +1,146 @@
+from django.apps import apps
+
+from mako import parsetree
+
+import os
+import re
+
+
+###########################################################
+###  Compile-time HTML minification
+###
+###  When enabled (the MINIFY_HTML option, or <%page minify="True"/>
+###  in a template), DMPLexer runs the text nodes of the template
+###  through HtmlMinifier before Mako generates code.  The
+###  generated module writes the smaller strings, so there is
+###  no cost at render time.
+###
+###  The minifier is deliberately conservative:
+###     - Whitespace runs that contain a line break (indentation)
+###       become a single line break.  Runs within a line, which
+###       may be in attribute values, are left alone.
+###     - HTML comments are removed, except conditional comments
+###       (<!--[if IE]>) and comments that contain ${expressions}.
+###     - The contents of <pre>, <textarea>, <script>, and <style>
+###       are left alone, as are <%text> tags.
+###
+
+# the elements whose contents are left alone
+RAW_ELEMENTS = ( 'pre', 'textarea', 'script', 'style' )
+
+# finds comments and the start/end tags of raw elements, plus a start tag that continues in a later node
+# (such as <pre class="${ cls }">, which Mako splits at the expression)
+RE_TOKENS = re.compile(r'(?P<comment><!--.*?-->)|<(?P<end>/?)(?P<tag>{0})\b[^>]*>|(?P<open><(?P<opentag>{0})\b[^>]*\Z)'.format('|'.join(RAW_ELEMENTS)), re.IGNORECASE | re.DOTALL)
+
+# whitespace that includes a line break
+RE_LINE_WHITESPACE = re.compile(r'[ \t\r\f\v]*\n\s*')
+
+# indentation at the start of a text node
+RE_LEADING_WHITESPACE = re.compile(r'^[ \t\r\f\v]+')
+
+# conditional comments (for old IE) are kept
+RE_CONDITIONAL_COMMENT = re.compile(r'<!--\[if|<!\[endif\]', re.IGNORECASE)
+
+
+def is_minified(filename, page_option=None):
+    '''
+    Returns whether the given template file should be minified.
+        page_option     The minify attribute of the template's <%page> tag (overrides the MINIFY_HTML option).
+    '''
+    if page_option is not None:
+        return page_option.strip().lower() in ( 'true', '1', 'yes' )
+    option = apps.get_app_config('django_mako_plus').options['MINIFY_HTML']
+    if isinstance(option, (list, tuple, set)):
+        if not filename:
+            return False
+        filename = os.path.abspath(filename)
+        for app_name in option:
+            if filename.startswith(os.path.join(apps.get_app_config(app_name).path, '')):
+                return True
+        return False
+    return bool(option)
+
+
+
+class HtmlMinifier(object):
+    '''
+    Minifies the text nodes of a Mako parse tree.  The nodes are visited in document order,
+    so a <pre> opened in one text node stays open through the expressions and
+    control lines that follow it, until the text node with its end tag.  This
+    includes a start tag split by an expression, like <pre class="${ cls }">.
+    '''
+    def __init__(self):
+        # the raw element we're within (such as 'pre'), or None
+        self.raw = None
+        # whether the output so far ends at the start of a line
+        self.line_start = True
+        # chars saved (for logging)
+        self.saved = 0
+
+
+    def minify_nodes(self, nodes):
+        '''Minifies the text nodes in the list of nodes (recursively)'''
+        for node in nodes:
+            if isinstance(node, parsetree.TextTag):
+                continue
+            if isinstance(node, parsetree.Text):
+                minified = self.minify_text(node.content)
+                self.saved += len(node.content) - len(minified)
+                node.content = minified
+                if minified:
+                    self.line_start = minified.endswith('\n')
+            elif isinstance(node, parsetree.ControlLine):
+                # control lines take their whole line, so the next text starts a line
+                self.line_start = True
+            elif isinstance(node, parsetree.Tag):
+                self.minify_nodes(node.nodes)
+            else:
+                self.line_start = False
+
+
+    def minify_text(self, text):
+        '''Minifies a single run of template text'''
+        parts = []
+        pending = []   # text outside raw elements, collapsed together so removed comments don't leave extra breaks
+        pos = 0
+        for match in RE_TOKENS.finditer(text):
+            if self.raw is not None:
+                # within a raw element, only its end tag matters
+                if match.group('tag') and match.group('end') and match.group('tag').lower() == self.raw:
+                    parts.append(text[pos:match.end()])
+                    pos = match.end()
+                    self.raw = None
+                    self.line_start = False
+                continue
+            pending.append(text[pos:match.start()])
+            pos = match.end()
+            if match.group('comment'):
+                if RE_CONDITIONAL_COMMENT.match(match.group('comment')):
+                    pending.append(match.group('comment'))
+            elif match.group('open'):
+                # the rest of the start tag (and the contents) are in the following nodes
+                pending.append(match.group(0))
+                parts.append(self.collapse(''.join(pending)))
+                pending = []
+                self.raw = match.group('opentag').lower()
+            else:
+                pending.append(match.group(0))
+                if not match.group('end'):
+                    parts.append(self.collapse(''.join(pending)))
+                    pending = []
+                    self.raw = match.group('tag').lower()
+        if self.raw is not None:
+            parts.append(text[pos:])
+        else:
+            pending.append(text[pos:])
+            parts.append(self.collapse(''.join(pending)))
+        return ''.join(parts)
+
+
+    def collapse(self, text):
+        '''Collapses the whitespace in text outside of raw elements'''
+        if self.line_start:
+            # indentation after a control line (or a previous node's line break)
+            text = RE_LEADING_WHITESPACE.sub('', text)
+            self.line_start = False
+        return RE_LINE_WHITESPACE.sub('\n', text)
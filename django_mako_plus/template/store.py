@@ -0,0 +1,155 @@
+from django.apps import apps
+
+from mako import codegen, compat
+from mako.template import Template, ModuleTemplate
+import mako
+
+from ..util import log
+from ..version import __version__
+from .minify import is_minified
+
+import hashlib
+import os
+import os.path
+import re
+
+
+
+###########################################################
+###  Content-addressed store of compiled templates
+###
+###  By default, Mako writes each compiled template to
+###  TEMPLATES_CACHE_DIR next to its source, and it recompiles
+###  when the source file is newer than the compiled module.
+###  That ties the compiled files to one checkout: a new
+###  container image or a fresh node recompiles everything.
+###
+###  With COMPILED_TEMPLATES_DIR, compiled modules are instead
+###  named by a hash of the template's uri and source, plus
+###  everything that changes the generated code (the versions
+###  of DMP and Mako, the lookup's compile arguments,
+###  minification, and render timing).  An existing module is
+###  used as is, with no mtime checks, so a directory built
+###  once (for example, by dmp_precompile during an image
+###  build) can be shared by every node that runs the same code.  Changing a template
+###  or an option simply produces a new name.
+###
+
+# the arguments of a lookup's template_args that change the generated code
+COMPILE_ARGUMENTS = (
+    'input_encoding',
+    'default_filters',
+    'buffer_filters',
+    'strict_undefined',
+    'imports',
+    'future_imports',
+    'enable_loop',
+    'preprocessor',
+    'lexer_cls',
+)
+
+# the arguments of a lookup's template_args that ModuleTemplate accepts
+MODULE_TEMPLATE_ARGUMENTS = (
+    'output_encoding',
+    'encoding_errors',
+    'format_exceptions',
+    'error_handler',
+    'include_error_handler',
+    'cache_args',
+    'cache_impl',
+    'cache_enabled',
+)
+
+
+class CompiledTemplateStore(object):
+    '''
+    A directory of compiled template modules, named by the content they were compiled from.
+    The directory can be shared by processes and nodes, and it can be read-only (templates
+    that aren't in it yet are then compiled in memory).
+    '''
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+
+    def get_template(self, filename, lookup, uri):
+        '''
+        Returns the Mako template for the given file, loading its compiled module from the
+        store, or compiling it into the store when not there yet.
+        '''
+        with open(filename, 'rb') as fin:
+            source = fin.read()
+        module_filename = self.get_module_filename(self.get_key(filename, lookup, uri, source))
+        if os.path.exists(module_filename):
+            try:
+                return self.load_template(module_filename, filename, lookup, uri)
+            except Exception as e:
+                # a partial or corrupt module is simply compiled again
+                log.warning('recompiling unreadable compiled template %s: %s', module_filename, e)
+                try:
+                    os.remove(module_filename)
+                except OSError:
+                    pass
+        try:
+            return Template(uri=uri, filename=filename, lookup=lookup, module_filename=module_filename, **lookup.template_args)
+        except OSError as e:
+            log.warning('compiling %s in memory because the compiled template store is not writable: %s', filename, e)
+            return Template(uri=uri, filename=filename, lookup=lookup, **dict(lookup.template_args, module_directory=None))
+
+
+    def load_template(self, module_filename, filename, lookup, uri):
+        '''Creates the Mako template from an existing compiled module'''
+        # the same module name Mako gives a template with this uri
+        module = compat.load_module(re.sub(r'\W', '_', uri), module_filename)
+        if module._magic_number != codegen.MAGIC_NUMBER:
+            raise ValueError('the module was generated by a different version of Mako')
+        return ModuleTemplate(
+            module,
+            module_filename=module_filename,
+            template_filename=filename,
+            lookup=lookup,
+            **{ name: lookup.template_args[name] for name in MODULE_TEMPLATE_ARGUMENTS if name in lookup.template_args }
+        )
+
+
+    def get_key(self, filename, lookup, uri, source):
+        '''Returns the content hash that names the compiled module of a template'''
+        digest = hashlib.sha256()
+        for part in get_fingerprint(filename, lookup, uri):
+            digest.update(part.encode('utf8'))
+            digest.update(b'\0')
+        digest.update(source)
+        return digest.hexdigest()
+
+
+    def get_module_filename(self, key):
+        '''Returns the path of the compiled module for the given key (split into subdirectories, like git objects)'''
+        return os.path.join(self.directory, key[:2], key[2:] + '.py')
+
+
+
+def get_fingerprint(filename, lookup, uri):
+    '''
+    Returns the strings, besides the template source, that determine its compiled code.
+    The template's location isn't included, so the same checkout in different directories
+    shares compiled modules.  The uri is included because Mako compiles it into the module.
+    '''
+    parts = [
+        'dmp=' + __version__,
+        'mako={}/{}'.format(mako.__version__, codegen.MAGIC_NUMBER),
+        'uri=' + uri,
+        'minify={}'.format(is_minified(filename)),
+        'timing={}'.format(bool(apps.get_app_config('django_mako_plus').options['RENDER_TIMING'])),
+        'flush={}'.format(bool(apps.get_app_config('django_mako_plus').options['STREAM_FLUSH_POINTS'])),
+    ]
+    for name in COMPILE_ARGUMENTS:
+        parts.append('{}={}'.format(name, describe(lookup.template_args.get(name))))
+    return parts
+
+
+def describe(value):
+    '''Returns a repeatable description of a compile argument (classes and functions by name rather than address)'''
+    if isinstance(value, (list, tuple)):
+        return '[{}]'.format(', '.join( describe(v) for v in value ))
+    if callable(value) and hasattr(value, '__qualname__'):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    return repr(value)
@@ -0,0 +1,182 @@
+from django.db import connections
+from django.utils import timezone, translation
+
+from mako import runtime
+
+from ..util import log
+from .context import create_context, kwargs_for_callable
+
+import queue
+import threading
+
+
+
+###########################################################
+###  Streaming renders
+###
+###  Mako renders a template with nested function calls
+###  that write to a buffer, so it can't yield partway
+###  through.  A streaming render runs Mako in a separate
+###  thread that writes to a StreamingBuffer.  The buffer
+###  encodes its text into chunks at flush points (the start
+###  of each <%block>, and whenever CHUNK_SIZE characters are
+###  waiting), and the response iterates the chunks as they
+###  arrive.  The queue between them is bounded, so a slow
+###  client pauses the render rather than buffering the page.
+###
+###  Streaming is opt-in: only renders called with stream=True
+###  (and template-only views when STREAM_TEMPLATE_VIEWS is on)
+###  use a render thread.  Thread-locals don't carry over to it:
+###
+###     - It has its own database connections (closed when it
+###       finishes), so queries in the template run outside the
+###       request's transaction, even with ATOMIC_REQUESTS.
+###     - It activates the request's language and time zone,
+###       but nothing else.  Other thread-locals, such as those
+###       set by middleware, aren't available to the template.
+###
+###  Flush points at block starts are compiled into templates
+###  only when STREAM_FLUSH_POINTS is on (see DMPLexer).
+###
+
+# a chunk is sent when this many characters are waiting (it is also sent at the start of each block)
+CHUNK_SIZE = 16384
+
+# the number of chunks that can wait between the render thread and the response
+QUEUE_SIZE = 8
+
+# kinds of items in the queue
+CHUNK = 'chunk'
+DONE = 'done'
+ERROR = 'error'
+
+
+def flush_point(context):
+    '''
+    Called by compiled templates at the start of each <%block> when STREAM_FLUSH_POINTS is on (see DMPLexer).
+    Sends the text written so far when this is a streaming render.
+    '''
+    flush = getattr(context._buffer_stack[0], 'flush_point', None)
+    if flush is not None:
+        flush()
+
+
+
+class StreamCancelled(Exception):
+    '''Raised in the render thread when the response is closed before the render finishes'''
+
+
+
+class StreamingBuffer(object):
+    '''The buffer Mako writes to during a streaming render'''
+    def __init__(self, render):
+        self.render = render
+        self.parts = []
+        self.size = 0
+        # total characters written (for render timing)
+        self.written = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        self.written += len(text)
+        if self.size >= CHUNK_SIZE:
+            self.flush_point()
+
+    def flush_point(self):
+        '''Encodes the waiting text and sends it to the response'''
+        if self.parts:
+            chunk = ''.join(self.parts).encode(self.render.charset)
+            self.parts = []
+            self.size = 0
+            self.render.put(CHUNK, chunk)
+
+
+
+class StreamingRender(object):
+    '''
+    An iterable of encoded chunks for a StreamingHttpResponse.
+
+    Call start() before returning the response.  It waits for the first chunk,
+    so exceptions raised before the first flush point (such as a RedirectException
+    at the top of a template) are raised in the calling thread and handled normally.
+    Exceptions after that are logged, and they end the response early.
+    '''
+    def __init__(self, render_obj, data, charset):
+        self.render_obj = render_obj
+        self.data = data
+        self.charset = charset
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self.first = None
+        self.sent = False
+        self.thread = None
+
+
+    def start(self):
+        '''Starts the render thread and waits for the first chunk'''
+        self.thread = threading.Thread(target=self.run, args=( translation.get_language(), timezone.get_current_timezone() ), name='dmp-stream', daemon=True)
+        self.thread.start()
+        kind, value = self.first = self.queue.get()
+        if kind == ERROR:
+            self.first = None
+            raise value
+
+
+    def run(self, language, tz):
+        '''The body of the render thread'''
+        try:
+            if language is not None:
+                translation.activate(language)
+            timezone.activate(tz)
+            # this is the same as Mako's render_unicode(), but with our buffer
+            buf = StreamingBuffer(self)
+            context = create_context(buf, self.render_obj, self.data)
+            runtime._render_context(self.render_obj, self.render_obj.callable_, context, **kwargs_for_callable(self.render_obj.callable_, self.data))
+            buf.flush_point()
+            self.put(DONE, None)
+        except StreamCancelled:
+            log.info('streaming response closed before the template finished rendering')
+        except Exception as e:
+            if self.sent:  # the response has started, so this can only be logged
+                log.exception('exception raised during streaming template rendering: %s', e)
+            try:
+                self.put(ERROR, e)
+            except StreamCancelled:
+                pass
+        finally:
+            translation.deactivate()
+            timezone.deactivate()
+            connections.close_all()
+
+
+    def put(self, kind, value):
+        '''Sends an item to the response, waiting while the queue is full (called in the render thread)'''
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(( kind, value ), timeout=0.1)
+                self.sent = self.sent or kind == CHUNK
+                return
+            except queue.Full:
+                pass
+        raise StreamCancelled()
+
+
+    def __iter__(self):
+        item, self.first = self.first, None
+        try:
+            while item is not None:
+                kind, value = item
+                if kind == DONE:
+                    return
+                if kind == ERROR:
+                    raise value
+                yield value
+                item = self.queue.get()
+        finally:
+            self.cancelled.set()
+
+
+    def close(self):
+        '''Called by Django when the response is closed (such as when the client disconnects)'''
+        self.cancelled.set()
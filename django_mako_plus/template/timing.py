@@ -0,0 +1,113 @@
+from django.conf import settings
+
+import itertools
+import os.path
+import threading
+import time
+
+
+
+###########################################################
+###  Render timings of templates, blocks, and defs
+###
+###  When the RENDER_TIMING option is on:
+###     - MakoTemplateAdapter times each render of a template.
+###     - DMPLexer compiles a timer around the body of each
+###       <%block> and <%def>: a call to block_start() at the
+###       top of the body and block_end() at the bottom.
+###
+###  The timings are aggregated in RENDER_TIMINGS (one per
+###  process) by name:
+###     homepage/templates/index.html           a template render
+###     homepage/templates/index.html#content   a block or def
+###  Paths are relative to BASE_DIR.  Read them with
+###  RENDER_TIMINGS.get_stats() and zero them with reset_stats().
+###
+###  The timers are only compiled into templates when the option
+###  is on, so templates compiled without it cost nothing.  The
+###  time of a block includes the blocks and defs it calls.
+###
+
+class RenderTimings(object):
+    '''
+    Aggregated render timings by name.  Like the template cache counters, the counts are not
+    locked, so they are approximate when many threads render at once.
+    '''
+    def __init__(self):
+        # set from the RENDER_TIMING option in the DMP app's ready()
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+
+    def record(self, name, elapsed, size):
+        '''Adds one render of the given name, which took elapsed seconds and wrote size characters'''
+        entry = self.stats.get(name)
+        if entry is None:
+            with self.lock:
+                entry = self.stats.setdefault(name, [ 0, 0.0, 0.0, 0 ])
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        entry[3] += size
+
+
+    def get_stats(self):
+        '''
+        Returns a dict of name -> dict of statistics:
+            count       Number of renders.
+            total       Total seconds.
+            max         Seconds of the slowest render.
+            size        Total characters of output.
+        '''
+        return { name: { 'count': count, 'total': total, 'max': max_, 'size': size } for name, ( count, total, max_, size ) in list(self.stats.items()) }
+
+
+    def reset_stats(self):
+        '''Clears the timings'''
+        self.stats = {}
+
+
+
+def timing_name(filename, section=None):
+    '''Returns the name a template file (and optionally one of its blocks or defs) is timed under'''
+    name = os.path.relpath(filename, settings.BASE_DIR).replace(os.path.sep, '/') if filename else 'string'
+    if section:
+        return '{}#{}'.format(name, section)
+    return name
+
+
+def block_start(context):
+    '''Called by compiled templates at the top of each <%block> and <%def> body (see DMPLexer)'''
+    buf = context._buffer_stack[-1]
+    return time.perf_counter(), buf, buffer_mark(buf)
+
+
+def block_end(context, name, started):
+    '''Called by compiled templates at the bottom of each <%block> and <%def> body (see DMPLexer)'''
+    start, buf, mark = started
+    elapsed = time.perf_counter() - start
+    RENDER_TIMINGS.record(name, elapsed, buffer_size_since(buf, mark))
+
+
+def buffer_mark(buf):
+    '''Returns the current position of a Mako buffer (or a streaming buffer)'''
+    data = getattr(buf, 'data', None)
+    if data is not None:
+        return len(data)
+    return getattr(buf, 'written', 0)
+
+
+def buffer_size_since(buf, mark):
+    '''Returns the characters written to the buffer since the mark'''
+    data = getattr(buf, 'data', None)
+    if data is not None:
+        # from the end, since islice() on a deque walks it from the start
+        return sum(map(len, itertools.islice(reversed(data), len(data) - mark)))
+    return getattr(buf, 'written', 0) - mark
+
+
+
+# the timings for this process
+RENDER_TIMINGS = RenderTimings()
@@ -4,10 +4,34 @@ from mako.exceptions import RichTraceback
 from mako.template import Template as MakoTemplate
 from mako.runtime import Context as MakoContext, _populate_self_namespace
 
+from .cache import TEMPLATE_CACHE
+
 import io
 import os, os.path
 
 
+# file extensions that DMP considers to be Mako templates when searching directories
+TEMPLATE_EXTENSIONS = ( '.htm', '.html', '.mako' )
+
+
+def find_template_files(path, extensions=TEMPLATE_EXTENSIONS):
+    '''
+    Generator that recursively yields the full path of every template file
+    within the given directory.  Directories that start with two underscores,
+    such as __dmpcache__ and __pycache__, are skipped.
+    '''
+    if not os.path.isdir(path):
+        return
+    for filename in sorted(os.listdir(path)):
+        if filename.startswith('__'):  # __dmpcache__, __pycache__
+            continue
+        filepath = os.path.join(path, filename)
+        if os.path.isdir(filepath):
+            yield from find_template_files(filepath, extensions)
+        elif os.path.splitext(filename)[1].lower() in extensions:
+            yield filepath
+
+
 def template_inheritance(obj):
     '''
     Generator that iterates the template and its ancestors.
@@ -19,6 +43,11 @@ def template_inheritance(obj):
         2. Mako `self` object (available within a rendering template)
     '''
     if isinstance(obj, MakoTemplate):
+        # use the chain recorded at compile time when we can (no runtime context needed)
+        chain = TEMPLATE_CACHE.get_inheritance(obj)
+        if chain is not None:
+            yield from chain
+            return
         obj = create_mako_context(obj)['self']
     elif isinstance(obj, MakoContext):
         obj = obj['self']
@@ -0,0 +1,239 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from ..util import log
+
+import ctypes
+import ctypes.util
+import os
+import os.path
+import select
+import struct
+import sys
+import threading
+
+
+
+###########################################################
+###  Watchers that invalidate the template cache
+###
+###  In DEBUG mode, Mako stats each template file on every
+###  lookup to see if it changed.  On networked filesystems
+###  this dominates request time.  When TEMPLATE_WATCHER is
+###  set, the loaders skip the per-lookup check, and one of
+###  these watchers removes changed templates from
+###  TEMPLATE_CACHE (in a background thread) instead.
+###
+
+def create_watcher(cache, mode, interval=1.0):
+    '''
+    Creates and starts a watcher for the given cache.
+        mode        'inotify', 'poll', or 'auto' (inotify when available, otherwise polling)
+        interval    Seconds between checks of the polling watcher.
+    '''
+    if mode not in ( 'auto', 'inotify', 'poll' ):
+        raise ImproperlyConfigured("TEMPLATE_WATCHER must be None, 'auto', 'inotify', or 'poll' (not {!r})".format(mode))
+    if mode in ( 'auto', 'inotify' ):
+        try:
+            watcher = InotifyWatcher(cache, interval)
+        except OSError as e:
+            if mode == 'inotify':
+                raise ImproperlyConfigured('TEMPLATE_WATCHER is inotify, but inotify is not available: {}'.format(e))
+            log.info('inotify is not available, so templates will be watched by polling: %s', e)
+        else:
+            watcher.start()
+            return watcher
+    watcher = PollingWatcher(cache, interval)
+    watcher.start()
+    return watcher
+
+
+
+class BaseWatcher(object):
+    '''Superclass of the watchers.  Subclasses implement watch() and run().'''
+    def __init__(self, cache, interval=1.0):
+        self.cache = cache
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def start(self):
+        '''Starts the background thread'''
+        self.thread = threading.Thread(target=self.run, name='dmp-{}'.format(self.__class__.__name__), daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        '''Stops the background thread'''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def watch(self, filename):
+        '''Called by the cache when a template file is loaded'''
+        raise NotImplementedError('Subclasses must implement this method')
+
+
+    def run(self):
+        '''The body of the background thread'''
+        raise NotImplementedError('Subclasses must implement this method')
+
+
+    def changed(self, filename):
+        '''Called from the thread when a file changes'''
+        log.debug('template file changed: %s', filename)
+        self.cache.invalidate(filename)
+
+
+
+class PollingWatcher(BaseWatcher):
+    '''
+    Checks the modified time of each loaded template every `interval` seconds.
+    This works everywhere (including networked filesystems that don't send
+    inotify events), and the stat() calls happen in the background rather
+    than during requests.
+    '''
+    def __init__(self, cache, interval=1.0):
+        super().__init__(cache, interval)
+        # filename -> mtime
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+
+    def watch(self, filename):
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            return
+        with self.lock:
+            self.mtimes[filename] = mtime
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+
+    def check(self):
+        '''Stats each watched file once and invalidates the ones that changed'''
+        with self.lock:
+            items = list(self.mtimes.items())
+        for filename, mtime in items:
+            try:
+                current = os.stat(filename).st_mtime
+            except OSError:
+                current = None
+            if current != mtime:
+                # the template is watched again when the cache reloads it
+                with self.lock:
+                    if self.mtimes.get(filename) == mtime:
+                        del self.mtimes[filename]
+                self.changed(filename)
+
+
+
+# constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct('iIII')   # wd, mask, cookie, len (followed by the name)
+
+
+class InotifyWatcher(BaseWatcher):
+    '''
+    Watches the directories of the loaded templates with Linux inotify.
+    Directories are watched (rather than files) so editors that save
+    by writing a new file and renaming it are seen.  If a directory
+    can't be watched (such as when the inotify watch limit is reached),
+    its templates are polled instead.
+    '''
+    def __init__(self, cache, interval=1.0):
+        super().__init__(cache, interval)
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('the C library does not have inotify')
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # watch descriptor -> directory
+        self.directories = {}
+        self.watched = set()
+        self.lock = threading.Lock()
+        self.fallback = None
+
+
+    def watch(self, filename):
+        dirname = os.path.dirname(filename)
+        if dirname in self.watched:
+            return
+        with self.lock:
+            if dirname in self.watched:
+                return
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname), IN_WATCH_MASK)
+            if wd >= 0:
+                self.directories[wd] = dirname
+                self.watched.add(dirname)
+                return
+            errno = ctypes.get_errno()
+            if self.fallback is None:
+                log.warning('cannot watch %s with inotify (%s), so its templates will be polled', dirname, os.strerror(errno))
+                self.fallback = PollingWatcher(self.cache, self.interval)
+                self.fallback.start()
+        self.fallback.watch(filename)
+
+
+    def stop(self):
+        super().stop()
+        if self.fallback is not None:
+            self.fallback.stop()
+        os.close(self.fd)
+
+
+    def run(self):
+        while not self.stopped.is_set():
+            # wake regularly to see if we've been stopped
+            readable, _, _ = select.select([ self.fd ], [], [], 0.5)
+            if readable:
+                self.read_events(os.read(self.fd, 65536))
+
+
+    def read_events(self, buf):
+        '''Parses a buffer of inotify events and invalidates the templates they name'''
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buf):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(buf, offset)
+            name = buf[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, so start over
+                log.debug('inotify queue overflowed, so clearing the template cache')
+                self.cache.invalidate()
+                continue
+            dirname = self.directories.get(wd)
+            if dirname is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                # the directory itself is gone: drop everything in it
+                with self.lock:
+                    self.directories.pop(wd, None)
+                    self.watched.discard(dirname)
+                for filename in list(self.cache.entries):
+                    if os.path.dirname(filename) == dirname:
+                        self.changed(filename)
+                continue
+            if name:
+                self.changed(os.path.join(dirname, os.fsdecode(name)))
@@ -7,3 +7,4 @@ log = logging.getLogger('django_mako_plus')
 from .base58 import b58enc, b58dec
 from .datastruct import merge_dicts, flatten, crc32
 from .reflect import qualified_name, import_qualified
+from .coroutines import iscoroutinefunction, markcoroutinefunction, is_async_callable
@@ -0,0 +1,31 @@
+import asyncio
+import functools
+import inspect
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:
+    # asgiref < 3.6 (or not installed)
+    iscoroutinefunction = asyncio.iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        '''Marks a callable object so iscoroutinefunction() reports it as async'''
+        if hasattr(inspect, 'markcoroutinefunction'):
+            return inspect.markcoroutinefunction(func)
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+def is_async_callable(func):
+    '''
+    Returns True if the given callable is a coroutine function, looking through
+    decorators (__wrapped__) and functools.partial objects to the real function.
+    '''
+    while func is not None:
+        if iscoroutinefunction(func):
+            return True
+        if isinstance(func, functools.partial):
+            func = func.func
+        else:
+            func = getattr(func, '__wrapped__', None)
+    return False
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+'''
+Compares the single-pass DMP resolver (dmp_resolver) with the regular list of app
+resolvers (one app_resolver per app, which is what DMP's urls.py used to create)
+in a generated project of 100 apps.
+
+    python3 tests_project/benchmark_resolver.py [number of apps] [resolves per url]
+'''
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+
+VIEW = '''
+from django.http import HttpResponse
+from django_mako_plus import view_function
+
+@view_function
+def process_request(request):
+    return HttpResponse('')
+'''
+
+
+def create_project(base_dir, num_apps):
+    '''Writes num_apps apps, each with an index view, and returns their names'''
+    app_names = [ 'app{}'.format(i) for i in range(num_apps) ]
+    for app_name in app_names:
+        os.makedirs(os.path.join(base_dir, app_name, 'views'))
+        os.makedirs(os.path.join(base_dir, app_name, 'templates'))
+        for filename, content in (
+            ( '__init__.py', '' ),
+            ( os.path.join('views', '__init__.py'), '' ),
+            ( os.path.join('views', 'index.py'), VIEW ),
+        ):
+            with open(os.path.join(base_dir, app_name, filename), 'w') as fout:
+                fout.write(content)
+    return app_names
+
+
+def main(num_apps=100, number=10000):
+    base_dir = tempfile.mkdtemp()
+    app_names = create_project(base_dir, num_apps)
+    sys.path.insert(0, base_dir)
+    # the django_mako_plus of this checkout
+    sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from django.conf import settings
+    settings.configure(
+        DEBUG=False,
+        BASE_DIR=base_dir,
+        INSTALLED_APPS=[ 'django_mako_plus' ] + app_names,
+        TEMPLATES=[{
+            'NAME': 'django_mako_plus',
+            'BACKEND': 'django_mako_plus.MakoTemplates',
+            'OPTIONS': { 'DEFAULT_APP': app_names[0] },
+        }],
+    )
+    import django
+    django.setup()
+    from django.urls import URLResolver, Resolver404
+    from django.urls.resolvers import RegexPattern
+    from django_mako_plus import app_resolver, dmp_resolver
+
+    regular = URLResolver(RegexPattern(r''), [ app_resolver(name) for name in app_names ] + [ app_resolver() ])
+    fast = dmp_resolver(app_names)
+
+    paths = [
+        '{}/index/1/2/3'.format(app_names[0]),
+        '{}/index.process_request/'.format(app_names[num_apps // 2]),
+        '{}/'.format(app_names[-1]),
+        'index/1/2',          # default app (after every app resolver)
+        '',
+        'no-such-page/1/2',   # 404
+    ]
+    print('{} apps, {} resolves per url (microseconds per resolve)'.format(num_apps, number))
+    print('    {:<40} {:>10} {:>10} {:>8}'.format('url', 'regular', 'dmp', 'speedup'))
+    for path in paths:
+        assert url_name(regular, path, Resolver404) == url_name(fast, path, Resolver404)
+        regular_time = min(timeit.repeat(lambda: url_name(regular, path, Resolver404), number=number, repeat=3)) / number * 1e6
+        fast_time = min(timeit.repeat(lambda: url_name(fast, path, Resolver404), number=number, repeat=3)) / number * 1e6
+        print('    {:<40} {:>10.1f} {:>10.1f} {:>7.1f}x'.format('/' + path, regular_time, fast_time, regular_time / fast_time))
+    shutil.rmtree(base_dir)
+
+
+def url_name(resolver, path, Resolver404):
+    '''Resolves the path, returning the url name (or None for a 404)'''
+    try:
+        return resolver.resolve(path).url_name
+    except Resolver404:
+        return None
+
+
+if __name__ == '__main__':
+    main(*( int(arg) for arg in sys.argv[1:3] ))
@@ -11,6 +11,7 @@ from django_mako_plus import get_template
 from io import StringIO
 import os, os.path, sys
 import shutil
+import tempfile
 
 class Tester(TestCase):
 
@@ -73,6 +74,78 @@ class Tester(TestCase):
         result = self.subcommand('dmp_makemessages', '--ignore-template-errors', '--verbose')
 
 
+    def test_precompile(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        cache_dir = os.path.join(settings.BASE_DIR, 'homepage', 'templates', dmp.options['TEMPLATES_CACHE_DIR'])
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        # the errorsapp has a template with a syntax error, which fails the command
+        with self.assertRaises(SystemExit):
+            self.subcommand('dmp_precompile', '--workers=2')
+        result = self.subcommand('dmp_precompile', '--workers=2', '--ignore-template-errors')
+        self.assertTrue('1 template failed to compile' in result)
+        self.assertTrue(os.path.join('homepage', 'templates', 'index.html') in result)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, 'index.html.py')))
+        # a single app in the current process
+        result = self.subcommand('dmp_precompile', 'homepage', '--workers=1')
+        self.assertTrue('ERROR' not in result)
+
+
+    def test_precompile_bundle(self):
+        from django_mako_plus.template import TEMPLATE_CACHE
+        from django_mako_plus.template.bundle import TemplateBundle
+        dmp = apps.get_app_config('django_mako_plus')
+        dirpath = tempfile.mkdtemp()
+        try:
+            bundle_path = os.path.join(dirpath, 'templates.bundle')
+            result = self.subcommand('dmp_precompile', 'homepage', '--workers=2', '--bundle={}'.format(bundle_path))
+            self.assertTrue('templates to {}'.format(bundle_path) in result)
+            TEMPLATE_CACHE.bundle = TemplateBundle(bundle_path)
+            self.assertTrue(len(TEMPLATE_CACHE.bundle) > 0)
+            # templates now load from the bundle (not compiled or read from __dmpcache__)
+            loader = dmp.engine.get_template_loader('homepage')
+            filename = loader.get_mako_template('index.html').filename
+            TEMPLATE_CACHE.invalidate(filename)
+            TEMPLATE_CACHE.reset_stats()
+            template = loader.get_mako_template('index.html')
+            self.assertTrue(template.module.__file__.startswith('templates.bundle:'))
+            self.assertEqual(template.uri, 'index.html')
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['compiles'], 0)
+            self.assertTrue('def render_body' in template.code)
+            # templates edited after the bundle was built skip it
+            stale = os.stat(filename).st_mtime - 60
+            os.utime(bundle_path, ( stale, stale ))
+            TEMPLATE_CACHE.bundle = TemplateBundle(bundle_path)
+            TEMPLATE_CACHE.invalidate(filename)
+            template = loader.get_mako_template('index.html')
+            self.assertFalse(template.module.__file__.startswith('templates.bundle:'))
+        finally:
+            TEMPLATE_CACHE.bundle = None
+            TEMPLATE_CACHE.invalidate()
+            shutil.rmtree(dirpath)
+
+
+    def test_routes(self):
+        from django_mako_plus.router.data import CACHED_ROUTES
+        from django_mako_plus.router.discover import CACHED_VIEW_FUNCTIONS
+        # the errorsapp has a template with a syntax error, which fails the command
+        with self.assertRaises(SystemExit):
+            self.subcommand('dmp_routes')
+        CACHED_ROUTES.clear()
+        CACHED_VIEW_FUNCTIONS.clear()
+        result = self.subcommand('dmp_routes', 'homepage')
+        self.assertTrue('/homepage/index.basic/' in result)
+        self.assertTrue('homepage.views.index.class_based' in result)
+        self.assertTrue('ERROR' not in result)
+        # templates without view modules are routes too, but not the templates of view modules
+        self.assertTrue('/homepage/filters/  ' in result)
+        self.assertTrue('/homepage/index.basic/  ' in result)
+        self.assertEqual(result.count('/homepage/index.basic/'), 1)
+        # the views are cached for requests
+        self.assertTrue(( 'homepage.views.index', 'basic' ) in CACHED_VIEW_FUNCTIONS)
+        self.assertEqual(CACHED_VIEW_FUNCTIONS[( 'homepage.views.filters', 'process_request' )].view_type, 'template')
+
+
     def test_startapp(self):
         appdir = os.path.join(settings.BASE_DIR, 'teststartapp1')
         if os.path.exists(appdir):
@@ -1,12 +1,30 @@
 from django.apps import apps
-from django.template import TemplateDoesNotExist
-from django.test import TestCase
+from django.template import RequestContext, TemplateDoesNotExist
+from django.core.cache import caches
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.utils import translation
+from django.test import TestCase, RequestFactory
+
+from django_mako_plus import RedirectException
 
 from django_mako_plus.template import MakoTemplateAdapter
 from django_mako_plus.template import MakoTemplateLoader
+from django_mako_plus.template import TEMPLATE_CACHE
+from django_mako_plus.template import template_inheritance
+from django_mako_plus.template import RENDER_TIMINGS
+from django_mako_plus.template.fragments import template_key
+from django_mako_plus.template.store import CompiledTemplateStore
+from django_mako_plus.template.timing import timing_name
+from django_mako_plus.template.watcher import create_watcher, InotifyWatcher, PollingWatcher
 
+import gc
+import itertools
 import os
 import os.path
+import shutil
+import sys
+import tempfile
+import time
 
 
 class Tester(TestCase):
@@ -27,6 +45,27 @@ class Tester(TestCase):
         self.assertIsInstance(template, MakoTemplateAdapter)
         self.assertRaises(TemplateDoesNotExist, dmp.engine.get_template, 'homepage/nonexistent_template.html')
 
+    def test_get_template_cached(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        template1 = dmp.engine.get_template('homepage/index.basic.html')
+        self.assertIs(dmp.engine.get_template('homepage/index.basic.html'), template1)
+        block = dmp.engine.get_template('homepage/index.basic.html#content')
+        self.assertIsNot(block, template1)
+        self.assertEqual(block.def_name, 'content')
+        # a reloaded template replaces the cached adapter
+        TEMPLATE_CACHE.invalidate(template1.mako_template.filename)
+        template2 = dmp.engine.get_template('homepage/index.basic.html')
+        self.assertIsNot(template2, template1)
+        self.assertIn(template2.mako_template, TEMPLATE_CACHE.entries[template2.mako_template.filename][0].values())
+        # hits on cached adapters are plain lookups, not template cache hits
+        hits = TEMPLATE_CACHE.get_stats()['hits']
+        self.assertIs(dmp.engine.get_template('homepage/index.basic.html'), template2)
+        self.assertEqual(TEMPLATE_CACHE.get_stats()['hits'], hits)
+        # adapters leave with their templates
+        TEMPLATE_CACHE.invalidate()
+        self.assertNotIn('homepage/index.basic.html', dmp.engine.template_adapters)
+        self.assertNotIn('homepage/index.basic.html#content', dmp.engine.template_adapters)
+
     def test_get_template_loader(self):
         dmp = apps.get_app_config('django_mako_plus')
         loader = dmp.engine.get_template_loader('homepage', create=False)
@@ -34,6 +73,31 @@ class Tester(TestCase):
         template = loader.get_template('index.basic.html')
         self.assertIsInstance(template, MakoTemplateAdapter)
 
+    def test_lazy_template_loaders(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        errorsapp = apps.get_app_config('errorsapp')
+        paths = [ os.path.join(errorsapp.path, subdir) for subdir in ( 'templates', 'scripts', 'styles' ) ]
+        try:
+            dmp.registered_apps.pop('errorsapp', None)
+            for path in paths:
+                dmp.engine.template_loaders.pop(path, None)
+            for key in list(dmp.engine.app_template_loaders):
+                if key[0] == 'errorsapp':
+                    del dmp.engine.app_template_loaders[key]
+            with self.assertRaises(ValueError):
+                dmp.engine.get_template_loader('errorsapp', 'styles')
+            # registering doesn't create the loaders
+            dmp.register_app('errorsapp')
+            self.assertFalse(any( path in dmp.engine.template_loaders for path in paths ))
+            # they are created on first use (create=False still works for registered apps)
+            loader = dmp.engine.get_template_loader('errorsapp', 'styles')
+            self.assertIsInstance(loader, MakoTemplateLoader)
+            self.assertIs(dmp.engine.template_loaders[paths[2]], loader)
+            self.assertNotIn(paths[1], dmp.engine.template_loaders)
+            self.assertIs(dmp.engine.get_template_loader('errorsapp', 'styles'), loader)
+        finally:
+            dmp.register_app('errorsapp')
+
     def test_get_template_loader_for_path(self):
         dmp = apps.get_app_config('django_mako_plus')
         path = os.path.join(self.tests_app.path, 'templates')
@@ -41,3 +105,379 @@ class Tester(TestCase):
         self.assertIsInstance(loader, MakoTemplateLoader)
         template = loader.get_template('index.basic.html')
         self.assertIsInstance(template, MakoTemplateAdapter)
+
+    def test_preload_templates(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        try:
+            self.assertEqual(dmp.preload_templates([ self.tests_app ]), 5)
+            # syntax errors are logged but don't stop the preload
+            self.assertEqual(dmp.preload_templates([ apps.get_app_config('errorsapp') ]), 0)
+        finally:
+            if hasattr(gc, 'unfreeze'):
+                gc.unfreeze()
+        self.assertIn(self.tests_app, dmp.get_project_apps())
+
+    def test_shared_template_cache(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        # base.htm is reachable from every loader through BASE_DIR, but it should only be compiled once per uri
+        TEMPLATE_CACHE.invalidate()
+        homepage = dmp.engine.get_template_loader('homepage')
+        errorsapp = dmp.engine.get_template_loader('errorsapp')
+        template1 = homepage.get_mako_template('base.htm')
+        template2 = dmp.engine.get_template_loader_for_path(os.path.join(self.tests_app.path, 'templates'), use_cache=False).get_mako_template('base.htm')
+        self.assertIs(template1, template2)
+        # lookups with other directories get their own template (so relative paths resolve through them),
+        # sharing the compiled module when the uri is the same
+        template3 = homepage.get_mako_template('/homepage/templates/base.htm')
+        template4 = errorsapp.get_mako_template('/homepage/templates/base.htm')
+        self.assertIsNot(template3, template4)
+        self.assertIs(template3.module, template4.module)
+        self.assertIs(template3.lookup, homepage.tlookup)
+        self.assertIs(template4.lookup, errorsapp.tlookup)
+        self.assertIsNot(template3.module, template1.module)
+        self.assertIn('</html>', template4.render_unicode())
+        self.assertIn(template1.filename, TEMPLATE_CACHE)
+        self.assertEqual(len(TEMPLATE_CACHE), 1)
+        # invalidating causes a reload
+        TEMPLATE_CACHE.invalidate(template1.filename)
+        self.assertNotIn(template1.filename, TEMPLATE_CACHE)
+        self.assertIsNot(homepage.get_mako_template('base.htm'), template1)
+
+
+    def test_template_cache_budget(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        loader = dmp.engine.get_template_loader('homepage')
+        try:
+            TEMPLATE_CACHE.invalidate()
+            TEMPLATE_CACHE.reset_stats()
+            TEMPLATE_CACHE.configure(max_size=2)
+            base = loader.get_mako_template('base.htm')
+            loader.get_mako_template('base.htm')
+            loader.get_mako_template('filters.html')
+            stats = TEMPLATE_CACHE.get_stats()
+            self.assertEqual(stats['hits'], 1)
+            self.assertEqual(stats['misses'], 2)
+            self.assertEqual(stats['size'], 2)
+            self.assertGreater(stats['bytes'], 0)
+            # base.htm is the least recently used, so it goes first
+            loader.get_mako_template('index.basic.html')
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['evictions'], 1)
+            self.assertNotIn(base.filename, TEMPLATE_CACHE)
+            self.assertEqual(len(TEMPLATE_CACHE), 2)
+            # byte budget: the newest template always stays
+            TEMPLATE_CACHE.configure(max_size=None, max_bytes=1)
+            self.assertEqual(len(TEMPLATE_CACHE), 1)
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['evictions'], 2)
+            TEMPLATE_CACHE.reset_stats()
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['hits'], 0)
+        finally:
+            TEMPLATE_CACHE.configure(dmp.options['TEMPLATE_CACHE_SIZE'], dmp.options['TEMPLATE_CACHE_MAX_BYTES'])
+
+    def test_template_watcher(self):
+        modes = [ 'poll' ]
+        if sys.platform.startswith('linux'):
+            modes.append('inotify')
+        for mode in modes:
+            with self.subTest(mode=mode):
+                dirpath = tempfile.mkdtemp()
+                watcher = TEMPLATE_CACHE.watcher = create_watcher(TEMPLATE_CACHE, mode, interval=0.05)
+                try:
+                    self.assertIsInstance(watcher, InotifyWatcher if mode == 'inotify' else PollingWatcher)
+                    filename = os.path.join(dirpath, 'watched.html')
+                    with open(filename, 'w') as fout:
+                        fout.write('one')
+                    loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+                    self.assertEqual(loader.get_template('watched.html').render(), 'one')
+                    self.assertIn(filename, TEMPLATE_CACHE)
+                    # a change (with a new mtime) removes the template from the cache
+                    with open(filename, 'w') as fout:
+                        fout.write('two')
+                    os.utime(filename, ( time.time() + 10, time.time() + 10 ))
+                    for i in range(100):
+                        if filename not in TEMPLATE_CACHE:
+                            break
+                        time.sleep(0.02)
+                    self.assertNotIn(filename, TEMPLATE_CACHE)
+                    self.assertEqual(loader.get_template('watched.html').render(), 'two')
+                finally:
+                    TEMPLATE_CACHE.watcher = None
+                    watcher.stop()
+                    shutil.rmtree(dirpath)
+
+    def test_template_dependencies(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            for name, content in (
+                ( 'base.htm', '<%block name="content"></%block>' ),
+                ( 'part.html', 'part' ),
+                ( 'child.html', '<%inherit file="base.htm"/>' ),
+                ( 'grandchild.html', '<%inherit file="/child.html"/><%block name="content"><%include file="part.html"/><%include file="${ name }"/></%block>' ),
+            ):
+                with open(os.path.join(dirpath, name), 'w') as fout:
+                    fout.write(content)
+            loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+            grandchild = loader.get_mako_template('grandchild.html')
+            self.assertEqual(grandchild.render(name='part.html'), 'partpart')
+            path = lambda name: os.path.join(dirpath, name)
+            self.assertEqual(TEMPLATE_CACHE.get_dependencies(path('grandchild.html')), (
+                ( 'inherit', path('child.html') ),
+                ( 'include', path('part.html') ),
+                ( 'include', None ),
+            ))
+            self.assertEqual(TEMPLATE_CACHE.get_dependents(path('base.htm')), { path('child.html'), path('grandchild.html') })
+            # the static chain matches the one from a runtime context
+            chain = [ t.filename for t in template_inheritance(grandchild) ]
+            self.assertEqual(chain, [ path('grandchild.html'), path('child.html'), path('base.htm') ])
+            self.assertEqual([ t.filename for t in TEMPLATE_CACHE.get_inheritance(grandchild) ], chain)
+            # a change to base.htm invalidates exactly its dependents
+            TEMPLATE_CACHE.invalidate(path('base.htm'))
+            self.assertNotIn(path('child.html'), TEMPLATE_CACHE)
+            self.assertNotIn(path('grandchild.html'), TEMPLATE_CACHE)
+            self.assertIn(path('part.html'), TEMPLATE_CACHE)
+        finally:
+            shutil.rmtree(dirpath)
+
+    def test_render_timing(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        dirpath = tempfile.mkdtemp()
+        try:
+            dmp.options['RENDER_TIMING'] = RENDER_TIMINGS.enabled = True
+            RENDER_TIMINGS.reset_stats()
+            with open(os.path.join(dirpath, 'timed.html'), 'w') as fout:
+                fout.write('<%block name="content">[${ greet("a") }]</%block>\n<%def name="greet(name)">hi ${ name }</%def>')
+            loader = dmp.engine.get_template_loader_for_path(dirpath, use_cache=False)
+            template = loader.get_template('timed.html')
+            for i in range(2):
+                self.assertEqual(template.render(), '[hi a]\n')
+            filename = os.path.join(dirpath, 'timed.html')
+            stats = RENDER_TIMINGS.get_stats()
+            self.assertEqual(set(stats), { timing_name(filename), timing_name(filename, 'content'), timing_name(filename, 'greet') })
+            self.assertEqual(stats[timing_name(filename)]['count'], 2)
+            self.assertEqual(stats[timing_name(filename)]['size'], 14)
+            self.assertEqual(stats[timing_name(filename, 'content')]['size'], 12)
+            self.assertEqual(stats[timing_name(filename, 'greet')]['size'], 8)
+            self.assertTrue(0 < stats[timing_name(filename, 'greet')]['max'] <= stats[timing_name(filename, 'greet')]['total'])
+            RENDER_TIMINGS.reset_stats()
+            self.assertEqual(RENDER_TIMINGS.get_stats(), {})
+        finally:
+            dmp.options['RENDER_TIMING'] = RENDER_TIMINGS.enabled = False
+            TEMPLATE_CACHE.invalidate(os.path.join(dirpath, 'timed.html'))
+            shutil.rmtree(dirpath)
+
+    def test_compiled_template_store(self):
+        storepath = tempfile.mkdtemp()
+        dirpaths = [ tempfile.mkdtemp(), tempfile.mkdtemp() ]
+        try:
+            TEMPLATE_CACHE.store = CompiledTemplateStore(storepath)
+            TEMPLATE_CACHE.reset_stats()
+            # the same checkout in two places (like two nodes) shares the compiled module
+            templates = []
+            for dirpath in dirpaths:
+                with open(os.path.join(dirpath, 'index.html'), 'w') as fout:
+                    fout.write('<%inherit file="base.htm"/>${ x }')
+                with open(os.path.join(dirpath, 'base.htm'), 'w') as fout:
+                    fout.write('[${ self.body() }]')
+                loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+                templates.append(loader.get_mako_template('index.html'))
+                self.assertEqual(templates[-1].render(x=1), '[1]')
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['compiles'], 2)
+            module_filename = templates[0].module.__file__
+            self.assertTrue(module_filename.startswith(storepath))
+            self.assertEqual(templates[1].module.__file__, module_filename)
+            self.assertEqual(templates[1].filename, os.path.join(dirpaths[1], 'index.html'))
+            self.assertEqual(TEMPLATE_CACHE.get_dependencies(templates[1].filename), (( 'inherit', os.path.join(dirpaths[1], 'base.htm') ),))
+            # a changed template gets a new module
+            with open(os.path.join(dirpaths[1], 'index.html'), 'w') as fout:
+                fout.write('<%inherit file="base.htm"/>${ x + 1 }')
+            TEMPLATE_CACHE.invalidate(templates[1].filename)
+            self.assertEqual(loader.get_mako_template('index.html').render(x=1), '[2]')
+            self.assertNotEqual(loader.get_mako_template('index.html').module.__file__, module_filename)
+            self.assertEqual(TEMPLATE_CACHE.get_stats()['compiles'], 3)
+        finally:
+            TEMPLATE_CACHE.store = None
+            for dirpath in dirpaths:
+                TEMPLATE_CACHE.invalidate(os.path.join(dirpath, 'index.html'))
+                TEMPLATE_CACHE.invalidate(os.path.join(dirpath, 'base.htm'))
+                shutil.rmtree(dirpath)
+            shutil.rmtree(storepath)
+
+    def test_streaming_render(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        dirpath = tempfile.mkdtemp()
+        try:
+            dmp.options['STREAM_FLUSH_POINTS'] = True
+            for name, content in (
+                ( 'page.html', 'top<%block name="one">${ a }</%block><%block name="two">two</%block>' ),
+                ( 'redirect.html', '<% raise RedirectException("/homepage/") %>' ),
+                ( 'error.html', 'top<%block name="one">${ 1 / 0 }</%block>' ),
+                ( 'noflush.html', 'top<%block name="one">${ a }</%block><%block name="two">two</%block>' ),
+            ):
+                with open(os.path.join(dirpath, name), 'w') as fout:
+                    fout.write(content)
+            loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+            # chunks are sent at the start of each block
+            template = loader.get_template('page.html')
+            response = template.render_to_response({ 'a': '\u00e9' }, stream=True)
+            self.assertIsInstance(response, StreamingHttpResponse)
+            chunks = list(response.streaming_content)
+            self.assertEqual(chunks, [ b'top', '\u00e9'.encode('utf8'), b'two' ])
+            self.assertEqual(b''.join(chunks).decode('utf8'), template.render({ 'a': '\u00e9' }))
+            self.assertEqual(list(template.render_to_response({ 'a': 1 }, def_name='two', stream=True).streaming_content), [ b'two' ])
+            # exceptions before the first chunk are raised normally
+            response = loader.get_template('redirect.html').render_to_response({ 'RedirectException': RedirectException }, stream=True)
+            self.assertIsInstance(response, HttpResponseRedirect)
+            # exceptions after the first chunk end the response
+            response = loader.get_template('error.html').render_to_response(stream=True)
+            iterator = iter(response.streaming_content)
+            self.assertEqual(next(iterator), b'top')
+            self.assertRaises(ZeroDivisionError, next, iterator)
+            # without flush points (the default), blocks don't send chunks
+            dmp.options['STREAM_FLUSH_POINTS'] = False
+            template = loader.get_template('noflush.html')
+            self.assertNotIn('flush_point', template.mako_template.code)
+            self.assertEqual(list(template.render_to_response({ 'a': 1 }, stream=True).streaming_content), [ b'top1two' ])
+        finally:
+            dmp.options['STREAM_FLUSH_POINTS'] = False
+            for name in ( 'page.html', 'redirect.html', 'error.html', 'noflush.html' ):
+                TEMPLATE_CACHE.invalidate(os.path.join(dirpath, name))
+            shutil.rmtree(dirpath)
+
+    def test_fragment_cache(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        dirpath = tempfile.mkdtemp()
+        try:
+            dmp.options['FRAGMENT_CACHE'] = 'default'
+            with open(os.path.join(dirpath, 'fragments.html'), 'w') as fout:
+                fout.write('<%block name="frag" cached="True" cache_vary="name, language">${ next(count) }</%block>|<%block name="plain">${ next(count) }</%block>')
+            caches['default'].clear()
+            loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+            template = loader.get_template('fragments.html')
+            count = itertools.count()
+            self.assertEqual(template.render({ 'count': count, 'name': 'a' }), '0|1')
+            self.assertEqual(template.render({ 'count': count, 'name': 'a' }), '0|2')
+            # varies on the context and the language
+            self.assertEqual(template.render({ 'count': count, 'name': 'b' }), '3|4')
+            with translation.override('de'):
+                self.assertEqual(template.render({ 'count': count, 'name': 'a' }), '5|6')
+            self.assertEqual(template.render({ 'count': count, 'name': 'a' }), '0|7')
+            # keys don't depend on where the template is or when it compiled, only on its source
+            impl = template.mako_template.cache.impl
+            self.assertEqual(impl.template_key, template_key(template.mako_template, None))
+            self.assertNotIn(dirpath, impl.template_key)
+            with open(os.path.join(dirpath, 'fragments.html')) as fin:
+                source = fin.read()
+            with open(os.path.join(dirpath, 'copy.html'), 'w') as fout:
+                fout.write(source)
+            copy = loader.get_template('copy.html').mako_template
+            self.assertEqual(template_key(copy, None).partition('#')[2], impl.template_key.partition('#')[2])
+        finally:
+            dmp.options['FRAGMENT_CACHE'] = None
+            for name in ( 'fragments.html', 'copy.html' ):
+                TEMPLATE_CACHE.invalidate(os.path.join(dirpath, name))
+            shutil.rmtree(dirpath)
+
+
+    def test_lazy_context_processors(self):
+        calls = []
+        def counted(request):
+            calls.append(request)
+            return { 'counted': len(calls) }
+        dmp = apps.get_app_config('django_mako_plus')
+        factory = RequestFactory()
+        unused = dmp.engine.from_string('${ 2 + 2 }')
+        used = dmp.engine.from_string('<%def name="show()">${ counted }</%def>${ counted }|${ show() }|${ len(context.keys()) > 0 }')
+        dmp.options['LAZY_CONTEXT_PROCESSORS'] = True
+        try:
+            # the first render learns the names of the processor
+            self.assertEqual(unused.render(RequestContext(factory.get('/'), {}, processors=[ counted ])), '4')
+            self.assertEqual(len(calls), 1)
+            # templates that don't read the names don't run the processor (listing the keys doesn't either,
+            # so the keys only include the names of processors that have run)
+            self.assertEqual(unused.render(RequestContext(factory.get('/'), {}, processors=[ counted ])), '4')
+            listed = dmp.engine.from_string("${ 'counted' in context.keys() }")
+            self.assertEqual(listed.render(RequestContext(factory.get('/'), {}, processors=[ counted ])), 'False')
+            self.assertEqual(len(calls), 1)
+            # reading the names runs it once per render
+            self.assertEqual(used.render(RequestContext(factory.get('/'), {}, processors=[ counted ])), '2|2|True')
+            self.assertEqual(len(calls), 2)
+            # the view's context takes precedence
+            self.assertEqual(used.render(RequestContext(factory.get('/'), { 'counted': 'view' }, processors=[ counted ])), 'view|view|True')
+            # names a processor only sometimes returns (like sql_queries) aren't listed until it runs, so every key can be read
+            def sometimes(request):
+                return { 'sometimes': 1 } if request.GET.get('debug') else {}
+            listed = dmp.engine.from_string("${ 'sometimes' in context.keys() }|${ len(list(map(context.__getitem__, context.keys()))) > 0 }")
+            # (the first render runs the processor to learn its names)
+            for debug, expected in ( ( True, 'True|True' ), ( False, 'False|True' ), ( True, 'False|True' ) ):
+                request = factory.get('/', { 'debug': 1 } if debug else {})
+                self.assertEqual(listed.render(RequestContext(request, {}, processors=[ sometimes ])), expected)
+        finally:
+            dmp.options['LAZY_CONTEXT_PROCESSORS'] = False
+
+
+    def test_context_processors_per_request(self):
+        calls = []
+        def counted(request):
+            calls.append(request)
+            return { 'counted': len(calls) }
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.from_string('${ counted }')
+        # by default, the processors run on every render, as in Django
+        request = RequestFactory().get('/')
+        self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '1')
+        self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '2')
+        fresh = dmp.engine.fresh_context_processors
+        dmp.options['LAZY_CONTEXT_PROCESSORS'] = True
+        try:
+            # lazy processors are reused by the renders within a request
+            del calls[:]
+            request = RequestFactory().get('/')
+            self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '1')
+            self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '1')
+            self.assertEqual(template.render(RequestContext(RequestFactory().get('/'), {}, processors=[ counted ])), '2')
+            # fresh processors run for each render
+            dmp.engine.fresh_context_processors = frozenset([ counted ])
+            self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '3')
+            self.assertEqual(template.render(RequestContext(request, {}, processors=[ counted ])), '4')
+        finally:
+            dmp.engine.fresh_context_processors = fresh
+            dmp.options['LAZY_CONTEXT_PROCESSORS'] = False
+
+
+    def test_render_to_response_bytes(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.get_template('homepage/index.basic.html')
+        response = template.render_to_response({ 'name': 'café' })
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertIn('<title>Testing_App</title>', response.content.decode('utf8'))
+        # the header is computed once, and other charsets are encoded as requested
+        self.assertEqual(template.default_content_type, ( 'utf-8', 'text/html; charset=utf-8' ))
+        response = template.render_to_response(charset='utf-16')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-16')
+        self.assertIn('<title>Testing_App</title>', response.content.decode('utf-16'))
+        # templates from strings have no file extension
+        response = dmp.engine.from_string('${ 2 + 2 }').render_to_response()
+        self.assertEqual(response.content, b'4')
+        self.assertTrue(response['Content-Type'].endswith('; charset=utf-8'))
+
+
+    def test_minify_html(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(dirpath, 'minified.html'), 'w') as fout:
+                fout.write('<%page minify="True"/>\n<div>\n    <!-- removed -->\n    <span title="a  b">${ x }</span>\n'
+                           '    <!--[if IE]>kept<![endif]-->\n    <pre>\n  ${ x }\n    </pre>\n    <script>\n    var a = 1;\n    </script>\n'
+                           '    % for i in range(2):\n        <i>${ i }</i>\n    % endfor\n</div>\n')
+            with open(os.path.join(dirpath, 'plain.html'), 'w') as fout:
+                fout.write('<div>\n    <!-- kept -->\n</div>\n')
+            loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+            self.assertEqual(loader.get_template('minified.html').render({ 'x': 'X' }),
+                '\n<div>\n<span title="a  b">X</span>\n<!--[if IE]>kept<![endif]-->\n<pre>\n  X\n    </pre>\n<script>\n    var a = 1;\n    </script>\n<i>0</i>\n<i>1</i>\n</div>\n')
+            # raw elements whose start tags have expressions are left alone too
+            with open(os.path.join(dirpath, 'split.html'), 'w') as fout:
+                fout.write('<%page minify="True"/>\n<div>\n  <pre class="${ x }">\n  line1\n    line2\n</pre>\n  <textarea name="${ x }"\n    rows="2">\n  a\n</textarea>\n  <b>\n    c</b>\n</div>\n')
+            self.assertEqual(loader.get_template('split.html').render({ 'x': 'X' }),
+                '\n<div>\n<pre class="X">\n  line1\n    line2\n</pre>\n<textarea name="X"\n    rows="2">\n  a\n</textarea>\n<b>\nc</b>\n</div>\n')
+            # off unless turned on
+            self.assertEqual(loader.get_template('plain.html').render(), '<div>\n    <!-- kept -->\n</div>\n')
+        finally:
+            shutil.rmtree(dirpath)
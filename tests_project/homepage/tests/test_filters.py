@@ -1,7 +1,12 @@
+from django.apps import apps
 from django.test import TestCase
 
 from django_mako_plus import render_template
 
+import os
+import os.path
+import shutil
+import tempfile
 
 
 
@@ -14,3 +19,24 @@ class Tester(TestCase):
         })
         self.assertTrue('::django::' in html)
         self.assertTrue('~~jinja2~~' in html)
+
+
+    def test_autoescape(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(dirpath, 'escaping.html'), 'w') as fout:
+                fout.write('<%namespace name="dmp" module="django_mako_plus.tags"/><%namespace name="other" file="other.html"/>'
+                           '${ x }|${ x | n }|<%dmp:autoescape_off>${ x }|${ other.show(x) }|<%dmp:autoescape_on>${ x }</%dmp:autoescape_on></%dmp:autoescape_off>|${ other.show(x) }')
+            with open(os.path.join(dirpath, 'other.html'), 'w') as fout:
+                fout.write('<%def name="show(v)">${ v }</%def>')
+            loader = apps.get_app_config('django_mako_plus').engine.get_template_loader_for_path(dirpath, use_cache=False)
+            template = loader.get_template('escaping.html')
+            # the toggles apply within their bodies, including defs in other templates called from there
+            self.assertEqual(template.render({ 'x': '<b>' }), '&lt;b&gt;|<b>|<b>|<b>|&lt;b&gt;|&lt;b&gt;')
+            # the escaping is resolved at compile time where possible
+            code = template.mako_template.code
+            self.assertNotIn('ExpressionPostProcessor', code)
+            self.assertIn('_dmp_plain( x )', code)
+            self.assertNotIn("context.get('getattr'", code)
+        finally:
+            shutil.rmtree(dirpath)
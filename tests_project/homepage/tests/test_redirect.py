@@ -1,4 +1,14 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
+
+from django_mako_plus.router import RequestViewWrapper, RoutingData
+from django_mako_plus.router import decorators
+
+from unittest import skipIf
+from unittest.mock import patch
+try:
+    import asgiref
+except ImportError:
+    asgiref = None
 
 
 
@@ -29,6 +39,21 @@ class Tester(TestCase):
         self.assertEqual(resp.content, b'new_location2')
 
 
+    @skipIf(asgiref is None, 'async views require asgiref')
+    def test_internal_redirect_exception_async(self):
+        # a sync view that redirects to an async view
+        resp = self.client.get('/homepage/redirects.internal_redirect_exception_async/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, b'new_location3')
+        # the sync wrapper runs the async view itself, even where Django awaits async views
+        with patch.object(decorators, 'ASYNC_VIEWS', True):
+            request = RequestFactory().get('/homepage/redirects.internal_redirect_exception_async/')
+            routing_data = RoutingData('homepage', 'redirects', 'internal_redirect_exception_async')
+            routing_data.request = request
+            resp = RequestViewWrapper(routing_data)(request)
+            self.assertEqual(resp.content, b'new_location3')
+
+
     def test_bad_internal_redirect_exception(self):
         resp = self.client.get('/homepage/redirects.bad_internal_redirect_exception/')
         self.assertEqual(resp.status_code, 404)
@@ -1,4 +1,31 @@
-from django.test import TestCase
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import ViewDoesNotExist
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+from django.utils import translation
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.views.generic import View
+
+from django_mako_plus import view_function
+
+from django_mako_plus.router import RequestViewWrapper, RoutingData
+from django_mako_plus.router.cache import ResponseCache
+from django_mako_plus.router.data import CACHED_ROUTES
+from django_mako_plus.router.discover import get_view_function, find_or_remember_view_function, get_class_response_cache, MissingViewCache, MISSING_VIEW_FUNCTIONS
+from django_mako_plus.router.decorators import AsyncRequestViewWrapper
+from django_mako_plus.template import TEMPLATE_CACHE
+from django_mako_plus.util import iscoroutinefunction
+
+from unittest import skipIf
+import os
+import sys
+import time
+try:
+    from asgiref.sync import async_to_sync
+except ImportError:
+    async_to_sync = None
 
 
 
@@ -15,6 +42,176 @@ class Tester(TestCase):
         self.assertEqual(req.dmp.urlparams[2], '3')
 
 
+    def test_view_function_streamed(self):
+        resp = self.client.get('/homepage/index.streamed/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        content = b''.join(resp.streaming_content).decode('utf8')
+        self.assertTrue(content.startswith('<!DOCTYPE html>'))
+        self.assertIn('<title>Testing_App</title>', content)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+
+    @skipIf(async_to_sync is None, 'async views require asgiref')
+    def test_async_views(self):
+        # through the client, Django 3.1+ awaits the views (earlier versions run them with async_to_sync)
+        resp = self.client.get('/homepage/index.async_basic/1/2/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('<title>Testing_App</title>', resp.content.decode('utf8'))
+        self.assertEqual(resp.wsgi_request.dmp.urlparams[1], '2')
+        resp = self.client.get('/homepage/index.class_based_async/')
+        self.assertEqual(resp.content, b'Async get was called.')
+        # the async wrapper is a coroutine function
+        for function in ( 'async_basic', 'class_based_async' ):
+            routing_data = RoutingData('homepage', 'index', function)
+            self.assertTrue(routing_data.callable.view_is_async)
+            wrapper = AsyncRequestViewWrapper(routing_data)
+            self.assertTrue(iscoroutinefunction(wrapper))
+            request = RequestFactory().get('/homepage/index.{}/'.format(function))
+            routing_data.request = request
+            self.assertEqual(async_to_sync(wrapper)(request).status_code, 200)
+        self.assertFalse(RoutingData('homepage', 'index', 'basic').callable.view_is_async)
+        self.assertNotIsInstance(RequestViewWrapper(RoutingData('homepage', 'index', 'basic')), AsyncRequestViewWrapper)
+
+
+    def test_response_cache(self):
+        from homepage.views import index
+        caches['default'].clear()
+        del index.CACHED_CALLS[:]
+        # the first request calls the view, and the second is served from the cache
+        resp = self.client.get('/homepage/index.cached/1/')
+        self.assertEqual(resp.content, b'Cached call 1 with 1')
+        self.assertIn('Accept-Language', resp['Vary'])
+        resp = self.client.get('/homepage/index.cached/1/')
+        self.assertEqual(resp.content, b'Cached call 1 with 1')
+        self.assertEqual(index.CACHED_CALLS, [ 1 ])
+        # the urlparams, query string, vary headers, and scheme are part of the key
+        self.assertEqual(self.client.get('/homepage/index.cached/2/').content, b'Cached call 2 with 2')
+        self.assertEqual(self.client.get('/homepage/index.cached/1/?a=b').content, b'Cached call 3 with 1')
+        self.assertEqual(self.client.get('/homepage/index.cached/1/', HTTP_ACCEPT_LANGUAGE='fr').content, b'Cached call 4 with 1')
+        self.assertEqual(self.client.get('/homepage/index.cached/1/', secure=True).content, b'Cached call 5 with 1')
+        # as is the active language
+        routing_data = RoutingData('homepage', 'index', 'cached', [ '1' ])
+        for language, expected in ( ( 'fr', b'Cached call 6 with 1' ), ( 'fr', b'Cached call 6 with 1' ), ( 'en-us', b'Cached call 1 with 1' ) ):
+            request = RequestFactory().get('/homepage/index.cached/1/')
+            routing_data.request = request
+            with translation.override(language):
+                self.assertEqual(RequestViewWrapper(routing_data)(request, 1).content, expected)
+        # other methods are not cached
+        self.assertEqual(self.client.post('/homepage/index.cached/1/').content, b'Cached call 7 with 1')
+        self.assertEqual(self.client.post('/homepage/index.cached/1/').content, b'Cached call 8 with 1')
+        # views without the option don't have a cache
+        self.assertFalse(hasattr(RoutingData('homepage', 'index', 'basic').callable, 'response_cache'))
+        with self.assertRaises(ImproperlyConfigured):
+            ResponseCache.from_option({ 'timout': 60 })
+
+
+    def test_response_cache_state(self):
+        from homepage.views import index
+        caches['default'].clear()
+        del index.CACHED_CALLS[:]
+        # responses that don't use the csrf token or session are cached
+        self.assertEqual(self.client.get('/homepage/index.cached_state/').content, b'Cached call 1')
+        self.assertEqual(self.client.get('/homepage/index.cached_state/').content, b'Cached call 1')
+        # responses that use the csrf token aren't
+        self.assertEqual(self.client.get('/homepage/index.cached_state/?use=csrf').content, b'Cached call 2')
+        self.assertEqual(self.client.get('/homepage/index.cached_state/?use=csrf').content, b'Cached call 3')
+        # nor are responses that use the session, but reading it beforehand (such as for request.user) is fine
+        routing_data = RoutingData('homepage', 'index', 'cached_state')
+        for use, expected in ( ( 'session', b'Cached call 4' ), ( 'session', b'Cached call 5' ), ( 'none', b'Cached call 6' ), ( 'none', b'Cached call 6' ) ):
+            request = RequestFactory().get('/homepage/index.cached_state/', { 'use': use })
+            request.session = SessionStore()
+            request.session.get('read by middleware')
+            routing_data.request = request
+            self.assertEqual(RequestViewWrapper(routing_data)(request).content, expected)
+            # the session middleware still sees the earlier read
+            self.assertTrue(request.session.accessed)
+        # the headers the view adds to Vary are part of the key
+        for theme, expected in ( ( 'dark', b'Cached call 7' ), ( 'dark', b'Cached call 7' ), ( 'light', b'Cached call 8' ), ( 'light', b'Cached call 8' ) ):
+            resp = self.client.get('/homepage/index.cached_state/?use=vary', HTTP_X_THEME=theme)
+            self.assertEqual(resp.content, expected)
+        self.assertIn('X-Theme', resp['Vary'])
+        # class-based views cache with the option on their get() method
+        self.assertEqual(self.client.get('/homepage/index.class_based_cached/').content, b'Cached call 9')
+        self.assertEqual(self.client.get('/homepage/index.class_based_cached/').content, b'Cached call 9')
+        # but the other methods can't have it
+        class posted(View):
+            @view_function(cache=60)
+            def post(self, request):
+                pass
+        with self.assertRaises(ImproperlyConfigured):
+            get_class_response_cache(posted)
+
+
+    def test_shared_routes(self):
+        # requests to the same view share the route, but not the urlparams
+        first = RoutingData('homepage', 'index', 'basic', '1/2')
+        second = RoutingData('homepage', 'index', 'basic', '3')
+        self.assertIs(first.route, second.route)
+        self.assertEqual(first.module, 'homepage.views.index')
+        self.assertEqual(first.urlparams, [ '1', '2' ])
+        self.assertEqual(second.urlparams, [ '3' ])
+        self.assertIsNot(first.route, RoutingData('homepage', 'index', 'class_based').route)
+        # wrappers copy the view's attributes from the route after the first one
+        wrapper = RequestViewWrapper(first)
+        self.assertEqual(wrapper.__name__, 'basic')
+        self.assertIs(wrapper.__wrapped__, first.callable)
+        self.assertIs(wrapper.routing_data, first)
+        self.assertNotIn('routing_data', first.route.wrapper_attributes)
+        wrapper = RequestViewWrapper(second)
+        self.assertEqual(wrapper.__name__, 'basic')
+        self.assertIs(wrapper.routing_data, second)
+        # changing one request's routing data (as an internal redirect does) doesn't change the route
+        from homepage.views import index
+        second.function = 'class_based'
+        second.callable = index.class_based
+        self.assertEqual(RequestViewWrapper(second).__name__, 'class_based')
+        self.assertEqual(RoutingData('homepage', 'index', 'basic').function, 'basic')
+        # routes aren't shared in DEBUG mode because views are found again when their files change
+        CACHED_ROUTES.clear()
+        with override_settings(DEBUG=True):
+            self.assertIsNot(RoutingData('homepage', 'index', 'basic').route, RoutingData('homepage', 'index', 'basic').route)
+
+
+    @override_settings(DEBUG=True)
+    def test_debug_view_cache(self):
+        # in DEBUG mode, view functions are cached until their file changes
+        filename = os.path.join(apps.get_app_config('homepage').path, 'views', 'debug_cache.py')
+        template_filename = os.path.join(apps.get_app_config('homepage').path, 'templates', 'debug_cache.html')
+        def write_view(content, offset):
+            with open(filename, 'w') as fout:
+                fout.write('from django.http import HttpResponse\nfrom django_mako_plus import view_function\n\n@view_function\ndef process_request(request):\n    return HttpResponse({!r})\n'.format(content))
+            os.utime(filename, ( time.time() + offset, time.time() + offset ))
+        try:
+            write_view('first', 10)
+            func = get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html')
+            self.assertIs(get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html'), func)
+            self.assertEqual(func(RequestFactory().get('/')).content, b'first')
+            # an edited view module is loaded again
+            write_view('second', 20)
+            func = get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html')
+            self.assertEqual(func(RequestFactory().get('/')).content, b'second')
+            self.assertIs(get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html'), func)
+            # a removed view module is forgotten
+            os.remove(filename)
+            with self.assertRaises(ViewDoesNotExist):
+                get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html')
+            # template views aren't cached, so a new template is found and a removed one is a 404
+            with open(template_filename, 'w') as fout:
+                fout.write('template')
+            self.assertEqual(get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html').view_type, 'template')
+            os.remove(template_filename)
+            # (the loaders were created outside DEBUG mode, so they don't check the file themselves)
+            TEMPLATE_CACHE.invalidate(template_filename)
+            with self.assertRaises(ViewDoesNotExist):
+                get_view_function('homepage.views.debug_cache', 'process_request', 'homepage', 'debug_cache.html')
+        finally:
+            for path in ( filename, template_filename ):
+                if os.path.exists(path):
+                    os.remove(path)
+            sys.modules.pop('homepage.views.debug_cache', None)
+
+
     def test_view_function_post(self):
         # POST method
         resp = self.client.post('/homepage/index.basic/1/2/3/')
@@ -30,6 +227,49 @@ class Tester(TestCase):
         self.assertEqual(resp.status_code, 404)
 
 
+    def test_missing_view_cache(self):
+        # the second request for a missing page doesn't search for it again
+        MISSING_VIEW_FUNCTIONS.invalidate()
+        MISSING_VIEW_FUNCTIONS.reset_stats()
+        self.assertEqual(self.client.get('/homepage/no_such_page/').status_code, 404)
+        # (the default app's pattern also tried homepage.views.homepage)
+        self.assertIn(( 'homepage.views.no_such_page', 'process_request', 'no_such_page.html' ), MISSING_VIEW_FUNCTIONS.entries)
+        stats = MISSING_VIEW_FUNCTIONS.get_stats()
+        self.assertEqual(self.client.get('/homepage/no_such_page/').status_code, 404)
+        self.assertGreater(MISSING_VIEW_FUNCTIONS.get_stats()['hits'], stats['hits'])
+        self.assertEqual(MISSING_VIEW_FUNCTIONS.get_stats()['size'], stats['size'])
+        with self.assertRaises(ViewDoesNotExist):
+            get_view_function('homepage.views.no_such_page', 'process_request', 'homepage', 'no_such_page.html')
+        MISSING_VIEW_FUNCTIONS.invalidate('homepage.views.no_such_page')
+        self.assertNotIn(( 'homepage.views.no_such_page', 'process_request', 'no_such_page.html' ), MISSING_VIEW_FUNCTIONS.entries)
+        # views that exist but can't be loaded are errors in the code, so they aren't remembered
+        with self.assertRaises(ViewDoesNotExist):
+            find_or_remember_view_function('homepage.views.index', 'CACHED_CALLS')
+        self.assertNotIn(( 'homepage.views.index', 'CACHED_CALLS', None ), MISSING_VIEW_FUNCTIONS.entries)
+        with self.assertRaises(ViewDoesNotExist):
+            find_or_remember_view_function('homepage.views.converter', 'convert_geo_location')
+        self.assertNotIn(( 'homepage.views.converter', 'convert_geo_location', None ), MISSING_VIEW_FUNCTIONS.entries)
+        # in DEBUG mode, missing templates aren't remembered (so a new template is found right away)
+        with override_settings(DEBUG=True):
+            with self.assertRaises(ViewDoesNotExist):
+                find_or_remember_view_function('homepage.views.no_such_page', 'process_request', 'homepage', 'no_such_page.html')
+        self.assertNotIn(( 'homepage.views.no_such_page', 'process_request', 'no_such_page.html' ), MISSING_VIEW_FUNCTIONS.entries)
+        # the least recently used entries are dropped, and entries expire or change with the stamp
+        cache = MissingViewCache(max_size=2, timeout=60)
+        for key in ( 'a', 'b', 'c' ):
+            cache.set(key, None, 'missing ' + key)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'missing b')
+        self.assertIsNone(cache.get('c', ( 123, None )))
+        cache = MissingViewCache(max_size=2, timeout=0.01)
+        cache.set('a', None, 'missing a')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        cache = MissingViewCache(max_size=0, timeout=60)
+        cache.set('a', None, 'missing a')
+        self.assertIsNone(cache.get('a'))
+
+
     def test_bad_response(self):
         resp = self.client.get('/homepage/index.bad_response/1/2/3/')
         self.assertEqual(resp.status_code, 500)
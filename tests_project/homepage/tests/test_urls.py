@@ -1,4 +1,9 @@
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import URLResolver, Resolver404
+from django.urls.resolvers import RegexPattern
+
+from django_mako_plus import app_resolver, dmp_resolver
 
 
 
@@ -95,3 +100,33 @@ class Tester(TestCase):
         resp = self.client.get('/')
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.wsgi_request.resolver_match.url_name, PATTERN_NAME)
+
+    def test_dmp_resolver(self):
+        # the single-pass resolver matches the same as the regular list of app resolvers
+        app_names = [ 'homepage', 'errorsapp' ]
+        fast = dmp_resolver(app_names)
+        regular = URLResolver(RegexPattern(r''), [ app_resolver(name) for name in app_names ] + [ app_resolver() ])
+        for path in (
+            '', 'homepage', 'homepage/', 'homepage/index', 'homepage/index/', 'homepage/index/1/2/3/',
+            'homepage/index.process_request', 'homepage/index.process_request/1/2/3', 'homepage/index.basic',
+            'index', 'index/1/2', 'index.process_request/', 'homepage//index', 'homepage/index.nope/',
+            'homepage/nope', 'nope', 'nope/1', 'bad!page', 'homepage/bad!page', 'errorsapp/index/',
+        ):
+            try:
+                expected = regular.resolve(path)
+            except Resolver404:
+                with self.assertRaises(Resolver404, msg=path):
+                    fast.resolve(path)
+                continue
+            match = fast.resolve(path)
+            for name in ( 'url_name', 'app_names', 'namespaces', 'route', 'args', 'kwargs' ):
+                self.assertEqual(getattr(match, name), getattr(expected, name), msg='{} {}'.format(path, name))
+            self.assertEqual(repr(match.func.routing_data), repr(expected.func.routing_data), msg=path)
+        # 404s only list the tried patterns in DEBUG mode, since finding them is slow
+        with self.assertRaises(Resolver404) as cm:
+            fast.resolve('bad!page')
+        self.assertNotIn('tried', cm.exception.args[0])
+        with override_settings(DEBUG=True):
+            with self.assertRaises(Resolver404) as cm:
+                fast.resolve('bad!page')
+            self.assertIn('tried', cm.exception.args[0])
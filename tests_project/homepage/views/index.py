@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
 from django.views.generic import View
 
 from django_mako_plus import view_function
@@ -23,6 +25,39 @@ def basic(request):
     return request.dmp.render('index.basic.html', {})
 
 
+@view_function
+def streamed(request):
+    return request.dmp.render('index.basic.html', {}, stream=True)
+
+
+@view_function
+async def async_basic(request):
+    return await request.dmp.arender('index.basic.html', {})
+
+
+CACHED_CALLS = []
+
+@view_function(cache={ 'timeout': 60, 'vary': ( 'Accept-Language', ) })
+def cached(request, value:int=0):
+    CACHED_CALLS.append(value)
+    return HttpResponse('Cached call {} with {}'.format(len(CACHED_CALLS), value))
+
+
+@view_function(cache=60)
+def cached_state(request):
+    # responses that use the csrf token or session can't be cached
+    CACHED_CALLS.append(request.GET.get('use'))
+    if request.GET.get('use') == 'csrf':
+        get_token(request)
+    elif request.GET.get('use') == 'session':
+        request.session.get('anything')
+    response = HttpResponse('Cached call {}'.format(len(CACHED_CALLS)))
+    # the headers in the response's Vary are part of the key
+    if request.GET.get('use') == 'vary':
+        patch_vary_headers(response, ( 'X-Theme', ))
+    return response
+
+
 @view_function(a=1, b=2)
 def decorated(request):
     return HttpResponse('This one is decorated')
@@ -40,6 +75,12 @@ class class_based(View):
         return HttpResponse('Post was called.')
 
 
+class class_based_async(View):
+    @view_function
+    async def get(self, request):
+        return HttpResponse('Async get was called.')
+
+
 class class_based_decorated(View):
     # decorated
     @view_function
@@ -54,6 +95,14 @@ class class_based_argdecorated(View):
         return HttpResponse('Get was called.')
 
 
+class class_based_cached(View):
+    # the response cache is on the get method
+    @view_function(cache=60)
+    def get(self, request):
+        CACHED_CALLS.append('class')
+        return HttpResponse('Cached call {}'.format(len(CACHED_CALLS)))
+
+
 ###  Doesn't return a response  ###
 
 @view_function
@@ -49,3 +49,11 @@ def bad_internal_redirect_exception2(request):
 # should not be decorated with @view_function because a target of internal redirect
 def internal_redirect_exception2(request):
     return HttpResponse('new_location2')
+
+@view_function
+def internal_redirect_exception_async(request):
+    raise InternalRedirectException('homepage.views.redirects', 'internal_redirect_exception3')
+
+# an async target of internal redirect
+async def internal_redirect_exception3(request):
+    return HttpResponse('new_location3')